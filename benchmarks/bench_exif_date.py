@@ -0,0 +1,99 @@
+"""
+bench_exif_date.py
+
+Vergleicht den Durchsatz (Dateien/s) der Datums-Extraktion:
+- legacy: Image.open + _getexif() + Durchlauf aller Tags (bisheriger Weg)
+- header: media_common.exif_date.get_capture_datetime (nur Header, Pillow als Fallback)
+
+Beispiel-Usage:
+    python benchmarks/bench_exif_date.py --source \\\\NAS\\Fotos --limit 5000
+    python benchmarks/bench_exif_date.py --synthetic 2000   # erzeugt Test-JPEGs in einem Temp-Ordner
+"""
+
+import os
+import sys
+import time
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from media_common.exif_date import EXIF_SUFFIXES, get_capture_datetime
+
+
+def legacy_date(path: Path):
+    from PIL import Image, ExifTags
+    with Image.open(path) as img:
+        exif = img._getexif() if hasattr(img, '_getexif') else None
+        if exif:
+            for tag, value in exif.items():
+                if ExifTags.TAGS.get(tag, tag) == 'DateTimeOriginal':
+                    return datetime.strptime(value, "%Y:%m:%d %H:%M:%S")
+    return None
+
+
+def header_date(path: Path):
+    return get_capture_datetime(path)
+
+
+def make_synthetic(folder: Path, count: int):
+    from PIL import Image
+    for i in range(count):
+        img = Image.new('RGB', (640, 480), (i % 256, 80, 160))
+        exif = Image.Exif()
+        exif.get_ifd(0x8769)[0x9003] = f"2023:{i % 12 + 1:02d}:{i % 28 + 1:02d} 12:00:00"
+        img.save(folder / f"IMG_{i:06d}.jpg", exif=exif, quality=85)
+
+
+def run(name, func, files):
+    found = 0
+    errors = 0
+    start = time.perf_counter()
+    for p in files:
+        try:
+            if func(p):
+                found += 1
+        except Exception:
+            errors += 1
+    elapsed = time.perf_counter() - start
+    rate = len(files) / elapsed if elapsed else float('inf')
+    print(f"{name:>8}: {len(files)} Dateien in {elapsed:.2f}s -> {rate:,.0f} Dateien/s "
+          f"(Datum gefunden: {found}, Fehler: {errors})")
+    return rate
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark EXIF-Datums-Extraktion')
+    parser.add_argument('--source', type=str, default=os.getenv("PHOTO_SOURCE"))
+    parser.add_argument('--synthetic', type=int, default=0, help='Anzahl synthetischer JPEGs statt --source')
+    parser.add_argument('--limit', type=int, default=0, help='Maximal so viele Dateien messen')
+    args = parser.parse_args()
+
+    tmp = None
+    if args.synthetic:
+        tmp = tempfile.TemporaryDirectory()
+        source = Path(tmp.name)
+        make_synthetic(source, args.synthetic)
+    elif args.source:
+        source = Path(args.source)
+    else:
+        parser.error('--source oder --synthetic angeben')
+
+    files = [p for p in source.rglob('*') if p.is_file() and p.suffix.lower() in EXIF_SUFFIXES]
+    if args.limit:
+        files = files[:args.limit]
+    if not files:
+        print(f"Keine Bilder gefunden in {source}")
+        sys.exit(1)
+
+    # Header-Bereich vorab in den Page-Cache laden, damit beide Pfade gleiche Bedingungen haben
+    for p in files:
+        with open(p, 'rb') as f:
+            f.read(64 * 1024)
+    legacy = run('legacy', legacy_date, files)
+    header = run('header', header_date, files)
+    print(f"Speedup: {header / legacy:.1f}x")
+
+    if tmp:
+        tmp.cleanup()
@@ -0,0 +1,80 @@
+"""
+bench_face_clusters.py
+
+Laufzeit und Qualität des Gesichts-Clusterings (face_clusters.py) auf synthetischen Encodings:
+Identitäten als zufällige Zentren im 128-dim. Raum (Abstand ~1.0), Gesichter mit Rauschen
+(Abstand innerhalb einer Person ~0.35), ähnlich den Distanzen von face_recognition.
+Gemessen werden k-NN-Graph und Clustering getrennt; die Qualität als paarweise Precision/Recall
+gegen die wahren Identitäten. Bis EXACT_COMPARE_MAX Gesichter wird der approximative Graph
+zusätzlich gegen den exakten verglichen.
+
+Beispiel-Usage:
+    python benchmarks/bench_face_clusters.py --identities 5000 --faces-per-identity 20
+    python benchmarks/bench_face_clusters.py --index insights_index.idx
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'phase2_photo_intelligence'))
+from face_clusters import CLUSTER_METHODS, DEFAULT_K, DEFAULT_THRESHOLD, cluster_labels, knn_graph
+
+EXACT_COMPARE_MAX = 100000
+
+
+def synthetic_faces(identities: int, per_identity: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 0.0625, (identities, 128)).astype('float32')
+    truth = rng.integers(0, identities, identities * per_identity)
+    faces = centers[truth] + rng.normal(0, 0.022, (len(truth), 128)).astype('float32')
+    return faces, truth
+
+
+def pair_scores(truth: np.ndarray, labels: np.ndarray):
+    """Paarweise Precision/Recall: Anteil gleich gelabelter Paare, die dieselbe Person sind, und umgekehrt."""
+    def pairs(values):
+        counts = np.bincount(np.unique(values, return_inverse=True)[1]).astype('int64')
+        return int((counts * (counts - 1) // 2).sum())
+    both = pairs(truth * (int(labels.max()) + 1) + labels)
+    return both / max(pairs(labels), 1), both / max(pairs(truth), 1)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Laufzeit und Qualität des Gesichts-Clusterings')
+    parser.add_argument('--identities', type=int, default=5000)
+    parser.add_argument('--faces-per-identity', type=int, default=20)
+    parser.add_argument('--index', type=str, help='Encodings aus einem Insights-Index statt synthetisch')
+    parser.add_argument('--k', type=int, default=DEFAULT_K)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    truth = None
+    if args.index:
+        from face_search import stack_encodings
+        from photo_insights import load_index
+        faces = np.asarray(stack_encodings(load_index(args.index))[0], dtype='float32')
+    else:
+        faces, truth = synthetic_faces(args.identities, args.faces_per_identity)
+    print(f"{len(faces)} Gesichter, k={args.k}, threshold={args.threshold}")
+
+    start = time.perf_counter()
+    a, b, distances = knn_graph(faces, k=args.k, threshold=args.threshold)
+    print(f"k-NN-Graph:  {len(a):>10} Kanten  {time.perf_counter() - start:8.2f}s")
+    if len(faces) <= EXACT_COMPARE_MAX:
+        start = time.perf_counter()
+        ea, eb, _ = knn_graph(faces, k=args.k, threshold=args.threshold, exact=True)
+        exact_time = time.perf_counter() - start
+        recall = len(np.intersect1d(a * len(faces) + b, ea * len(faces) + eb)) / max(len(ea), 1)
+        print(f"exakt:       {len(ea):>10} Kanten  {exact_time:8.2f}s  (Kanten-Recall {recall:.3f})")
+
+    for method in CLUSTER_METHODS:
+        start = time.perf_counter()
+        labels = cluster_labels(len(faces), a, b, distances, args.threshold, method)
+        line = f"{method:<12} {len(np.unique(labels)):>10} Cluster {time.perf_counter() - start:8.2f}s"
+        if truth is not None:
+            line += "  (Precision {:.3f}, Recall {:.3f})".format(*pair_scores(truth, labels))
+        print(line)
@@ -0,0 +1,90 @@
+"""
+bench_index_load.py
+
+Vergleicht die Ladezeit des Insights-Index:
+- json:   bisheriges insights_index.json (json.load + np.array je Encoding)
+- binary: .idx-Ordner (BinaryIndex, memory-mapped) + Zugriff auf alle Encodings
+
+Beispiel-Usage:
+    python benchmarks/bench_index_load.py --index insights_index.json
+    python benchmarks/bench_index_load.py --synthetic 50000 --faces 2
+"""
+
+import sys
+import time
+import random
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'phase2_photo_intelligence'))
+from index_format import BinaryIndex, convert_json_to_binary, load_json_index
+
+
+def make_synthetic(path: Path, count: int, faces: int):
+    import json
+    rnd = random.Random(42)
+    index = {}
+    for i in range(count):
+        p = f"/fotos/2024-{i % 12 + 1:02d}-01/IMG_{i:07d}.jpg"
+        n = rnd.randint(0, 2 * faces)
+        item = {'path': p, 'size': 1000 + i, 'mtime_ns': i, 'date': '2024-01-01',
+                'emotions': {'happy': rnd.random(), 'neutral': rnd.random()}, 'embedding_len': 512}
+        if n:
+            item['faces'] = {'locations': [[10, 20, 30, 40]] * n,
+                             'encodings': [[rnd.uniform(-0.3, 0.3) for _ in range(128)] for _ in range(n)]}
+        index[p] = item
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:8.3f}s")
+    return result, elapsed
+
+
+def load_json_all(path):
+    index = load_json_index(path)
+    encodings = [np.array(e) for item in index.values() for e in item.get('faces', {}).get('encodings', [])]
+    return len(index), len(encodings)
+
+
+def load_binary_all(folder):
+    index = BinaryIndex(folder)
+    # einmal komplett lesen, damit das Memory-Mapping nicht nur lazy geöffnet wird
+    encodings = np.array(index.encodings)
+    return len(index), len(encodings)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark Index-Ladezeit JSON vs. Binärformat')
+    parser.add_argument('--index', type=str, help='Bestehender JSON-Index')
+    parser.add_argument('--synthetic', type=int, default=0, help='Anzahl synthetischer Bilder')
+    parser.add_argument('--faces', type=int, default=1, help='Mittlere Gesichter pro Bild (synthetisch)')
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    if args.synthetic:
+        json_path = Path(tmp.name) / 'insights_index.json'
+        make_synthetic(json_path, args.synthetic, args.faces)
+    elif args.index:
+        json_path = Path(args.index)
+    else:
+        parser.error('--index oder --synthetic angeben')
+    idx_path = Path(tmp.name) / 'insights_index.idx'
+
+    _, convert_s = timed('Konvertierung JSON -> .idx', lambda: convert_json_to_binary(json_path, idx_path))
+    (n, faces), json_s = timed('json.load + np.array', lambda: load_json_all(json_path))
+    _, open_s = timed('BinaryIndex öffnen', lambda: BinaryIndex(idx_path))
+    _, bin_s = timed('BinaryIndex + alle Encodings', lambda: load_binary_all(idx_path))
+
+    json_mb = json_path.stat().st_size / 1e6
+    idx_mb = sum(f.stat().st_size for f in idx_path.iterdir()) / 1e6
+    print(f"{n} Bilder, {faces} Gesichter | JSON {json_mb:.1f} MB, .idx {idx_mb:.1f} MB | "
+          f"Speedup {json_s / bin_s:.1f}x")
+    tmp.cleanup()
@@ -0,0 +1,76 @@
+"""
+bench_near_duplicates.py
+
+Laufzeit der Beinahe-Duplikat-Suche (Multi-Index-Hashing, near_duplicates.py) auf synthetischen
+64-Bit-Hashes: zufällige "Originale" plus Kopien mit 0..max_distance+2 gekippten Bits. Für kleine
+Mengen wird das Ergebnis gegen den quadratischen Paarvergleich geprüft.
+
+Beispiel-Usage:
+    python benchmarks/bench_near_duplicates.py --synthetic 1000000 --max-distance 6
+    python benchmarks/bench_near_duplicates.py --index insights_index.idx
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'phase2_photo_intelligence'))
+from near_duplicates import MultiIndexHash, choose_chunks, duplicate_groups, hamming, load_hashes
+
+# Bis zu dieser Größe wird zusätzlich brute-force verglichen
+BRUTE_FORCE_MAX = 20000
+
+
+def synthetic_hashes(count: int, copies: float = 0.1, max_flips: int = 8, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    originals = rng.integers(0, 1 << 32, (count, 2), dtype='uint64')
+    originals = (originals[:, 0] << np.uint64(32)) | originals[:, 1]
+    n_copies = int(count * copies)
+    flips = np.zeros(n_copies, dtype='uint64')
+    for i, k in enumerate(rng.integers(0, max_flips + 1, n_copies)):
+        for bit in rng.choice(64, k, replace=False):
+            flips[i] |= np.uint64(1) << np.uint64(bit)
+    return np.concatenate([originals, originals[rng.integers(0, count, n_copies)] ^ flips])
+
+
+def brute_force_pairs(hashes: np.ndarray, max_distance: int) -> set:
+    distances = hamming(hashes[:, None], hashes[None, :])
+    a, b = np.nonzero(np.triu(distances <= max_distance, 1))
+    return set(zip(a.tolist(), b.tolist()))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Laufzeit der Beinahe-Duplikat-Suche')
+    parser.add_argument('--synthetic', type=int, default=100000, help='Anzahl synthetischer Originale')
+    parser.add_argument('--index', type=str, help='Hashes aus einem Insights-Index statt synthetisch')
+    parser.add_argument('--hash', choices=('phash', 'dhash'), default='phash')
+    parser.add_argument('--max-distance', type=int, default=6)
+    parser.add_argument('--chunks', type=int, help='Teilstücke (Default: nach Kostenmodell)')
+    args = parser.parse_args()
+
+    if args.index:
+        from photo_insights import load_index
+        paths, hashes, sizes = load_hashes(load_index(args.index), args.hash)
+    else:
+        hashes = synthetic_hashes(args.synthetic, max_flips=args.max_distance + 2)
+        paths, sizes = [str(i) for i in range(len(hashes))], None
+    chunks = args.chunks or choose_chunks(len(hashes), args.max_distance)
+    print(f"{len(hashes)} Hashes, max. Distanz {args.max_distance}, {chunks} Teilstücke")
+
+    start = time.perf_counter()
+    a, b, _ = MultiIndexHash(hashes, chunks).pairs(args.max_distance)
+    pair_time = time.perf_counter() - start
+    start = time.perf_counter()
+    groups = duplicate_groups(paths, hashes, sizes, args.max_distance, chunks)
+    group_time = time.perf_counter() - start
+    print(f"Paare:   {len(a):>10}  {pair_time:8.2f}s")
+    print(f"Gruppen: {len(groups):>10}  {group_time:8.2f}s (inkl. Paarsuche)")
+
+    if len(hashes) <= BRUTE_FORCE_MAX:
+        start = time.perf_counter()
+        truth = brute_force_pairs(hashes, args.max_distance)
+        print(f"Brute force: {len(truth)} Paare in {time.perf_counter() - start:.2f}s, "
+              f"{'identisch' if truth == set(zip(a.tolist(), b.tolist())) else 'ABWEICHUNG'}")
@@ -0,0 +1,148 @@
+"""
+bench_startup.py
+
+Startzeit und Spitzen-Speicher (Peak RSS) der CLI-Befehle von photo_insights.py und photo_rag.py.
+Jeder Befehl läuft als eigener Prozess in einem leeren Arbeitsverzeichnis, ohne Quelle, Index
+oder Vektor-DB. Gemessen wird also nur, was Import und Initialisierung kosten, bevor ein
+Befehl merkt, dass es nichts zu tun gibt; schwere Backends (torch, transformers, faiss, ...)
+dürfen dabei nicht geladen werden.
+
+Mit --save wird das Ergebnis als Baseline gespeichert, mit --baseline dagegen verglichen:
+Ist ein Befehl um mehr als --tolerance langsamer bzw. speicherhungriger, endet das Skript
+mit Exit-Code 1.
+
+Beispiel-Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 5 --save startup_baseline.json
+    python benchmarks/bench_startup.py --baseline startup_baseline.json --tolerance 1.5
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+from pathlib import Path
+
+PHASE2 = Path(__file__).resolve().parent.parent / 'phase2_photo_intelligence'
+
+# (Name, Skript, Argumente); {tmp} wird durch das leere Arbeitsverzeichnis ersetzt
+COMMANDS = [
+    ('insights --help', 'photo_insights.py', ['--help']),
+    ('insights --build-index', 'photo_insights.py', ['--build-index', '--source', '{tmp}/fehlt']),
+    ('insights --find-person', 'photo_insights.py', ['--find-person', '{tmp}/fehlt']),
+    ('insights --find-duplicates', 'photo_insights.py', ['--find-duplicates']),
+    ('rag --help', 'photo_rag.py', ['--help']),
+    ('rag --build-vector-db', 'photo_rag.py', ['--build-vector-db', '--source', '{tmp}/fehlt']),
+    ('rag --from-store', 'photo_rag.py', ['--build-vector-db', '--from-store', '--embedding-store', '{tmp}/store']),
+    ('rag --query', 'photo_rag.py', ['--query', 'Strand', '--no-server']),
+]
+
+# Module, deren Import allein Sekunden und Hunderte MB kostet
+HEAVY_MODULES = ('torch', 'transformers', 'faiss', 'deepface', 'fer', 'face_recognition', 'tensorflow',
+                 'chromadb', 'openai', 'clip')
+
+# Läuft im Kindprozess: Skript wie __main__ ausführen und danach geladene schwere Module melden
+_RUNNER = """
+import json, os, runpy, sys
+script, report = sys.argv[1], sys.argv[2]
+sys.argv = [script] + sys.argv[3:]
+sys.path.insert(0, os.path.dirname(script))
+try:
+    runpy.run_path(script, run_name='__main__')
+except SystemExit:
+    pass
+finally:
+    heavy = sorted(m for m in sys.modules if m in {heavy!r})
+    with open(report, 'w') as f:
+        json.dump(heavy, f)
+"""
+
+
+def _peak_rss_mb(usage) -> float:
+    # ru_maxrss: Linux in KB, macOS in Byte
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def run_command(script: str, args: list, tmp: str) -> dict:
+    """Startet einen Befehl und misst Wall-Clock-Zeit und Peak RSS genau dieses Kindprozesses."""
+    report = os.path.join(tmp, 'heavy.json')
+    runner = _RUNNER.replace('{heavy!r}', repr(set(HEAVY_MODULES)))
+    argv = [sys.executable, '-c', runner, str(PHASE2 / script), report] + [a.format(tmp=tmp) for a in args]
+    env = dict(os.environ, PHOTO_SOURCE=os.path.join(tmp, 'fehlt'), KNOWN_FACES_DIR='',
+               PHOTO_RAG_SERVER='http://127.0.0.1:9', TEXT_EMBEDDING_CACHE='')
+    start = time.perf_counter()
+    proc = subprocess.Popen(argv, cwd=tmp, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if hasattr(os, 'wait4'):
+        # wait4 liefert die Ressourcen genau dieses Kindes (RUSAGE_CHILDREN wäre das Maximum aller)
+        _, status, usage = os.wait4(proc.pid, 0)
+        seconds = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        stderr = proc.stderr.read()
+        proc.stderr.close()
+        peak = _peak_rss_mb(usage)
+    else:
+        _, stderr = proc.communicate()
+        seconds = time.perf_counter() - start
+        peak = None  # Windows: kein ru_maxrss
+    if proc.returncode:
+        raise RuntimeError(f"{script} {' '.join(args)} fehlgeschlagen:\n{stderr.decode(errors='replace')}")
+    with open(report, 'r', encoding='utf-8') as f:
+        heavy = json.load(f)
+    return {'seconds': seconds, 'peak_rss_mb': peak, 'heavy_modules': heavy}
+
+
+def measure(repeat: int = 3) -> dict:
+    """Bester Lauf (kleinste Zeit) je Befehl; Peak RSS als Maximum über alle Läufe."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, script, args in COMMANDS:
+            runs = [run_command(script, args, tmp) for _ in range(repeat)]
+            peaks = [r['peak_rss_mb'] for r in runs if r['peak_rss_mb'] is not None]
+            results[name] = {'seconds': min(r['seconds'] for r in runs),
+                             'peak_rss_mb': max(peaks) if peaks else None,
+                             'heavy_modules': runs[0]['heavy_modules']}
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Befehle, die um mehr als tolerance (Faktor) langsamer bzw. größer als die Baseline sind."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in ('seconds', 'peak_rss_mb'):
+            if result[key] is not None and base.get(key) and result[key] > base[key] * tolerance:
+                regressions.append(f"{name}: {key} {result[key]:.2f} > {tolerance:.2f} x {base[key]:.2f}")
+    return regressions
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Startzeit und Peak RSS der CLI-Befehle')
+    parser.add_argument('--repeat', type=int, default=3, help='Läufe pro Befehl (Zeit = bester Lauf)')
+    parser.add_argument('--save', type=str, help='Ergebnis als Baseline (JSON) speichern')
+    parser.add_argument('--baseline', type=str, help='Gegen gespeicherte Baseline vergleichen')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='Erlaubter Faktor gegenüber der Baseline')
+    args = parser.parse_args()
+
+    results = measure(args.repeat)
+    print(f"{'Befehl':<26} {'Zeit':>8} {'Peak RSS':>10}  schwere Module")
+    for name, r in results.items():
+        peak = f"{r['peak_rss_mb']:7.0f} MB" if r['peak_rss_mb'] is not None else '         -'
+        print(f"{name:<26} {r['seconds']:7.2f}s {peak}  {', '.join(r['heavy_modules']) or '-'}")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline gespeichert: {args.save}")
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"Keine Regression gegenüber {args.baseline} (Toleranz {args.tolerance}x)")
@@ -0,0 +1,266 @@
+"""
+bench_suite.py
+
+Reproduzierbarer Offline-Benchmark der ganzen Pipeline auf einem synthetischen Korpus
+(synthetic_corpus.py), für jede Größe aus --sizes:
+- dates:           photo_sort.get_media_date über alle Dateien (Ergebnis wird gegen den Korpus geprüft)
+- sort:            photo_sort.organize_photos auf einer Hardlink-Kopie des Korpus
+- index:           photo_insights.build_index inkl. Embedding-Store
+- faces:           photo_insights.find_images_with_person gegen known_faces/ (mit Recall/Precision)
+- vector_build:    PhotoRAG.build_vector_db_from_store
+- search:          PhotoRAG.search, --queries verschiedene Queries (Latenz p50/p95)
+- search_filtered: dasselbe mit Jahres-Filter
+
+Fehlen face_recognition oder transformers/torch (oder mit --stub-models), ersetzen stub_models.py
+die Modelle; Zeiten mit und ohne Stubs sind nicht vergleichbar und werden nie gegeneinander geprüft.
+
+Mit --save wird das Ergebnis als Baseline gespeichert, mit --baseline dagegen verglichen: Ist eine
+Stage um mehr als --tolerance langsamer, endet das Skript mit Exit-Code 1.
+
+Beispiel-Usage:
+    python benchmarks/bench_suite.py --sizes 1000 10000 --save bench_baseline.json
+    python benchmarks/bench_suite.py --sizes 1000 10000 --baseline bench_baseline.json
+    python benchmarks/bench_suite.py --sizes 1000000 --corpus-dir D:\\bench --stages dates sort --workers 8
+"""
+
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'phase1_photo_sort'))
+sys.path.insert(0, str(ROOT / 'phase2_photo_intelligence'))
+from media_common.metrics import QUIET, Metrics
+from synthetic_corpus import (DEFAULT_IDENTITIES, DEFAULT_SEED, ensure_corpus, expected_date, expected_people,
+                              file_spec, index_of)
+
+STAGES = ('dates', 'sort', 'index', 'faces', 'vector_build', 'search', 'search_filtered')
+DEFAULT_SIZES = (1000,)
+DEFAULT_QUERIES = 200
+DEFAULT_TOLERANCE = 1.5
+# Stages unter dieser Dauer sind zu verrauscht für den Baseline-Vergleich
+MIN_COMPARE_SECONDS = 0.05
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Konsolenausgabe der Pipeline unterdrücken; gemessen werden soll die Arbeit, nicht print."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    with _quiet():
+        result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def bench_dates(files: list, repeat: int) -> dict:
+    from photo_sort import get_media_date
+    seconds = float('inf')
+    for _ in range(repeat):
+        elapsed, dates = _timed(lambda: [get_media_date(p) for p in files])
+        seconds = min(seconds, elapsed)
+    wrong = sum(d != expected_date(file_spec(index_of(p))) for p, d in zip(files, dates))
+    if wrong:
+        raise RuntimeError(f"get_media_date: {wrong} falsche Daten")
+    return {'seconds': seconds, 'files_per_second': len(files) / seconds}
+
+
+def bench_sort(media: Path, work: Path, workers: int) -> dict:
+    from photo_sort import organize_photos
+    source, target = work / 'sort_source', work / 'sort_target'
+    source.mkdir()
+    # Hardlinks: der Korpus bleibt unverändert, verschoben wird per rename wie im Normalfall
+    for p in media.iterdir():
+        try:
+            os.link(p, source / p.name)
+        except OSError:
+            # --work-dir auf einem anderen Volume als der Korpus
+            shutil.copy2(p, source / p.name)
+    count = sum(1 for _ in source.iterdir())
+    seconds, _ = _timed(organize_photos, str(source), str(target), workers=workers,
+                        metrics=Metrics('photo_sort', verbosity=QUIET))
+    moved = sum(1 for p in target.rglob('*') if p.is_file())
+    if moved != count:
+        raise RuntimeError(f"organize_photos: {moved} von {count} Dateien verschoben")
+    shutil.rmtree(source)
+    shutil.rmtree(target)
+    return {'seconds': seconds, 'files_per_second': count / seconds}
+
+
+def bench_index(media: Path, index_path: str, store_dir: str, workers: int, count: int) -> dict:
+    from photo_insights import build_index, load_index
+    seconds, _ = _timed(build_index, str(media), out_file=index_path, store_dir=store_dir, workers=workers,
+                        metrics=Metrics('photo_insights', verbosity=QUIET, cpu_clock=time.process_time))
+    indexed = len(load_index(index_path))
+    if indexed != count:
+        raise RuntimeError(f"build_index: {indexed} von {count} Dateien im Index")
+    return {'seconds': seconds, 'files_per_second': count / seconds}
+
+
+def bench_faces(index_path: str, known_faces: Path, count: int, seed: int, identities: int) -> dict:
+    from photo_insights import find_images_with_person
+    seconds, found = _timed(find_images_with_person, index_path=index_path, known_face_dir=str(known_faces))
+    truth = expected_people(count, seed, identities)
+    hits = {name: {Path(h['path']).name for h in matches} for name, matches in found.items()}
+    tp = sum(len(hits.get(name, set()) & files) for name, files in truth.items())
+    return {'seconds': seconds, 'matches': sum(len(h) for h in hits.values()),
+            'recall': round(tp / max(sum(len(f) for f in truth.values()), 1), 4),
+            'precision': round(tp / max(sum(len(h) for h in hits.values()), 1), 4)}
+
+
+def bench_vector_build(rag, store_dir: str) -> dict:
+    seconds, _ = _timed(rag.build_vector_db_from_store, store_dir, Metrics('photo_rag', verbosity=QUIET))
+    return {'seconds': seconds, 'vectors': rag.vector_index.ntotal}
+
+
+def bench_search(rag, queries: int, repeat: int, filters: dict = None) -> dict:
+    if filters:
+        # Metadaten-Filter einmal vorab bauen; gemessen wird nur die Suche
+        with _quiet():
+            rag.load_metadata_filter()
+    best = None
+    for run in range(repeat):
+        latencies = []
+        with _quiet():
+            for q in range(queries):
+                # jede Query nur einmal, sonst misst man den Ergebnis-Cache
+                start = time.perf_counter()
+                rag.search(f"synthetische Query {run}-{q}", top_k=10, filters=filters)
+                latencies.append(time.perf_counter() - start)
+        if best is None or sum(latencies) < sum(best):
+            best = latencies
+    p50, p95 = np.percentile(best, [50, 95])
+    return {'seconds': sum(best), 'queries_per_second': len(best) / sum(best),
+            'p50_ms': round(1000 * p50, 3), 'p95_ms': round(1000 * p95, 3)}
+
+
+def run_size(count: int, corpus_root: Path, stages: tuple, args) -> dict:
+    corpus = corpus_root / f"n{count}"
+    start = time.perf_counter()
+    ensure_corpus(str(corpus), count, args.seed, args.identities, workers=args.corpus_workers)
+    print(f"\n== {count} Dateien (Korpus {corpus}, {time.perf_counter() - start:.1f}s) ==")
+    media = corpus / 'media'
+    files = sorted(media.iterdir())
+    results = {}
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as tmp:
+        work = Path(tmp)
+        index_path, store_dir = str(work / 'insights_index.idx'), str(work / 'embedding_store')
+        rag = None
+        for stage in stages:
+            if stage == 'dates':
+                result = bench_dates(files, args.repeat)
+            elif stage == 'sort':
+                result = bench_sort(media, work, args.workers)
+            elif stage == 'index':
+                result = bench_index(media, index_path, store_dir, args.workers, count)
+            elif stage == 'faces':
+                result = bench_faces(index_path, corpus / 'known_faces', count, args.seed, args.identities)
+            elif stage == 'vector_build':
+                from photo_rag import PhotoRAG
+                rag = PhotoRAG(index_path=index_path, vector_db_path=str(work / 'photo_vectors.faiss'),
+                               index_type=args.index_type, text_cache_path=None)
+                result = bench_vector_build(rag, store_dir)
+            else:
+                filters = {'year': 2020} if stage == 'search_filtered' else None
+                result = bench_search(rag, args.queries, args.repeat, filters)
+            results[stage] = result
+            extra = ', '.join(f"{k} {v:,.1f}" if isinstance(v, float) else f"{k} {v}"
+                              for k, v in result.items() if k != 'seconds')
+            print(f"  {stage:<16} {result['seconds']:9.3f}s  ({extra})")
+    return results
+
+
+def _requirements(stages: list) -> list:
+    """Stages, die auf anderen aufbauen, ziehen diese mit."""
+    needs = {'faces': 'index', 'vector_build': 'index', 'search': 'vector_build', 'search_filtered': 'vector_build'}
+    wanted = set(stages)
+    for stage in stages:
+        while stage in needs:
+            stage = needs[stage]
+            wanted.add(stage)
+    return [s for s in STAGES if s in wanted]
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Stages, die um mehr als tolerance (Faktor) langsamer als die Baseline sind."""
+    if baseline.get('models') != results['models']:
+        print(f"Baseline mit Modellen '{baseline.get('models')}', aktuell '{results['models']}': nicht vergleichbar")
+        return [f"models: {results['models']} != {baseline.get('models')}"]
+    regressions = []
+    for size, stages in results['sizes'].items():
+        for stage, result in stages.items():
+            base = baseline.get('sizes', {}).get(size, {}).get(stage)
+            if not base or max(base['seconds'], result['seconds']) < MIN_COMPARE_SECONDS:
+                continue
+            if result['seconds'] > base['seconds'] * tolerance:
+                regressions.append(f"{size}/{stage}: {result['seconds']:.3f}s > {tolerance:.2f} x {base['seconds']:.3f}s")
+            for key in ('recall', 'precision'):
+                if key in base and result.get(key, 0) < base[key] - 0.01:
+                    regressions.append(f"{size}/{stage}: {key} {result[key]:.4f} < {base[key]:.4f}")
+    return regressions
+
+
+if __name__ == '__main__':
+    import argparse
+    from vector_index import DEFAULT_INDEX_TYPE, INDEX_TYPES
+    parser = argparse.ArgumentParser(description='Offline-Benchmark auf einem synthetischen Korpus')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='Korpusgrößen (Dateien)')
+    parser.add_argument('--stages', choices=STAGES, nargs='+', default=list(STAGES))
+    parser.add_argument('--corpus-dir', type=str, help='Korpora hier ablegen und wiederverwenden (Default: temporär)')
+    parser.add_argument('--work-dir', type=str, help='Ordner für Index, Store und Sortier-Kopie (Default: System-Temp)')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--identities', type=int, default=DEFAULT_IDENTITIES, help='Personen im Korpus')
+    parser.add_argument('--workers', type=int, default=1, help='--workers für photo_sort und build_index')
+    parser.add_argument('--corpus-workers', type=int, default=os.cpu_count() or 1, help='Prozesse für die Korpus-Erzeugung')
+    parser.add_argument('--queries', type=int, default=DEFAULT_QUERIES, help='Queries pro Such-Stage')
+    parser.add_argument('--repeat', type=int, default=3, help='Läufe für dates/search (Zeit = bester Lauf)')
+    parser.add_argument('--index-type', choices=INDEX_TYPES, default=DEFAULT_INDEX_TYPE)
+    parser.add_argument('--stub-models', action='store_true', help='Stub-Modelle auch bei installierten Backends')
+    parser.add_argument('--save', type=str, help='Ergebnis als Baseline (JSON) speichern')
+    parser.add_argument('--baseline', type=str, help='Gegen gespeicherte Baseline vergleichen')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='Erlaubter Faktor gegenüber der Baseline')
+    args = parser.parse_args()
+
+    import stub_models
+    stub = args.stub_models or not stub_models.real_backends_available()
+    if stub:
+        stub_models.install(args.seed, args.identities)
+        if args.workers > 1 and multiprocessing.get_start_method() != 'fork':
+            print("Stub-Modelle gelten nur in per fork gestarteten Workern; nutze --workers 1")
+            args.workers = 1
+    stages = _requirements(args.stages)
+    print(f"Modelle: {'Stubs' if stub else 'echt'}, Stages: {', '.join(stages)}, Workers: {args.workers}")
+
+    results = {'models': 'stub' if stub else 'real', 'seed': args.seed, 'identities': args.identities,
+               'workers': args.workers, 'index_type': args.index_type, 'python': platform.python_version(),
+               'platform': platform.platform(), 'cpus': os.cpu_count(), 'sizes': {}}
+    with contextlib.ExitStack() as stack:
+        corpus_root = Path(args.corpus_dir) if args.corpus_dir else Path(stack.enter_context(tempfile.TemporaryDirectory()))
+        for size in args.sizes:
+            results['sizes'][str(size)] = run_size(size, corpus_root, stages, args)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline gespeichert: {args.save}")
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"Keine Regression gegenüber {args.baseline} (Toleranz {args.tolerance}x)")
@@ -0,0 +1,62 @@
+"""
+bench_vector_index.py
+
+Recall@k vs. Latenz der Vektor-Index-Backends (flat-ip, ivf, hnsw) gegen den exakten
+flat-ip-Baseline. Als Queries dienen leicht verrauschte Vektoren aus der Datenbasis.
+
+Mit --quantization stattdessen Speicher pro Bild und Recall-Verlust je Quantisierung
+(none, fp16, int8, pq), jeweils mit und ohne Re-Ranking.
+
+Beispiel-Usage:
+    python benchmarks/bench_vector_index.py --store embedding_store
+    python benchmarks/bench_vector_index.py --synthetic 200000 --k 10
+    python benchmarks/bench_vector_index.py --synthetic 100000 --quantization --index-type hnsw
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'phase2_photo_intelligence'))
+from embedding_store import CLIP_MODEL_NAME, EmbeddingStore
+from vector_index import INDEX_TYPES, NumpyVectorIndex, has_faiss, quantization_report, recall_report
+
+
+def synthetic_vectors(count: int, dim: int = 512, clusters: int = 200, seed: int = 0) -> np.ndarray:
+    """Gauß-Cluster als grobe Annäherung an CLIP-Embeddings (Motive bilden Gruppen)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype('float32')
+    labels = rng.integers(0, clusters, count)
+    return centers[labels] + 0.5 * rng.normal(size=(count, dim)).astype('float32')
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Recall/Latenz-Report der Vektor-Index-Backends')
+    parser.add_argument('--store', type=str, help='Embedding-Store als Datenbasis')
+    parser.add_argument('--synthetic', type=int, default=0, help='Anzahl synthetischer Vektoren')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--quantization', action='store_true', help='Quantisierungs-Report statt Index-Vergleich')
+    parser.add_argument('--index-type', choices=INDEX_TYPES, default='flat-ip', help='Index-Typ für --quantization')
+    args = parser.parse_args()
+
+    if args.store:
+        store = EmbeddingStore(args.store, CLIP_MODEL_NAME)
+        rows, _ = store.live()
+        vectors = np.asarray(store.vectors()[rows], dtype='float32')
+    elif args.synthetic:
+        vectors = synthetic_vectors(args.synthetic)
+    else:
+        parser.error('--store oder --synthetic angeben')
+
+    rng = np.random.default_rng(1)
+    picks = rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)
+    queries = vectors[picks] + 0.1 * rng.normal(size=(len(picks), vectors.shape[1])).astype('float32')
+    print(f"{len(vectors)} Vektoren, dim {vectors.shape[1]}, {len(queries)} Queries")
+    if args.quantization:
+        index_cls = {} if has_faiss() else {'index_cls': NumpyVectorIndex}
+        quantization_report(vectors, queries, k=args.k, index_type=args.index_type, **index_cls)
+    else:
+        recall_report(vectors, queries, k=args.k)
@@ -0,0 +1,112 @@
+"""
+bench_video.py
+
+Kosten der Video-Verarbeitung:
+- mvhd: Aufnahmedatum/Dauer per Streaming-Parser (media_common/video_meta.py); gemessen werden
+  Dateien/s und gelesene Bytes pro Datei, unabhängig von der Dateigröße.
+- keyframes: Zeit für das Keyframe-Sampling (video_frames.py) pro Minute Videomaterial
+  (nur mit PyAV oder OpenCV und echten Videos, also mit --source).
+
+Beispiel-Usage:
+    python benchmarks/bench_video.py --synthetic 500 --size-mb 2000   # sparse Dateien, moov am Ende
+    python benchmarks/bench_video.py --source \\\\NAS\\Videos --limit 200
+"""
+
+import io
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'phase2_photo_intelligence'))
+from media_common.video_meta import VIDEO_SUFFIXES, read_movie_header
+
+
+def _box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def make_synthetic(folder: Path, count: int, size_mb: int):
+    """MP4-Skelette mit großem (sparse) mdat vor dem moov, wie bei Kamera-Aufnahmen."""
+    created = 3_771_000_000 // 1  # ~2023 in Sekunden seit 1904
+    for i in range(count):
+        mvhd = _box(b'mvhd', struct.pack('>B3sIIII', 0, b'\0\0\0', created + i, created + i, 600, 600 * 60)
+                    + b'\0' * 80)
+        with open(folder / f"VID_{i:06d}.mp4", 'wb') as f:
+            f.write(_box(b'ftyp', b'isom\0\0\0\0isommp41'))
+            # 64-Bit-Größe, damit auch mdat > 4 GB möglich ist
+            f.write(struct.pack('>I4sQ', 1, b'mdat', 16 + size_mb * 1024 * 1024))
+            f.seek(size_mb * 1024 * 1024, io.SEEK_CUR)
+            f.write(_box(b'moov', mvhd))
+
+
+class CountingFile(io.FileIO):
+    """Zählt die tatsächlich gelesenen Bytes."""
+    total = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        CountingFile.total += len(data)
+        return data
+
+
+def bench_mvhd(files):
+    import builtins
+    original = builtins.open
+    builtins.open = lambda path, mode='r', *a, **kw: CountingFile(path) if mode == 'rb' else original(path, mode, *a, **kw)
+    found = errors = 0
+    start = time.perf_counter()
+    try:
+        for p in files:
+            try:
+                header = read_movie_header(p)
+                found += bool(header and header[0])
+            except Exception:
+                errors += 1
+    finally:
+        builtins.open = original
+    elapsed = time.perf_counter() - start
+    print(f"   mvhd: {len(files)} Dateien in {elapsed:.2f}s -> {len(files) / max(elapsed, 1e-9):,.0f} Dateien/s, "
+          f"{CountingFile.total / max(len(files), 1):,.0f} Byte gelesen pro Datei "
+          f"(mit Datum: {found}, Fehler: {errors})")
+
+
+def bench_keyframes(files):
+    from video_frames import HAS_VIDEO_DECODER, keyframes, sample_times, video_duration
+    if not HAS_VIDEO_DECODER:
+        print("keyframes: übersprungen (weder PyAV noch OpenCV installiert)")
+        return
+    minutes = frames = 0.0
+    start = time.perf_counter()
+    for p in files:
+        duration = video_duration(p) or 0.0
+        try:
+            frames += len(keyframes(p, sample_times(duration)))
+            minutes += duration / 60.0
+        except Exception as e:
+            print(f"✗ {p.name}: {e}")
+    elapsed = time.perf_counter() - start
+    print(f"keyframes: {int(frames)} Frames aus {minutes:.1f} min Video in {elapsed:.2f}s "
+          f"-> {elapsed / max(minutes, 1e-9):.2f}s pro Minute Material")
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Kosten von Video-Metadaten und Keyframe-Sampling')
+    parser.add_argument('--source', type=str, help='Ordner mit echten Videos')
+    parser.add_argument('--limit', type=int, default=0)
+    parser.add_argument('--synthetic', type=int, default=200, help='Anzahl synthetischer MP4-Skelette')
+    parser.add_argument('--size-mb', type=int, default=1000, help='Größe des (sparse) mdat pro Datei')
+    args = parser.parse_args()
+
+    if args.source:
+        files = sorted(p for p in Path(args.source).rglob('*') if p.is_file() and p.suffix.lower() in VIDEO_SUFFIXES)
+        files = files[:args.limit] if args.limit else files
+        bench_mvhd(files)
+        bench_keyframes(files)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            make_synthetic(Path(tmp), args.synthetic, args.size_mb)
+            bench_mvhd(sorted(Path(tmp).iterdir()))
@@ -0,0 +1,78 @@
+"""
+stub_models.py
+
+Ersatz für die schweren ML-Backends in Benchmarks (bench_suite.py), wenn face_recognition bzw.
+transformers/torch fehlen oder Ergebnisse zwischen Rechnern vergleichbar sein sollen:
+- Gesichter: Encodings aus dem synthetischen Korpus (synthetic_corpus.py), also nahe am Zentrum
+  der Personen, die das Bild laut file_spec enthält. Dateien außerhalb des Korpus haben keine.
+- CLIP-Bild-Embeddings: feste Zufallsprojektion eines 16x16-Graustufen-Thumbnails auf 512
+  Dimensionen. Der Decode bleibt also echt, ähnliche Bilder liegen nah beieinander.
+- CLIP-Text-Embeddings: Zufallsvektor aus dem Hash der Query.
+
+Gemessen wird damit der Code um die Modelle herum (Decode, Index, Store, Suche), nicht die Modelle.
+Die Stubs ersetzen Modul-Attribute von photo_insights und photo_rag; Worker-Prozesse erben sie nur
+per fork (Linux).
+"""
+
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+from synthetic_corpus import DEFAULT_IDENTITIES, DEFAULT_SEED, face_centers, face_encodings, file_spec, index_of
+
+EMBEDDING_DIM = 512
+THUMB_SIDE = 16
+
+
+def real_backends_available() -> bool:
+    import photo_insights
+    import photo_rag
+    return photo_insights.HAS_FACE_RECOG and photo_insights.HAS_CLIP and photo_rag.HAS_CLIP
+
+
+def _unit(vector: np.ndarray) -> list:
+    return (vector / (np.linalg.norm(vector) or 1.0)).astype('float32').tolist()
+
+
+def install(seed: int = DEFAULT_SEED, identities: int = DEFAULT_IDENTITIES):
+    """Ersetzt Gesichtserkennung, Emotionen und CLIP in photo_insights/photo_rag durch Stubs."""
+    import photo_insights
+    import photo_rag
+    from embedding_store import CLIP_MODEL_NAME
+
+    centers = face_centers(seed, identities)
+    projection = np.random.default_rng(seed).normal(0, 1, (THUMB_SIDE * THUMB_SIDE, EMBEDDING_DIM)).astype('float32')
+
+    def get_face_data(path: Path, decoded=None):
+        try:
+            i = index_of(path)
+        except ValueError:
+            return {'locations': [], 'encodings': []}
+        faces = file_spec(i, seed, identities)['faces']
+        encodings = face_encodings(i, faces, centers, seed)
+        return {'locations': [(10, 40, 40, 10)] * len(faces), 'encodings': encodings.tolist()}
+
+    def get_embedding(path: Path, model_cache=None, decoded=None):
+        image = decoded.small() if decoded else photo_insights.decode_image(path).small()
+        thumb = np.asarray(image.convert('L').resize((THUMB_SIDE, THUMB_SIDE)), dtype='float32').ravel()
+        return _unit((thumb / 255.0 - 0.5) @ projection)
+
+    def embed_texts(self, queries):
+        vectors = []
+        for query in queries:
+            digest = hashlib.blake2b(query.strip().lower().encode('utf-8'), digest_size=8).digest()
+            rng = np.random.default_rng(int.from_bytes(digest, 'little'))
+            vectors.append(_unit(rng.normal(0, 1, EMBEDDING_DIM)))
+        return np.asarray(vectors, dtype='float32')
+
+    photo_insights.HAS_FACE_RECOG = True
+    photo_insights.HAS_CLIP = True
+    photo_insights.HAS_DEEPFACE = photo_insights.HAS_FER = False
+    photo_insights.get_face_data = get_face_data
+    photo_insights.get_embedding = get_embedding
+    photo_insights.load_models = lambda: None
+    photo_insights._init_worker = lambda torch_threads: None
+    photo_insights._clip_model_name = lambda: CLIP_MODEL_NAME
+    photo_rag.HAS_CLIP = True
+    photo_rag.PhotoRAG.embed_texts = embed_texts
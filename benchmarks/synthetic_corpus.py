@@ -0,0 +1,263 @@
+"""
+synthetic_corpus.py
+
+Deterministischer Medien-Korpus für Benchmarks (bench_suite.py): gleicher Seed und gleiche Größe
+ergeben bytegleiche Dateien mit gleicher mtime, auf jedem Rechner.
+- Mischung: ~70% JPEG, 12% PNG, 10% TIFF, 8% MP4-Skelette (ftyp + mdat + moov/mvhd, ohne Frames)
+- EXIF variiert: DateTimeOriginal, zusätzlich SubSec/OffsetTime, nur DateTime im IFD0 (wird vom
+  Header-Reader ignoriert) oder gar keins; dann greift der mtime-Fallback
+- Gesichter: jedes Bild "enthält" 0-3 von identities Personen. Die Stub-Modelle (stub_models.py)
+  liefern dafür Encodings nahe dem Zentrum der Person; known_faces/ enthält ein Bild pro Person
+  samt vorbefülltem Encoding-Cache (face_search.KNOWN_CACHE_NAME), face_recognition wird also
+  auch für die bekannten Gesichter nicht gebraucht.
+
+Aufbau: <ordner>/media (flach, wie PHOTO_SOURCE), <ordner>/known_faces, <ordner>/corpus.json.
+Ein bestehender Korpus mit gleichen Parametern wird wiederverwendet.
+
+Beispiel-Usage:
+    python benchmarks/synthetic_corpus.py --out D:\\bench\\corpus_100k --count 100000 --workers 8
+"""
+
+import json
+import os
+import random
+import struct
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'phase2_photo_intelligence'))
+from face_search import FACE_DIM, KNOWN_CACHE_NAME, _file_hash
+
+# Bei Änderungen am Format erhöhen, damit alte Korpora nicht wiederverwendet werden
+CORPUS_VERSION = 1
+DEFAULT_SEED = 42
+DEFAULT_IMAGE_SIZE = (160, 120)
+DEFAULT_IDENTITIES = 50
+MANIFEST = 'corpus.json'
+
+# (Anteil, Art, Präfix, Endung)
+KINDS = ((0.70, 'jpeg', 'IMG_', '.jpg'), (0.82, 'png', 'PNG_', '.png'),
+         (0.92, 'tiff', 'SCAN_', '.tiff'), (1.00, 'mp4', 'VID_', '.mp4'))
+EPOCH = datetime(2015, 1, 1)
+MAC_EPOCH = datetime(1904, 1, 1)
+# Abstände wie bei face_recognition: zwischen Personen ~1.0, innerhalb einer Person ~0.35
+FACE_CENTER_SCALE = 0.0625
+FACE_NOISE_SCALE = 0.022
+
+
+def file_spec(i: int, seed: int = DEFAULT_SEED, identities: int = DEFAULT_IDENTITIES) -> dict:
+    """Beschreibung der i-ten Datei; hängt nur von (i, seed) ab."""
+    rng = random.Random(f"{seed}:{i}")
+    draw = rng.random()
+    kind, prefix, ext = next((k, p, e) for share, k, p, e in KINDS if draw < share)
+    taken = EPOCH + timedelta(seconds=rng.randrange(9 * 365 * 86400))
+    exif = rng.choices(('original', 'offset', 'ifd0', 'none'), (60, 10, 10, 20))[0]
+    faces = [] if kind == 'mp4' else [rng.randrange(identities) for _ in range(rng.choice((0, 0, 1, 1, 2, 3)))]
+    return {'name': f"{prefix}{i:07d}{ext}", 'kind': kind, 'taken': taken, 'exif': exif, 'faces': faces,
+            # Änderungsdatum: Tage bis Monate nach der Aufnahme (Kopie, Bearbeitung)
+            'mtime': (taken + timedelta(days=rng.randrange(1, 120))).timestamp(),
+            'color': tuple(rng.randrange(256) for _ in range(3)),
+            'shapes': [(rng.random(), rng.random(), rng.random(), rng.random(),
+                        tuple(rng.randrange(256) for _ in range(3))) for _ in range(rng.randrange(2, 6))],
+            'duration': rng.uniform(5, 120), 'subsec': rng.randrange(100)}
+
+
+def index_of(path) -> int:
+    """Umkehrung von file_spec()['name']."""
+    stem = Path(path).stem
+    return int(stem[stem.index('_') + 1:])
+
+
+def face_centers(seed: int = DEFAULT_SEED, identities: int = DEFAULT_IDENTITIES) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, FACE_CENTER_SCALE, (identities, FACE_DIM)).astype('float32')
+
+
+def face_encodings(i: int, faces: list, centers: np.ndarray, seed: int = DEFAULT_SEED) -> np.ndarray:
+    """Encodings der Gesichter von Datei i (eine Zeile pro Gesicht)."""
+    rng = np.random.default_rng([seed, i])
+    return centers[faces] + rng.normal(0, FACE_NOISE_SCALE, (len(faces), FACE_DIM)).astype('float32')
+
+
+def _exif(spec: dict):
+    from PIL import Image
+    exif = Image.Exif()
+    stamp = spec['taken'].strftime("%Y:%m:%d %H:%M:%S")
+    if spec['exif'] == 'none':
+        return None
+    exif[0x010F] = 'Synthetic'
+    exif[0x0110] = 'Bench 1'
+    if spec['exif'] == 'ifd0':
+        exif[0x0132] = stamp
+        return exif
+    ifd = exif.get_ifd(0x8769)
+    ifd[0x9003] = stamp
+    if spec['exif'] == 'offset':
+        ifd[0x9291] = f"{spec['subsec']:02d}"
+        ifd[0x9011] = '+02:00'
+    return exif
+
+
+def _box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def _write_mp4(path: Path, spec: dict):
+    created = int((spec['taken'] - MAC_EPOCH).total_seconds()) if spec['exif'] != 'none' else 0
+    mvhd = _box(b'mvhd', struct.pack('>B3sIIII', 0, b'\0\0\0', created, created, 600, int(600 * spec['duration']))
+                + b'\0' * 80)
+    with open(path, 'wb') as f:
+        f.write(_box(b'ftyp', b'isom\0\0\0\0isommp41'))
+        f.write(_box(b'mdat', b'\0' * 1024))
+        f.write(_box(b'moov', mvhd))
+
+
+def _add_exif_ifd(path: Path, exif):
+    """Pillow schreibt bei TIFF nur das IFD0, nicht das Exif-IFD: IFD0 mit Exif-Zeiger neu anhängen."""
+    fields = sorted((tag, str(value).encode('ascii') + b'\0') for tag, value in exif.get_ifd(0x8769).items())
+    if not fields:
+        return
+    with open(path, 'r+b') as f:
+        data = f.read()
+        if data[:2] != b'II':
+            return
+        ifd0, = struct.unpack_from('<I', data, 4)
+        n, = struct.unpack_from('<H', data, ifd0)
+        entries = [data[ifd0 + 2 + 12 * k:ifd0 + 14 + 12 * k] for k in range(n)]
+        next_ifd = data[ifd0 + 2 + 12 * n:ifd0 + 6 + 12 * n]
+        exif_at = len(data) + len(data) % 2
+        values_at = exif_at + 2 + 12 * len(fields) + 4
+        table, values = [], b''
+        for tag, value in fields:
+            if len(value) <= 4:
+                table.append(struct.pack('<HHI4s', tag, 2, len(value), value))
+            else:
+                table.append(struct.pack('<HHII', tag, 2, len(value), values_at + len(values)))
+                values += value + b'\0' * (len(value) % 2)
+        block = struct.pack('<H', len(fields)) + b''.join(table) + b'\0' * 4 + values
+        entries.append(struct.pack('<HHII', 0x8769, 4, 1, exif_at))
+        entries.sort(key=lambda e: struct.unpack_from('<H', e)[0])
+        new_ifd0 = exif_at + len(block)
+        f.seek(len(data))
+        f.write(b'\0' * (exif_at - len(data)) + block + struct.pack('<H', len(entries)) + b''.join(entries) + next_ifd)
+        f.seek(4)
+        f.write(struct.pack('<I', new_ifd0))
+
+
+def _write_image(path: Path, spec: dict, size: tuple):
+    from PIL import Image, ImageDraw
+    img = Image.new('RGB', size, spec['color'])
+    draw = ImageDraw.Draw(img)
+    w, h = size
+    for x, y, sw, sh, color in spec['shapes']:
+        x0, y0 = int(x * w), int(y * h)
+        draw.rectangle((x0, y0, x0 + int(sw * w / 2), y0 + int(sh * h / 2)), fill=color)
+    exif = _exif(spec)
+    options = {'exif': exif} if exif is not None else {}
+    if spec['kind'] == 'jpeg':
+        img.save(path, 'JPEG', quality=85, **options)
+    elif spec['kind'] == 'png':
+        img.save(path, 'PNG', **options)
+    else:
+        img.save(path, 'TIFF', compression='tiff_deflate', **options)
+        if exif is not None:
+            _add_exif_ifd(path, exif)
+
+
+def _write_range(task):
+    folder, start, stop, seed, identities, size = task
+    for i in range(start, stop):
+        spec = file_spec(i, seed, identities)
+        path = Path(folder) / spec['name']
+        if spec['kind'] == 'mp4':
+            _write_mp4(path, spec)
+        else:
+            _write_image(path, spec, size)
+        os.utime(path, (spec['mtime'], spec['mtime']))
+
+
+def make_known_faces(folder: Path, seed: int = DEFAULT_SEED, identities: int = DEFAULT_IDENTITIES):
+    """Ein Bild pro Person plus vorbefüllter Encoding-Cache im Altformat (KNOWN_CACHE_NAME), den
+    face_search.load_known_faces weiterhin liest."""
+    from PIL import Image
+    folder.mkdir(parents=True, exist_ok=True)
+    centers = face_centers(seed, identities)
+    cache = {}
+    for k in range(identities):
+        path = folder / f"person_{k:04d}.png"
+        Image.new('RGB', (32, 32), (k % 256, (k // 256) % 256, 128)).save(path)
+        cache[_file_hash(path)] = centers[k].tolist()
+    with open(folder / KNOWN_CACHE_NAME, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+
+
+def ensure_corpus(folder: str, count: int, seed: int = DEFAULT_SEED, identities: int = DEFAULT_IDENTITIES,
+                  image_size: tuple = DEFAULT_IMAGE_SIZE, workers: int = 1) -> dict:
+    """Legt den Korpus an (oder nutzt einen passenden vorhandenen); Rückgabe: Manifest."""
+    folder = Path(folder)
+    manifest = {'version': CORPUS_VERSION, 'count': count, 'seed': seed, 'identities': identities,
+                'image_size': list(image_size)}
+    manifest_path = folder / MANIFEST
+    if manifest_path.exists():
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            existing = json.load(f)
+        if existing == manifest:
+            return manifest
+        raise ValueError(f"{folder} enthält einen anderen Korpus ({existing}); anderen Ordner wählen")
+    media = folder / 'media'
+    media.mkdir(parents=True, exist_ok=True)
+    chunk = 500
+    tasks = [(str(media), start, min(start + chunk, count), seed, identities, tuple(image_size))
+             for start in range(0, count, chunk)]
+    if workers > 1 and len(tasks) > 1:
+        import multiprocessing
+        with multiprocessing.Pool(workers) as pool:
+            for _ in pool.imap_unordered(_write_range, tasks):
+                pass
+    else:
+        for task in tasks:
+            _write_range(task)
+    make_known_faces(folder / 'known_faces', seed, identities)
+    # Manifest zuletzt: ein abgebrochener Lauf wird nicht für vollständig gehalten
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def expected_people(count: int, seed: int = DEFAULT_SEED, identities: int = DEFAULT_IDENTITIES) -> dict:
+    """Wahre Zuordnung Person -> Dateinamen (für Recall/Precision der Gesichtssuche)."""
+    people = {}
+    for i in range(count):
+        spec = file_spec(i, seed, identities)
+        for k in set(spec['faces']):
+            people.setdefault(f"person_{k:04d}", set()).add(spec['name'])
+    return people
+
+
+def expected_date(spec: dict):
+    """Datum, das photo_sort.get_media_date für die Datei liefern sollte."""
+    if spec['exif'] in ('original', 'offset') or (spec['kind'] == 'mp4' and spec['exif'] != 'none'):
+        # bei Videos ist taken die UTC-Zeit aus dem mvhd
+        return spec['taken'].date()
+    return datetime.fromtimestamp(spec['mtime']).date()
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description='Deterministischen Benchmark-Korpus erzeugen')
+    parser.add_argument('--out', type=str, required=True, help='Zielordner (wird angelegt)')
+    parser.add_argument('--count', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--identities', type=int, default=DEFAULT_IDENTITIES, help='Anzahl Personen')
+    parser.add_argument('--image-size', type=str, default='x'.join(map(str, DEFAULT_IMAGE_SIZE)), help='BxH')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    ensure_corpus(args.out, args.count, args.seed, args.identities,
+                  tuple(int(v) for v in args.image_size.lower().split('x')), args.workers)
+    print(f"Korpus mit {args.count} Dateien in {args.out} ({time.perf_counter() - start:.1f}s)")
@@ -0,0 +1,7 @@
+"""
+media_common
+
+Gemeinsame Bausteine für Phase 1 (photo_sort) und Phase 2 (photo_insights, photo_rag).
+Die Skripte fügen das Repository-Wurzelverzeichnis zu sys.path hinzu und importieren
+von hier, damit z.B. die Datums-Extraktion nur an einer Stelle gepflegt wird.
+"""
@@ -0,0 +1,21 @@
+"""
+backends.py
+
+Erkennung optionaler Abhängigkeiten (torch, transformers, faiss, deepface, ...), ohne sie zu
+importieren. importlib.util.find_spec sucht nur das Paket auf dem Pfad; der eigentliche Import,
+der bei diesen Bibliotheken Sekunden und Hunderte MB kostet, passiert erst bei der ersten
+Nutzung. So bleiben --help und Befehle, die früh abbrechen, schnell.
+"""
+
+import importlib.util
+
+
+def available(*modules: str) -> bool:
+    """True, wenn alle genannten Module installiert sind (ohne sie zu laden)."""
+    for name in modules:
+        try:
+            if importlib.util.find_spec(name) is None:
+                return False
+        except (ImportError, ValueError):
+            return False
+    return True
@@ -0,0 +1,246 @@
+"""
+exif_date.py
+
+Header-only Extraktion des Aufnahmedatums (EXIF DateTimeOriginal).
+
+Statt das Bild über Pillow zu öffnen und alle EXIF-Tags zu durchlaufen, wird nur die
+Container-Struktur gelesen (JPEG APP1, PNG eXIf oder TIFF-Header) und über die IFD-Kette
+direkt zum Exif-IFD gesprungen. Gelesen werden dabei typischerweise nur wenige hundert Bytes
+am Dateianfang. Zusätzlich werden SubSecTimeOriginal und OffsetTimeOriginal ausgewertet.
+
+Nur bei defekten oder unbekannten Containern wird auf Pillow zurückgegriffen. Videos (.mp4, .mov)
+haben kein EXIF; dort liefert der mvhd-Header den Zeitpunkt (video_meta.py).
+"""
+
+import struct
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+from .video_meta import VIDEO_SUFFIXES, read_video_datetime
+
+# Dateiendungen, für die ein EXIF-Versuch sinnvoll ist
+EXIF_SUFFIXES = ('.jpg', '.jpeg', '.png', '.tiff', '.tif')
+# Dateiendungen, für die get_capture_datetime ein Aufnahmedatum aus den Metadaten lesen kann
+CAPTURE_SUFFIXES = EXIF_SUFFIXES + VIDEO_SUFFIXES
+
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_OFFSET_TIME_ORIGINAL = 0x9011
+TAG_SUBSEC_TIME_ORIGINAL = 0x9291
+
+TYPE_ASCII = 2
+TYPE_LONG = 4
+TYPE_IFD = 13
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Obergrenze, wie weit vor dem ersten Bilddaten-Segment nach EXIF gesucht wird
+MAX_SCAN_BYTES = 256 * 1024
+# Schutz gegen kaputte IFDs mit absurden Eintragszahlen
+MAX_IFD_ENTRIES = 1024
+
+
+class ExifFormatError(ValueError):
+    """Container oder TIFF-Struktur ist defekt bzw. unbekannt."""
+
+
+class _Segment:
+    """Begrenzter Lesezugriff auf einen TIFF-Block innerhalb einer Datei."""
+
+    def __init__(self, f, base: int, size: Optional[int]):
+        self.f = f
+        self.base = base
+        self.size = size
+
+    def read(self, offset: int, length: int) -> bytes:
+        if offset < 0 or (self.size is not None and offset + length > self.size):
+            raise ExifFormatError(f"Offset {offset}+{length} außerhalb des EXIF-Blocks")
+        self.f.seek(self.base + offset)
+        data = self.f.read(length)
+        if len(data) != length:
+            raise ExifFormatError("EXIF-Block abgeschnitten")
+        return data
+
+
+def _read_ifd(seg: _Segment, endian: str, offset: int, wanted: set) -> dict:
+    """Liest die gewünschten Tags eines IFD als {tag: (typ, anzahl, rohwert)}.
+
+    IFD-Einträge sind nach Tag-Nummer sortiert, daher wird abgebrochen, sobald das
+    größte gesuchte Tag überschritten ist.
+    """
+    (count,) = struct.unpack(endian + 'H', seg.read(offset, 2))
+    if count > MAX_IFD_ENTRIES:
+        raise ExifFormatError(f"IFD mit {count} Einträgen")
+    entries = seg.read(offset + 2, 12 * count)
+    last = max(wanted)
+    found = {}
+    for i in range(count):
+        tag, typ, n = struct.unpack_from(endian + 'HHI', entries, 12 * i)
+        if tag in wanted:
+            found[tag] = (typ, n, entries[12 * i + 8:12 * i + 12])
+        elif tag > last:
+            break
+    return found
+
+
+def _ascii_value(seg: _Segment, endian: str, entry) -> Optional[str]:
+    typ, n, raw = entry
+    if typ != TYPE_ASCII or n == 0:
+        return None
+    if n <= 4:
+        data = raw[:n]
+    else:
+        (ptr,) = struct.unpack(endian + 'I', raw)
+        data = seg.read(ptr, n)
+    return data.split(b'\x00', 1)[0].decode('ascii', 'replace').strip() or None
+
+
+def _combine(value: str, subsec: Optional[str], offset: Optional[str]) -> Optional[datetime]:
+    """Baut aus den drei EXIF-Strings ein datetime (naiv oder mit Zeitzone)."""
+    try:
+        dt = datetime.strptime(value[:19], "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        # z.B. "0000:00:00 00:00:00" von Kameras ohne gestellte Uhr
+        return None
+    if subsec and subsec.isdigit():
+        dt = dt.replace(microsecond=int(subsec[:6].ljust(6, '0')))
+    if offset and len(offset) == 6 and offset[0] in '+-' and offset[3] == ':':
+        try:
+            delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[4:6]))
+            dt = dt.replace(tzinfo=timezone(delta if offset[0] == '+' else -delta))
+        except ValueError:
+            pass
+    return dt
+
+
+def _parse_tiff(seg: _Segment) -> Optional[datetime]:
+    header = seg.read(0, 8)
+    if header[:2] == b'II':
+        endian = '<'
+    elif header[:2] == b'MM':
+        endian = '>'
+    else:
+        raise ExifFormatError("Unbekannte Byte-Reihenfolge im TIFF-Header")
+    magic, ifd0 = struct.unpack(endian + 'HI', header[2:])
+    if magic != 42:
+        raise ExifFormatError("Kein TIFF-Header")
+
+    entry = _read_ifd(seg, endian, ifd0, {TAG_EXIF_IFD}).get(TAG_EXIF_IFD)
+    if entry is None:
+        return None
+    typ, _, raw = entry
+    if typ not in (TYPE_LONG, TYPE_IFD):
+        raise ExifFormatError("Ungültiger Exif-IFD-Zeiger")
+    (exif_ifd,) = struct.unpack(endian + 'I', raw)
+
+    tags = _read_ifd(seg, endian, exif_ifd,
+                     {TAG_DATETIME_ORIGINAL, TAG_OFFSET_TIME_ORIGINAL, TAG_SUBSEC_TIME_ORIGINAL})
+    if TAG_DATETIME_ORIGINAL not in tags:
+        return None
+    value = _ascii_value(seg, endian, tags[TAG_DATETIME_ORIGINAL])
+    if not value:
+        return None
+    subsec = tags.get(TAG_SUBSEC_TIME_ORIGINAL)
+    offset = tags.get(TAG_OFFSET_TIME_ORIGINAL)
+    return _combine(value,
+                    _ascii_value(seg, endian, subsec) if subsec else None,
+                    _ascii_value(seg, endian, offset) if offset else None)
+
+
+def _find_jpeg_exif(f) -> Optional[_Segment]:
+    pos = 2
+    while pos < MAX_SCAN_BYTES:
+        f.seek(pos)
+        head = f.read(4)
+        if len(head) < 4:
+            return None
+        if head[0] != 0xFF:
+            raise ExifFormatError(f"Ungültiger JPEG-Marker bei Offset {pos}")
+        marker = head[1]
+        if marker == 0xFF:
+            # Füllbyte
+            pos += 1
+            continue
+        if marker in (0xDA, 0xD9):
+            # Start of Scan / End of Image: ab hier keine Metadaten mehr
+            return None
+        (length,) = struct.unpack('>H', head[2:])
+        if length < 2:
+            raise ExifFormatError("Ungültige JPEG-Segmentlänge")
+        if marker == 0xE1 and length >= 8 + 6:
+            if f.read(6) == b'Exif\x00\x00':
+                return _Segment(f, pos + 4 + 6, length - 2 - 6)
+        pos += 2 + length
+    return None
+
+
+def _find_png_exif(f) -> Optional[_Segment]:
+    pos = len(PNG_SIGNATURE)
+    while pos < MAX_SCAN_BYTES:
+        f.seek(pos)
+        head = f.read(8)
+        if len(head) < 8:
+            return None
+        length, ctype = struct.unpack('>I4s', head)
+        if ctype == b'eXIf':
+            return _Segment(f, pos + 8, length)
+        if ctype in (b'IDAT', b'IEND'):
+            return None
+        pos += 12 + length
+    return None
+
+
+def read_exif_datetime(path: Path) -> Optional[datetime]:
+    """Liest DateTimeOriginal ausschließlich aus dem Datei-Header.
+
+    Gibt None zurück, wenn die Datei korrekt aufgebaut ist, aber kein Aufnahmedatum
+    enthält. Wirft ExifFormatError bei defekten/unbekannten Containern.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(8)
+        if magic[:2] == b'\xff\xd8':
+            seg = _find_jpeg_exif(f)
+        elif magic == PNG_SIGNATURE:
+            seg = _find_png_exif(f)
+        elif magic[:4] in (b'II*\x00', b'MM\x00*'):
+            seg = _Segment(f, 0, None)
+        else:
+            raise ExifFormatError("Unbekanntes Dateiformat")
+        if seg is None:
+            return None
+        try:
+            return _parse_tiff(seg)
+        except struct.error as e:
+            raise ExifFormatError(str(e)) from e
+
+
+def read_exif_datetime_pillow(path: Path) -> Optional[datetime]:
+    """Langsamer Referenzpfad über Pillow (voller EXIF-Parse)."""
+    from PIL import Image
+    with Image.open(path) as img:
+        exif_ifd = img.getexif().get_ifd(TAG_EXIF_IFD)
+        value = exif_ifd.get(TAG_DATETIME_ORIGINAL)
+        if not value:
+            return None
+        return _combine(str(value).strip('\x00 '),
+                        exif_ifd.get(TAG_SUBSEC_TIME_ORIGINAL),
+                        exif_ifd.get(TAG_OFFSET_TIME_ORIGINAL))
+
+
+def get_capture_datetime(path: Path) -> Optional[datetime]:
+    """Aufnahmezeitpunkt aus EXIF bzw. bei Videos aus dem mvhd-Header; Pillow nur als Fallback
+    für defekte Bilder.
+
+    Videos speichern UTC; zurückgegeben wird die lokale Zeit, damit das Datum zur
+    Ordnerstruktur der Fotos passt. Fehler beim Öffnen der Datei (OSError), defekte Videos
+    (VideoFormatError) und Fehler im Pillow-Fallback werden an den Aufrufer weitergereicht, der
+    dann z.B. auf das Änderungsdatum ausweicht.
+    """
+    if Path(path).suffix.lower() in VIDEO_SUFFIXES:
+        taken = read_video_datetime(path)
+        return taken.astimezone() if taken else None
+    try:
+        return read_exif_datetime(path)
+    except ExifFormatError:
+        return read_exif_datetime_pillow(path)
@@ -0,0 +1,259 @@
+"""
+file_watch.py
+
+Beobachtet einen Ordner (rekursiv) und meldet neue Dateien, sobald sie fertig geschrieben sind.
+- Linux: inotify (per ctypes, kein Zusatzpaket). Gemeldet werden IN_CLOSE_WRITE, IN_MOVED_TO und
+  IN_CREATE; neue Unterordner werden sofort mitbeobachtet und einmal gescannt.
+- Sonst Polling: alle poll_interval Sekunden ein os.scandir-Durchlauf über den Baum. Auch auf
+  Netzlaufwerken (SMB/NFS) nötig, da Schreibzugriffe anderer Rechner kein inotify-Ereignis auslösen.
+- Entprellen: Eine Datei gilt als fertig, wenn Größe und mtime seit settle Sekunden unverändert
+  sind. Dateien, die noch kopiert oder hochgeladen werden, bleiben solange zurückgestellt; leer
+  gebliebene Dateien werden danach verworfen statt gemeldet.
+- Backpressure: Fertige Dateien landen in einer begrenzten queue.Queue. Ist sie voll, blockiert der
+  Watcher, bis der Verbraucher nachkommt. Die Ereignisse stauen sich solange im Kernel; läuft dessen
+  Puffer über (IN_Q_OVERFLOW), wird der Baum einmal komplett neu gescannt, es geht also nichts verloren.
+
+Einträge der Queue: (pfad, erstmals gesehen, fertig) mit Zeitstempeln aus time.monotonic().
+"""
+
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Iterable
+
+DEFAULT_SETTLE = 2.0
+DEFAULT_POLL_INTERVAL = 5.0
+DEFAULT_QUEUE_SIZE = 64
+
+# Ab so vielen gemeldeten Dateien werden Einträge zu inzwischen verschobenen Dateien vergessen
+KNOWN_PRUNE = 50000
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+_EVENT = struct.Struct('iIII')
+
+
+class _Inotify:
+    """Minimaler inotify-Wrapper: ein Watch pro Ordner, Ereignisse als (Ordner, Name, Maske)."""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 fehlgeschlagen')
+        self.dirs = {}
+
+    def add(self, folder: str):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            # ENOSPC: fs.inotify.max_user_watches erreicht
+            raise OSError(errno, f"inotify_add_watch({folder}): {os.strerror(errno)}")
+        self.dirs[wd] = folder
+
+    def read(self, timeout: float):
+        """Wartet bis zu timeout Sekunden; None signalisiert einen Überlauf der Kernel-Queue."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return events
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, pos)
+                name = data[pos + _EVENT.size:pos + _EVENT.size + length].rstrip(b'\0')
+                pos += _EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if mask & IN_IGNORED:
+                    self.dirs.pop(wd, None)
+                elif wd in self.dirs:
+                    events.append((self.dirs[wd], os.fsdecode(name), mask))
+
+    def close(self):
+        os.close(self.fd)
+
+
+def has_inotify() -> bool:
+    return sys.platform.startswith('linux')
+
+
+class FileWatcher:
+    """Meldet fertig geschriebene Dateien mit passender Endung unter root in self.queue."""
+
+    def __init__(self, root: str, suffixes: Iterable[str], settle: float = DEFAULT_SETTLE,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 poll: bool = False, ignore: Iterable[str] = ()):
+        self.root = str(Path(root).resolve())
+        self.suffixes = {s.lower() for s in suffixes}
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.ignore = [str(Path(p).resolve()) for p in ignore if p]
+        # pfad -> [(größe, mtime_ns), erstmals gesehen, letzte Änderung]
+        self.pending = {}
+        # bereits gemeldete Dateien; verhindert Doppelmeldungen beim Polling
+        self.known = {}
+        self._prune_at = KNOWN_PRUNE
+        self.inotify = None
+        if not poll and has_inotify():
+            try:
+                self.inotify = _Inotify()
+            except OSError as e:
+                print(f"inotify nicht verfügbar ({e}), nutze Polling")
+        self.reported = 0
+        self.rescans = 0
+        self.blocked_seconds = 0.0
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='file-watcher', daemon=True)
+
+    @property
+    def mode(self) -> str:
+        return 'inotify' if self.inotify is not None else 'polling'
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.thread.join()
+        if self.inotify is not None:
+            self.inotify.close()
+
+    def _ignored(self, folder: str) -> bool:
+        return any(folder == p or folder.startswith(p + os.sep) for p in self.ignore)
+
+    def _scan(self, folder: str, now: float, watch: bool):
+        """Rekursiver Durchlauf; mit watch=True bekommt jeder Ordner einen inotify-Watch."""
+        if self._ignored(folder):
+            return
+        watch = watch and self.inotify is not None
+        if watch:
+            try:
+                self.inotify.add(folder)
+            except OSError as e:
+                print(f"{e}; wechsle zu Polling")
+                self.inotify.close()
+                self.inotify = None
+                watch = False
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    self._scan(entry.path, now, watch)
+                elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in self.suffixes:
+                    self._touch(entry.path, entry.stat(), now)
+            except OSError:
+                continue
+
+    def _touch(self, path: str, st: os.stat_result, now: float):
+        sig = (st.st_size, st.st_mtime_ns)
+        if self.known.get(path) == sig:
+            return
+        entry = self.pending.get(path)
+        if entry is None:
+            self.pending[path] = [sig, now, now]
+        elif entry[0] != sig:
+            entry[0] = sig
+            entry[2] = now
+
+    def _event(self, folder: str, name: str, mask: int, now: float):
+        path = os.path.join(folder, name)
+        if mask & IN_ISDIR:
+            # neuer oder hineinverschobener Ordner: beobachten und vorhandene Dateien erfassen
+            self._scan(path, now, watch=True)
+            return
+        if os.path.splitext(name)[1].lower() not in self.suffixes:
+            return
+        try:
+            self._touch(path, os.stat(path), now)
+        except OSError:
+            pass
+
+    def _check_pending(self, now: float):
+        for path, entry in list(self.pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            sig = (st.st_size, st.st_mtime_ns)
+            if sig != entry[0]:
+                entry[0] = sig
+                entry[2] = now
+            elif now - entry[2] >= self.settle:
+                del self.pending[path]
+                self.known[path] = sig
+                if not st.st_size:
+                    # leer geblieben (Platzhalter, abgebrochener Upload): nicht melden. Wird sie doch
+                    # noch beschrieben, ändert sich die Signatur und sie wird neu entprellt.
+                    continue
+                if not self._put((path, entry[1], now)):
+                    return
+        if len(self.known) > self._prune_at:
+            self.known = {p: s for p, s in self.known.items() if os.path.exists(p)}
+            self._prune_at = max(KNOWN_PRUNE, 2 * len(self.known))
+
+    def _put(self, item) -> bool:
+        """Blockiert, solange die Queue voll ist (Backpressure); False beim Beenden."""
+        start = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.queue.put(item, timeout=0.5)
+                    self.reported += 1
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            self.blocked_seconds += time.monotonic() - start
+
+    def _run(self):
+        self._scan(self.root, time.monotonic(), watch=self.inotify is not None)
+        next_poll = time.monotonic() + self.poll_interval
+        while not self._stop.is_set():
+            # solange Dateien entprellt werden, öfter nachsehen
+            tick = min(self.settle, self.poll_interval) / 2 if self.pending else 1.0
+            if self.inotify is not None:
+                events = self.inotify.read(tick)
+                now = time.monotonic()
+                if events is None:
+                    print("inotify-Queue übergelaufen, scanne neu...")
+                    self.rescans += 1
+                    self._scan(self.root, now, watch=True)
+                else:
+                    for folder, name, mask in events:
+                        self._event(folder, name, mask, now)
+            else:
+                self._stop.wait(tick)
+                now = time.monotonic()
+                if now >= next_poll:
+                    self._scan(self.root, now, watch=False)
+                    next_poll = now + self.poll_interval
+            self._check_pending(time.monotonic())
+
+    def stats(self) -> dict:
+        return {'mode': self.mode, 'reported': self.reported, 'pending': len(self.pending),
+                'queued': self.queue.qsize(), 'rescans': self.rescans,
+                'blocked_seconds': round(self.blocked_seconds, 2)}
+
@@ -0,0 +1,365 @@
+"""
+metrics.py
+
+Gemeinsame Instrumentierung für photo_sort.py, photo_insights.py, photo_rag.py und photo_watch.py:
+- Stages: Wall- und CPU-Zeit pro Aufruf als Histogramm mit festen Bucket-Grenzen (1 ms ... 60 s,
+  wie bei Prometheus) plus Summe, Anzahl und Maximum. CPU-Zeit ist per Default die des messenden
+  Threads (time.thread_time), bei Prozessen mit nur einem Analyse-Thread die des ganzen Prozesses,
+  damit Torch-/BLAS-Threads mitzählen. CPU deutlich unter Wall heißt: die Stage wartet auf I/O.
+- Zähler: Dateien, Fehler pro Stage, Bytes der Eingabedateien und (Linux, /proc/thread-self/io)
+  tatsächlich gelesene Bytes pro Stage; beliebige weitere Zähler mit Labels.
+- Report: JSON (.json) oder Prometheus-Textformat (.prom, für den textfile-Collector des
+  node_exporter), am Ende und alle interval Sekunden während des Laufs. Geschrieben wird atomar
+  (tmp + replace), ein Collector sieht also nie eine halbe Datei.
+- Profiling: jede profile_every-te Datei läuft unter cProfile; alle Stichproben landen zusammen in
+  einer .pstats-Datei (auswerten z.B. mit python -m pstats oder snakeviz).
+- Verbosity: 0 = nur Zusammenfassung, 1 = Fortschrittszeile alle PROGRESS_SECONDS, 2 = eine Zeile
+  pro Datei (bisheriges Verhalten). Bei sehr vielen kleinen Dateien bremst die Konsole sonst selbst.
+
+Worker-Prozesse messen in eigenen Metrics-Objekten; snapshot() und merge() übertragen die Werte
+zum Hauptprozess, der als einziger Reports schreibt.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Optional
+
+# Obergrenzen der Histogramm-Buckets in Sekunden; darüber zählt der +Inf-Bucket
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+QUIET, PROGRESS, PER_FILE = 0, 1, 2
+DEFAULT_VERBOSITY = PER_FILE
+PROGRESS_SECONDS = 5.0
+DEFAULT_INTERVAL = 60.0
+
+PROM_PREFIX = 'media'
+_THREAD_IO = '/proc/thread-self/io'
+
+
+def read_chars() -> Optional[int]:
+    """Vom aktuellen Thread gelesene Bytes (rchar, inkl. Page-Cache); None außerhalb von Linux."""
+    try:
+        with open(_THREAD_IO, 'rb') as f:
+            for line in f:
+                if line.startswith(b'rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+class Histogram:
+    """Bucket-Zähler für Dauern (Sekunden)."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: dict):
+        self.counts = [a + b for a, b in zip(self.counts, other['counts'])]
+        self.sum += other['sum']
+        self.count += other['count']
+        self.max = max(self.max, other['max'])
+
+    def quantile(self, q: float) -> float:
+        """Schätzung per linearer Interpolation innerhalb des Buckets."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                lo = BUCKETS[i - 1] if i else 0.0
+                hi = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(lo + (hi - lo) * (rank - seen) / c, self.max)
+            seen += c
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {'counts': list(self.counts), 'sum': self.sum, 'count': self.count, 'max': self.max}
+
+
+class _RawProfile:
+    """pstats.Stats akzeptiert Objekte mit create_stats() und stats; so lassen sich
+    gepickelte Profile aus Worker-Prozessen zusammenführen."""
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class Metrics:
+    """Stage-Zeiten, Zähler und Reports eines Pipeline-Laufs (thread-safe)."""
+
+    def __init__(self, pipeline: str, report_path: str = None, interval: float = DEFAULT_INTERVAL,
+                 verbosity: int = DEFAULT_VERBOSITY, profile_every: int = 0, profile_path: str = None,
+                 cpu_clock=time.thread_time):
+        self.pipeline = pipeline
+        self.report_path = report_path
+        self.interval = interval
+        self.verbosity = verbosity
+        self.profile_every = profile_every
+        self.profile_path = profile_path or f"{pipeline}.pstats"
+        self.cpu_clock = cpu_clock
+        self.wall = {}
+        self.cpu = {}
+        # (name, sortierte Labels) -> Wert
+        self.counters = {}
+        self.profiles = []
+        self._profile_calls = 0
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self._cpu_started = time.process_time()
+        self._last_write = self._last_progress = self.started
+
+    @classmethod
+    def from_args(cls, pipeline: str, args, **kwargs):
+        """Aus den Optionen von add_arguments()."""
+        return cls(pipeline, report_path=args.metrics, interval=args.metrics_interval, verbosity=args.verbosity,
+                   profile_every=args.profile_every, profile_path=args.profile_out, **kwargs)
+
+    # --- Messen ---------------------------------------------------------------------------------
+
+    @contextmanager
+    def stage(self, name: str, io: bool = False):
+        """Misst Wall- und CPU-Zeit; Ausnahmen zählen als Fehler der Stage. Mit io=True
+        zusätzlich die vom Thread gelesenen Bytes (nur Linux)."""
+        chars = read_chars() if io else None
+        wall, cpu = time.perf_counter(), self.cpu_clock()
+        try:
+            yield
+        except Exception:
+            self.count('errors', stage=name)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - wall, self.cpu_clock() - cpu)
+            if chars is not None:
+                self.count('read_bytes', (read_chars() or chars) - chars, stage=name)
+
+    def observe(self, name: str, wall: float, cpu: float = None):
+        """Dauer einer Stage, die außerhalb von stage() gemessen wurde."""
+        with self._lock:
+            self.wall.setdefault(name, Histogram()).observe(wall)
+            if cpu is not None:
+                self.cpu.setdefault(name, Histogram()).observe(cpu)
+
+    def count(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def counter(self, name: str, **labels) -> float:
+        """Summe über alle Labels bzw. nur über die angegebenen."""
+        want = set(labels.items())
+        with self._lock:
+            return sum(v for (n, lab), v in self.counters.items() if n == name and want <= set(lab))
+
+    def error(self, stage: str, message: str = None):
+        self.count('errors', stage=stage)
+        if message and self.verbosity >= PROGRESS:
+            print(message)
+
+    def file_done(self, size: int = 0, message: str = None):
+        """Eine fertig verarbeitete Datei; gibt message je nach Verbosity aus."""
+        self.count('files')
+        if size:
+            self.count('input_bytes', size)
+        if message and self.verbosity >= PER_FILE:
+            print(message)
+        self.tick()
+
+    def log(self, message: str):
+        """Ausgabe pro Datei, nur bei voller Verbosity."""
+        if self.verbosity >= PER_FILE:
+            print(message)
+
+    @contextmanager
+    def profile(self, enabled: bool = None):
+        """cProfile für diese Datei; enabled=None entscheidet per profile_every."""
+        if enabled is None:
+            with self._lock:
+                enabled = self.should_profile(self._profile_calls)
+                self._profile_calls += 1
+        profiler = None
+        if enabled:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # ab Python 3.12 nur ein aktiver Profiler pro Prozess: parallele Stichprobe auslassen
+                profiler = None
+        if profiler is None:
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.create_stats()
+            with self._lock:
+                self.profiles.append(profiler.stats)
+            self.count('profile_samples')
+
+    def should_profile(self, n: int) -> bool:
+        """Für Aufgaben, die in Worker-Prozessen laufen: n-te Datei (ab 0) profilieren?"""
+        return bool(self.profile_every) and n % self.profile_every == 0
+
+    # --- Worker-Prozesse ------------------------------------------------------------------------
+
+    def snapshot(self) -> dict:
+        """Picklebarer Stand (für die Übergabe aus einem Worker-Prozess)."""
+        with self._lock:
+            return {'wall': {k: h.to_dict() for k, h in self.wall.items()},
+                    'cpu': {k: h.to_dict() for k, h in self.cpu.items()},
+                    'counters': list(self.counters.items()), 'profiles': list(self.profiles)}
+
+    def merge(self, snapshot: dict):
+        with self._lock:
+            for target, key in ((self.wall, 'wall'), (self.cpu, 'cpu')):
+                for name, data in snapshot[key].items():
+                    target.setdefault(name, Histogram()).merge(data)
+            for key, value in snapshot['counters']:
+                self.counters[key] = self.counters.get(key, 0) + value
+            self.profiles.extend(snapshot['profiles'])
+
+    # --- Ausgabe --------------------------------------------------------------------------------
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def tick(self):
+        """Fortschrittszeile und periodischer Report, falls fällig."""
+        now = time.perf_counter()
+        if self.verbosity == PROGRESS and now - self._last_progress >= PROGRESS_SECONDS:
+            self._last_progress = now
+            print(self.progress_line())
+        if self.report_path and now - self._last_write >= self.interval:
+            self._last_write = now
+            self.write()
+
+    def progress_line(self) -> str:
+        files = self.counter('files')
+        elapsed = self.elapsed()
+        return (f"[{self.pipeline}] {int(files)} Dateien in {elapsed:.0f}s ({files / max(elapsed, 1e-9):.1f}/s), "
+                f"{int(self.counter('errors'))} Fehler")
+
+    def to_dict(self) -> dict:
+        elapsed = self.elapsed()
+        with self._lock:
+            stages = {}
+            for name, wall in self.wall.items():
+                cpu = self.cpu.get(name)
+                stages[name] = {'count': wall.count, 'wall_seconds': round(wall.sum, 6),
+                                'wall_p50': round(wall.quantile(0.5), 6), 'wall_p95': round(wall.quantile(0.95), 6),
+                                'wall_max': round(wall.max, 6), 'wall_buckets': wall.counts,
+                                'cpu_seconds': round(cpu.sum, 6) if cpu else None,
+                                'cpu_buckets': cpu.counts if cpu else None}
+            counters = [{'name': n, 'labels': dict(lab), 'value': v} for (n, lab), v in sorted(self.counters.items())]
+        files = self.counter('files')
+        return {'pipeline': self.pipeline, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'elapsed_seconds': round(elapsed, 3), 'process_cpu_seconds': round(time.process_time() - self._cpu_started, 3),
+                'files_per_second': round(files / max(elapsed, 1e-9), 3),
+                'input_mb_per_second': round(self.counter('input_bytes') / 1e6 / max(elapsed, 1e-9), 3),
+                'bucket_bounds': list(BUCKETS), 'stages': stages, 'counters': counters}
+
+    def to_prometheus(self) -> str:
+        data = self.to_dict()
+        base = f'pipeline="{self.pipeline}"'
+        lines = []
+
+        def histogram(metric: str, key: str):
+            lines.append(f"# TYPE {metric} histogram")
+            for stage, s in data['stages'].items():
+                if s[f'{key}_buckets'] is None:
+                    continue
+                cumulative = 0
+                for bound, c in zip(list(BUCKETS) + ['+Inf'], s[f'{key}_buckets']):
+                    cumulative += c
+                    lines.append(f'{metric}_bucket{{{base},stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{{base},stage="{stage}"}} {s[f"{key}_seconds"]}')
+                lines.append(f'{metric}_count{{{base},stage="{stage}"}} {cumulative}')
+
+        histogram(f"{PROM_PREFIX}_stage_wall_seconds", 'wall')
+        histogram(f"{PROM_PREFIX}_stage_cpu_seconds", 'cpu')
+        typed = set()
+        for c in data['counters']:
+            metric = f"{PROM_PREFIX}_{c['name']}_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            labels = ''.join(f',{k}="{v}"' for k, v in c['labels'].items())
+            lines.append(f'{metric}{{{base}{labels}}} {c["value"]}')
+        for gauge in ('elapsed_seconds', 'process_cpu_seconds', 'files_per_second', 'input_mb_per_second'):
+            lines.append(f"# TYPE {PROM_PREFIX}_{gauge} gauge")
+            lines.append(f'{PROM_PREFIX}_{gauge}{{{base}}} {data[gauge]}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str = None):
+        """Report als .prom (Prometheus-Text) oder sonst JSON, atomar ersetzt."""
+        path = path or self.report_path
+        if not path:
+            return
+        text = self.to_prometheus() if str(path).endswith('.prom') else json.dumps(self.to_dict(), indent=2)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def report(self):
+        """Zusammenfassung pro Stage für die Konsole."""
+        data = self.to_dict()
+        if not data['stages'] and not data['counters']:
+            return
+        print(f"Stage-Zeiten ({self.pipeline}, {data['elapsed_seconds']:.1f}s, "
+              f"{data['files_per_second']:.1f} Dateien/s, {data['input_mb_per_second']:.1f} MB/s):")
+        for name, s in data['stages'].items():
+            cpu = f"  CPU {s['cpu_seconds']:8.2f}s" if s['cpu_seconds'] is not None else ''
+            errors = int(self.counter('errors', stage=name))
+            print(f"  {name:<12} {s['wall_seconds']:8.2f}s{cpu}  ({s['count']} Aufrufe, "
+                  f"p50 {1000 * s['wall_p50']:.1f} ms, p95 {1000 * s['wall_p95']:.1f} ms"
+                  + (f", {errors} Fehler" if errors else '') + ")")
+        read = self.counter('read_bytes')
+        if read:
+            print(f"  gelesen: {read / 1e6:.1f} MB")
+
+    def close(self):
+        """Abschluss: Report schreiben, Profile zusammenführen, Zusammenfassung ausgeben."""
+        if self.report_path:
+            self.write()
+            print(f"Metriken geschrieben: {self.report_path}")
+        if self.profiles:
+            stats = pstats.Stats(_RawProfile(self.profiles[0]))
+            for raw in self.profiles[1:]:
+                stats.add(_RawProfile(raw))
+            stats.dump_stats(self.profile_path)
+            print(f"cProfile aus {len(self.profiles)} Stichproben: {self.profile_path}")
+            if self.verbosity >= PROGRESS:
+                stats.sort_stats('cumulative').print_stats(15)
+        self.report()
+
+
+def add_arguments(parser, verbosity: int = DEFAULT_VERBOSITY):
+    """Gemeinsame CLI-Optionen; auswerten mit Metrics.from_args()."""
+    parser.add_argument('--metrics', type=str, help='Metrik-Report schreiben (.prom = Prometheus-Text, sonst JSON)')
+    parser.add_argument('--metrics-interval', type=float, default=DEFAULT_INTERVAL,
+                        help='Report zusätzlich alle N Sekunden während des Laufs schreiben')
+    parser.add_argument('--verbosity', type=int, choices=(QUIET, PROGRESS, PER_FILE), default=verbosity,
+                        help='0 = nur Zusammenfassung, 1 = Fortschritt, 2 = eine Zeile pro Datei')
+    parser.add_argument('--profile-every', type=int, default=0, help='Jede N-te Datei mit cProfile messen (0 = aus)')
+    parser.add_argument('--profile-out', type=str, help='Ziel der cProfile-Daten (Default: <pipeline>.pstats)')
@@ -0,0 +1,112 @@
+"""
+video_meta.py
+
+Streaming-Parser für ISO-BMFF-Container (.mp4, .mov, .m4v, .3gp): liest Aufnahmezeitpunkt und
+Dauer aus dem Movie-Header (moov/mvhd), ohne die Datei zu laden.
+
+Der Container ist eine Folge von Boxen (Größe + Typ). Auf oberster Ebene wird über alle Boxen
+per seek gesprungen, auch über mdat mit den eigentlichen Videodaten, die oft vor moov liegen.
+Gelesen werden so nur die Box-Header und die ~100 Byte des mvhd, unabhängig von der Dateigröße.
+"""
+
+import os
+import struct
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional, Tuple
+
+VIDEO_SUFFIXES = ('.mp4', '.mov', '.m4v', '.3gp')
+
+# Zeitstempel in mvhd zählen Sekunden seit 1904-01-01 UTC
+MAC_EPOCH = datetime(1904, 1, 1, tzinfo=timezone.utc)
+
+# Box-Typen, mit denen eine gültige Datei beginnen kann (QuickTime erlaubt mehr als ftyp)
+FIRST_BOXES = {b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip', b'pnot', b'uuid'}
+
+# Schutz gegen kaputte Dateien mit endlosen Box-Ketten
+MAX_BOXES = 4096
+
+
+class VideoFormatError(ValueError):
+    """Container ist defekt oder kein ISO-BMFF."""
+
+
+def _boxes(f, start: int, end: int):
+    """Iteriert über (Typ, Nutzdaten-Offset, Box-Ende) der Boxen zwischen start und end."""
+    pos = start
+    for _ in range(MAX_BOXES):
+        if pos + 8 > end:
+            return
+        f.seek(pos)
+        head = f.read(8)
+        if len(head) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', head)
+        payload = pos + 8
+        if size == 1:
+            large = f.read(8)
+            if len(large) < 8:
+                raise VideoFormatError(f"Box {box_type!r} abgeschnitten")
+            (size,) = struct.unpack('>Q', large)
+            payload += 8
+        elif size == 0:
+            # letzte Box, reicht bis zum Dateiende
+            size = end - pos
+        if size < payload - pos:
+            raise VideoFormatError(f"Ungültige Größe {size} der Box {box_type!r} bei Offset {pos}")
+        yield box_type, payload, min(pos + size, end)
+        pos += size
+    raise VideoFormatError(f"Mehr als {MAX_BOXES} Boxen")
+
+
+def _find(f, box_type: bytes, start: int, end: int) -> Optional[Tuple[int, int]]:
+    for typ, payload, box_end in _boxes(f, start, end):
+        if typ == box_type:
+            return payload, box_end
+    return None
+
+
+def _parse_mvhd(data: bytes) -> Tuple[Optional[datetime], Optional[float]]:
+    version = data[0]
+    if version == 1:
+        created, _, timescale, duration = struct.unpack_from('>QQIQ', data, 4)
+    elif version == 0:
+        created, _, timescale, duration = struct.unpack_from('>IIII', data, 4)
+    else:
+        raise VideoFormatError(f"Unbekannte mvhd-Version {version}")
+    # 0 = nicht gesetzt (z.B. Bildschirmaufnahmen, manche Schnittprogramme)
+    taken = MAC_EPOCH + timedelta(seconds=created) if created else None
+    length = duration / timescale if timescale and duration not in (0, 0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF) else None
+    return taken, length
+
+
+def read_movie_header(path: Path) -> Optional[Tuple[Optional[datetime], Optional[float]]]:
+    """(Aufnahmezeitpunkt in UTC oder None, Dauer in Sekunden oder None) aus moov/mvhd.
+
+    Gibt None zurück, wenn der Container keinen Movie-Header enthält (z.B. fragmentiert ohne
+    moov oder abgebrochene Aufnahme). Wirft VideoFormatError bei unbekannten/defekten Dateien.
+    """
+    with open(path, 'rb') as f:
+        end = os.fstat(f.fileno()).st_size
+        if f.read(8)[4:8] not in FIRST_BOXES:
+            raise VideoFormatError("Kein ISO-BMFF-Container")
+        try:
+            moov = _find(f, b'moov', 0, end)
+            if moov is None:
+                return None
+            mvhd = _find(f, b'mvhd', *moov)
+            if mvhd is None:
+                return None
+            f.seek(mvhd[0])
+            data = f.read(min(mvhd[1] - mvhd[0], 32))
+            if len(data) < 4 + (28 if data[:1] == b'\x01' else 16):
+                raise VideoFormatError("mvhd abgeschnitten")
+            return _parse_mvhd(data)
+        except struct.error as e:
+            raise VideoFormatError(str(e)) from e
+
+
+def read_video_datetime(path: Path) -> Optional[datetime]:
+    """Aufnahmezeitpunkt (UTC, mit Zeitzone) aus dem mvhd; None wenn nicht gesetzt."""
+    header = read_movie_header(path)
+    return header[0] if header else None
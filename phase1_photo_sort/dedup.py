@@ -0,0 +1,183 @@
+"""
+dedup.py
+
+Erkennt byte-identische Dateien beim Sortieren, bevor sie in die YYYY-MM-DD Ordner wandern.
+
+Die Prüfung ist gestuft, damit nur wenige Dateien vollständig gelesen werden müssen:
+1. Gruppierung nach Dateigröße (kostet nur ein stat)
+2. Quick-Hash über den ersten und letzten Block
+3. Voller Hash nur für Dateien, die danach immer noch kollidieren
+
+Der Zielbaum wird in einem persistenten Hash-Katalog (SQLite) geführt. Bekannte Dateien
+mit unveränderter Größe/mtime werden nicht erneut gehasht.
+"""
+
+import os
+import sqlite3
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+# Blockgröße für Quick-Hash (Anfang + Ende der Datei)
+QUICK_BLOCK = 64 * 1024
+# Lesepuffer für volle Hashes
+HASH_CHUNK = 1024 * 1024
+
+CATALOG_NAME = '.photo_catalog.sqlite'
+QUARANTINE_NAME = '_duplicates'
+
+# off: keine Prüfung, skip: Duplikat in der Quelle lassen,
+# quarantine: in Quarantäne-Ordner verschieben, hardlink: Hardlink auf vorhandene Kopie statt zweiter Kopie
+POLICIES = ('off', 'skip', 'quarantine', 'hardlink')
+
+
+def quick_digest(path: Path, size: int) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(size.to_bytes(8, 'little'))
+    with open(path, 'rb') as f:
+        h.update(f.read(QUICK_BLOCK))
+        if size > QUICK_BLOCK:
+            f.seek(max(QUICK_BLOCK, size - QUICK_BLOCK))
+            h.update(f.read(QUICK_BLOCK))
+    return h.hexdigest()
+
+
+def full_digest(path: Path) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class HashCatalog:
+    """Persistenter Katalog (Pfad, Größe, mtime_ns, Quick-Hash, voller Hash) des Zielbaums."""
+
+    def __init__(self, root: Path, db_path: Optional[Path] = None):
+        self.root = Path(root)
+        self.db_path = Path(db_path) if db_path else self.root / CATALOG_NAME
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+            " quick TEXT, full TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS files_size ON files(size)")
+        self.conn.commit()
+
+    def _walk(self, folder: str):
+        with os.scandir(folder) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name != QUARANTINE_NAME:
+                        yield from self._walk(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    if entry.name.startswith(CATALOG_NAME) or entry.name.endswith('.partial'):
+                        continue
+                    yield entry
+
+    def refresh(self):
+        """Gleicht den Katalog per stat mit dem Zielbaum ab; geänderte Dateien verlieren ihre Hashes."""
+        if not self.root.exists():
+            return 0, 0
+        known = {p: (s, m) for p, s, m in self.conn.execute("SELECT path, size, mtime_ns FROM files")}
+        changed = []
+        for entry in self._walk(str(self.root)):
+            st = entry.stat(follow_symlinks=False)
+            if known.pop(entry.path, None) != (st.st_size, st.st_mtime_ns):
+                changed.append((entry.path, st.st_size, st.st_mtime_ns))
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, quick, full) VALUES (?, ?, ?, NULL, NULL)",
+                changed)
+            self.conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in known])
+        return len(changed), len(known)
+
+    def same_size(self, size: int) -> list:
+        rows = self.conn.execute("SELECT path, quick, full FROM files WHERE size = ?", (size,))
+        return [{'path': p, 'size': size, 'quick': q, 'full': f, 'known': True} for p, q, f in rows]
+
+    def update_hashes(self, items: list):
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE files SET quick = ?, full = ? WHERE path = ?",
+                [(i['quick'], i['full'], i['path']) for i in items])
+
+    def record_plan(self, plan: list):
+        """Übernimmt erfolgreich verschobene Dateien inkl. bereits berechneter Hashes in den Katalog."""
+        rows = []
+        for entry in plan:
+            dst = Path(entry['dst'])
+            if 'duplicate_of' in entry and entry.get('action') != 'hardlink':
+                continue
+            if self.root not in dst.parents:
+                continue
+            try:
+                st = dst.stat()
+            except OSError:
+                continue
+            rows.append((str(dst), st.st_size, st.st_mtime_ns, entry.get('quick'), entry.get('full')))
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, quick, full) VALUES (?, ?, ?, ?, ?)",
+                rows)
+
+    def close(self):
+        self.conn.close()
+
+
+def _fill(items: list, key: str, func, workers: int):
+    todo = [i for i in items if not i.get(key)]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for item, digest in zip(todo, pool.map(func, todo)):
+            item[key] = digest
+
+
+def _group(items: list, key: str) -> list:
+    groups = {}
+    for item in items:
+        groups.setdefault(item[key], []).append(item)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+def find_duplicates(plan: list, catalog: HashCatalog, workers: int = 1) -> int:
+    """Setzt 'duplicate_of' für Plan-Einträge, deren Inhalt schon im Katalog oder früher im Plan vorkommt."""
+    by_size = {}
+    for entry in plan:
+        entry['size'] = os.stat(entry['src']).st_size
+        by_size.setdefault(entry['size'], []).append(entry)
+
+    dupes = 0
+    for size, entries in by_size.items():
+        known = catalog.same_size(size)
+        if not known and len(entries) == 1:
+            continue
+        items = known + entries
+        _fill(items, 'quick', lambda i: quick_digest(Path(i.get('src') or i['path']), size), workers)
+        for group in _group(items, 'quick'):
+            _fill(group, 'full', lambda i: full_digest(Path(i.get('src') or i['path'])), workers)
+            for same in _group(group, 'full'):
+                # Original: bevorzugt eine Datei aus der Bibliothek, sonst die erste im Plan
+                original = next((i for i in same if i.get('known')), same[0])
+                keep = original['path'] if original.get('known') else original['dst']
+                for item in same:
+                    if item is not original and not item.get('known'):
+                        item['duplicate_of'] = keep
+                        dupes += 1
+        catalog.update_hashes([i for i in known if i['quick']])
+    return dupes
+
+
+def apply_policy(plan: list, policy: str, quarantine_dir: Path):
+    """Übersetzt 'duplicate_of' in die Aktion des Plan-Eintrags."""
+    for entry in plan:
+        if 'duplicate_of' not in entry:
+            continue
+        if policy == 'skip':
+            entry['action'] = 'skip'
+        elif policy == 'quarantine':
+            entry['dst'] = str(Path(quarantine_dir) / entry['date'] / Path(entry['src']).name)
+        elif policy == 'hardlink':
+            entry['action'] = 'hardlink'
@@ -5,67 +5,272 @@ Für eine detaillierte Dokumentation siehe: docs/PHASE1_PHOTO_SORT.md
 """
 
 import os
+import sys
+import json
 import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from PIL import Image, ExifTags
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from media_common.exif_date import CAPTURE_SUFFIXES, get_capture_datetime
+from media_common.metrics import Metrics, add_arguments as add_metrics_arguments
+from dedup import POLICIES, QUARANTINE_NAME, HashCatalog, apply_policy, find_duplicates, full_digest
+
 # Lade Pfade aus einer .env Datei
 load_dotenv()
 
-def get_media_date(file_path: Path) -> datetime.date:
+# Blockgröße für volume-übergreifendes Kopieren
+COPY_CHUNK = 1024 * 1024
+
+def get_media_date(file_path: Path, metrics: Metrics = None) -> datetime.date:
     """
     Extrahiert das Aufnahmedatum. 
-    1. Versuch: EXIF 'DateTimeOriginal' (Bilder)
-    2. Fallback: Änderungsdatum des Dateisystems (Videos/Collagen)
+    1. Versuch: EXIF 'DateTimeOriginal' (Bilder) bzw. mvhd-Erstellungszeit (Videos),
+       jeweils nur aus dem Datei-Header
+    2. Fallback: Änderungsdatum des Dateisystems (Collagen, Dateien ohne Metadaten)
     """
-    if file_path.suffix.lower() in ['.jpg', '.jpeg', '.png', '.tiff']:
+    if file_path.suffix.lower() in CAPTURE_SUFFIXES:
         try:
-            with Image.open(file_path) as img:
-                exif = img._getexif()
-                if exif:
-                    for tag, value in exif.items():
-                        tag_name = ExifTags.TAGS.get(tag, tag)
-                        if tag_name == "DateTimeOriginal":
-                            return datetime.strptime(value, "%Y:%m:%d %H:%M:%S").date()
+            taken = get_capture_datetime(file_path)
+            if taken:
+                return taken.date()
         except Exception as e:
-            print(f"Fehler beim Lesen der EXIF-Daten für {file_path.name}: {e}")
+            message = f"Fehler beim Lesen der Metadaten für {file_path.name}: {e}"
+            if metrics:
+                metrics.error('date', message)
+            else:
+                print(message)
 
-    # Fallback für Videos oder Dateien ohne EXIF
+    # Fallback für Dateien ohne Aufnahmedatum
     return datetime.fromtimestamp(file_path.stat().st_mtime).date()
 
-def organize_photos(source_dir: str, target_dir: str):
-    """Verschiebt Dateien in Datums-Ordner (YYYY-MM-DD)."""
+def _plan_entry(file_path: Path, target: Path, metrics: Metrics) -> dict:
+    with metrics.profile(), metrics.stage('date', io=True):
+        date = get_media_date(file_path, metrics)
+    folder_name = date.strftime("%Y-%m-%d")
+    return {
+        "src": str(file_path),
+        "dst": str(target / folder_name / file_path.name),
+        "date": folder_name,
+    }
+
+
+def build_move_plan(source_dir: str, target_dir: str, workers: int = 1, metrics: Metrics = None) -> list:
+    """Phase 1: Liest die Datumsangaben parallel (Thread-Pool) und liefert den kompletten Move-Plan."""
+    metrics = metrics or Metrics('photo_sort')
     source = Path(source_dir)
     target = Path(target_dir)
+    with metrics.stage('scan'):
+        files = [p for p in source.iterdir() if p.is_file()]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return list(pool.map(lambda p: _plan_entry(p, target, metrics), files))
+
+
+def save_plan(plan: list, plan_file: str):
+    with open(plan_file, 'w', encoding='utf-8') as f:
+        json.dump({"created": datetime.now().isoformat(timespec='seconds'), "moves": plan},
+                  f, ensure_ascii=False, indent=2)
+    print(f"Plan mit {len(plan)} Verschiebungen gespeichert: {plan_file}")
+
+
+def load_plan(plan_file: str) -> list:
+    with open(plan_file, 'r', encoding='utf-8') as f:
+        return json.load(f)["moves"]
+
+
+def _reserve(dst: Path):
+    """Legt dst exklusiv (O_EXCL) als leeren Platzhalter an.
+
+    Prüfung und Anlegen sind ein Schritt: von mehreren Workern mit demselben Zielnamen
+    gewinnt genau einer, alle anderen bekommen FileExistsError. Vorhandene Dateien werden
+    so nie überschrieben.
+    """
+    try:
+        os.close(os.open(dst, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        raise FileExistsError(f"Ziel existiert bereits: {dst}") from None
+
+
+def _copy_verify(src: Path, dst: Path):
+    """Volume-übergreifend: Kopie unter Temp-Namen, Prüfsumme vergleichen, dann auf den reservierten Namen umbenennen."""
+    partial = dst.with_name(dst.name + '.partial')
+    h = hashlib.blake2b(digest_size=20)
+    try:
+        with open(src, 'rb') as fin, open(partial, 'wb') as fout:
+            for chunk in iter(lambda: fin.read(COPY_CHUNK), b''):
+                h.update(chunk)
+                fout.write(chunk)
+        shutil.copystat(src, partial)
+        if full_digest(partial) != h.hexdigest():
+            raise IOError("Prüfsumme der Kopie stimmt nicht")
+        os.replace(partial, dst)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+
+
+def _execute_move(entry: dict, same_device: dict, metrics: Metrics):
+    src = Path(entry["src"])
+    dst = Path(entry["dst"])
+    action = entry.get("action", "move")
+    try:
+        if action == "skip":
+            metrics.count('duplicates_skipped')
+            metrics.log(f"Duplikat übersprungen: {src.name} (= {entry['duplicate_of']})")
+            return False
+        with metrics.profile(), metrics.stage('move', io=True):
+            st = src.stat()
+            if action == "hardlink" and dst.exists() and os.path.samefile(dst, entry["duplicate_of"]):
+                # gleicher Name und Tag: das Ziel ist die vorhandene Kopie selbst, nur die Quelle entfernen
+                src.unlink()
+            elif action == "hardlink":
+                # Inhalt liegt schon in der Bibliothek: nur verlinken, Quelle entfernen
+                # (os.link überschreibt nie, ein vorhandenes Ziel ergibt FileExistsError)
+                try:
+                    os.link(entry["duplicate_of"], dst)
+                except FileExistsError:
+                    raise FileExistsError(f"Ziel existiert bereits: {dst}") from None
+                src.unlink()
+            else:
+                # Zielnamen erst exklusiv reservieren; rename/replace ersetzt danach nur den eigenen Platzhalter
+                _reserve(dst)
+                same = same_device[dst.parent] == st.st_dev
+                try:
+                    if same:
+                        # Gleiches Volume: atomares Umbenennen, keine Datenkopie
+                        os.replace(src, dst)
+                    else:
+                        _copy_verify(src, dst)
+                except BaseException:
+                    dst.unlink(missing_ok=True)
+                    raise
+                if not same:
+                    src.unlink()
+                    metrics.count('copied_bytes', st.st_size)
+        metrics.file_done(st.st_size, f"Erfolg: {src.name} -> {entry['date']}")
+        return True
+    except Exception as e:
+        # unabhängig von der Verbosity melden, sonst fehlt die Datei nur stumm in der Zählung;
+        # als Fehler der Stage 'move' gezählt hat sie metrics.stage bereits
+        print(f"Fehler beim Verschieben von {src.name}: {e}", file=sys.stderr)
+        return False
+
+
+def execute_plan(plan: list, workers: int = 1, dry_run: bool = False, metrics: Metrics = None) -> int:
+    """Phase 2: Führt den Plan mit begrenzter Parallelität aus; gibt die Anzahl erfolgreicher Moves zurück."""
+    metrics = metrics or Metrics('photo_sort')
+    if dry_run:
+        for entry in plan:
+            action = entry.get("action", "move")
+            print(f"[Dry-Run] {Path(entry['src']).name} -> {entry['date']}"
+                  + (f" ({action}, Duplikat von {entry['duplicate_of']})" if "duplicate_of" in entry else ""))
+        return 0
+
+    # Jeden Datumsordner genau einmal anlegen und dessen Device merken
+    same_device = {}
+    for folder in sorted({Path(e["dst"]).parent for e in plan if e.get("action") != "skip"}):
+        folder.mkdir(parents=True, exist_ok=True)
+        same_device[folder] = folder.stat().st_dev
+
+    # Hardlinks erst nach den Moves, da sie auf Dateien aus demselben Plan zeigen können
+    moves = [e for e in plan if e.get("action") != "hardlink"]
+    links = [e for e in plan if e.get("action") == "hardlink"]
+    moved = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for batch in (moves, links):
+            moved += sum(pool.map(lambda e: _execute_move(e, same_device, metrics), batch))
+    return moved
+
+
+def sort_file(file_path: Path, target_dir: str, catalog: HashCatalog = None, dedup: str = 'off',
+              quarantine_dir: str = None, metrics: Metrics = None):
+    """Sortiert eine einzelne Datei sofort ein (Watch-Modus, siehe photo_watch.py).
+
+    Rückgabe: neuer Pfad in der Bibliothek oder None, wenn die Datei nicht verschoben wurde
+    (Fehler oder Duplikat laut dedup-Richtlinie).
+    """
+    metrics = metrics or Metrics('photo_sort')
+    plan = [_plan_entry(Path(file_path), Path(target_dir), metrics)]
+    if catalog:
+        with metrics.stage('dedup', io=True):
+            find_duplicates(plan, catalog)
+        apply_policy(plan, dedup, Path(quarantine_dir or Path(target_dir) / QUARANTINE_NAME))
+    if not execute_plan(plan, metrics=metrics):
+        return None
+    if catalog:
+        catalog.record_plan(plan)
+    return None if 'duplicate_of' in plan[0] else Path(plan[0]['dst'])
+
+
+def organize_photos(source_dir: str, target_dir: str, workers: int = 1, dry_run: bool = False,
+                    save_plan_file: str = None, from_plan_file: str = None,
+                    dedup: str = 'off', quarantine_dir: str = None, catalog_path: str = None,
+                    metrics: Metrics = None):
+    """Verschiebt Dateien in Datums-Ordner (YYYY-MM-DD).
+
+    Zweistufig: erst wird der komplette Move-Plan erstellt (oder aus einer geprüften
+    JSON-Datei geladen), danach wird er ausgeführt. Mit dedup != 'off' werden
+    byte-identische Dateien gegen den Hash-Katalog des Ziels geprüft. Stage-Zeiten und Zähler
+    landen in metrics (Zusammenfassung bzw. Report am Ende, siehe media_common/metrics.py).
+    """
+    metrics = metrics or Metrics('photo_sort')
+    catalog = HashCatalog(Path(target_dir), catalog_path) if dedup != 'off' and target_dir else None
+    if from_plan_file:
+        plan = load_plan(from_plan_file)
+    else:
+        source = Path(source_dir)
+        if not source.exists():
+            print(f"Quelle nicht gefunden: {source}")
+            return
+        plan = build_move_plan(source_dir, target_dir, workers, metrics)
+        if catalog:
+            with metrics.stage('catalog', io=True):
+                catalog.refresh()
+            with metrics.stage('dedup', io=True):
+                dupes = find_duplicates(plan, catalog, workers)
+            apply_policy(plan, dedup, Path(quarantine_dir or Path(target_dir) / QUARANTINE_NAME))
+            print(f"{dupes} Duplikate gefunden (Richtlinie: {dedup})")
+
+    if save_plan_file:
+        save_plan(plan, save_plan_file)
 
-    if not source.exists():
-        print(f"Quelle nicht gefunden: {source}")
-        return
-
-    for file_path in source.iterdir():
-        if file_path.is_file():
-            date = get_media_date(file_path)
-            folder_name = date.strftime("%Y-%m-%d")
-            
-            dest_folder = target / folder_name
-            dest_folder.mkdir(parents=True, exist_ok=True)
-            
-            try:
-                shutil.move(str(file_path), str(dest_folder / file_path.name))
-                print(f"Erfolg: {file_path.name} -> {folder_name}")
-            except Exception as e:
-                print(f"Fehler beim Verschieben von {file_path.name}: {e}")
+    moved = execute_plan(plan, workers=workers, dry_run=dry_run, metrics=metrics)
+    if not dry_run:
+        print(f"{moved} von {len(plan)} Dateien verschoben.")
+        if catalog:
+            catalog.record_plan(plan)
+    if catalog:
+        catalog.close()
+    metrics.close()
 
 if __name__ == "__main__":
+    import argparse
     # Pfade werden sicher aus der .env Datei oder Umgebungsvariablen gezogen
-    SOURCE = os.getenv("PHOTO_SOURCE")
-    TARGET = os.getenv("PHOTO_TARGET")
+    parser = argparse.ArgumentParser(description='Sortiert Fotos und Videos in YYYY-MM-DD Ordner')
+    parser.add_argument('--source', type=str, default=os.getenv("PHOTO_SOURCE"))
+    parser.add_argument('--target', type=str, default=os.getenv("PHOTO_TARGET"))
+    parser.add_argument('--workers', type=int, default=1, help='Parallele Threads für Scan und Verschieben')
+    parser.add_argument('--dry-run', action='store_true', help='Nur anzeigen, nichts verschieben')
+    parser.add_argument('--save-plan', type=str, help='Move-Plan als JSON speichern (zur Prüfung)')
+    parser.add_argument('--from-plan', type=str, help='Geprüften Move-Plan aus JSON ausführen')
+    parser.add_argument('--dedup', choices=POLICIES, default='off', help='Umgang mit byte-identischen Dateien')
+    parser.add_argument('--quarantine', type=str, help='Ordner für Duplikate (Default: <Ziel>/_duplicates)')
+    parser.add_argument('--catalog', type=str, help='Pfad des Hash-Katalogs (Default: <Ziel>/.photo_catalog.sqlite)')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
 
-    if SOURCE and TARGET:
-        print(f"Starte Sortierung von {SOURCE} nach {TARGET}...")
-        organize_photos(SOURCE, TARGET)
+    if args.from_plan or (args.source and args.target):
+        if args.from_plan:
+            print(f"Führe Move-Plan {args.from_plan} aus...")
+        else:
+            print(f"Starte Sortierung von {args.source} nach {args.target}...")
+        organize_photos(args.source, args.target, workers=args.workers, dry_run=args.dry_run,
+                        save_plan_file=args.save_plan, from_plan_file=args.from_plan,
+                        dedup=args.dedup, quarantine_dir=args.quarantine, catalog_path=args.catalog,
+                        metrics=Metrics.from_args('photo_sort', args))
         print("✅ Prozess abgeschlossen.")
     else:
         print("❌ Bitte PHOTO_SOURCE und PHOTO_TARGET in der .env Datei konfigurieren.")
@@ -0,0 +1,126 @@
+"""
+embedding_engine.py
+
+Gebatchte CLIP-Bild-Embeddings mit Prefetching:
+- Ein Thread-Pool liest, dekodiert und preprocesst die Bilder im Hintergrund.
+  JPEGs werden per Pillow-Draft-Modus direkt nahe der Zielgröße dekodiert.
+- Der Hauptthread führt die Modell-Inferenz unter torch.no_grad() auf vollen Batches aus.
+- Video-Frames laufen über denselben Weg, nur mit video_frames.FrameLoader als Loader
+  (ein Decode-Durchgang pro Video).
+- Am Ende werden Bilder/s sowie Wartezeit auf Decode vs. Inferenzzeit ausgegeben; mit einem
+  Metrics-Objekt landen die Zeiten zusätzlich als Stages decode/inference/decode_wait im Report.
+
+Wird von photo_rag.py (build_vector_db) genutzt.
+"""
+
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Tuple
+
+import numpy as np
+from PIL import Image
+
+from media_common.metrics import Metrics
+
+# CLIP ViT-B/32 erwartet 224x224
+CLIP_INPUT_SIZE = 224
+
+
+def load_for_clip(path: Path, size: int = CLIP_INPUT_SIZE) -> Image.Image:
+    """Öffnet ein Bild und dekodiert JPEGs im Draft-Modus (1/2, 1/4, 1/8) nahe der Zielgröße."""
+    with Image.open(path) as img:
+        img.draft('RGB', (size, size))
+        return img.convert('RGB')
+
+
+class BatchEmbedder:
+    """Berechnet CLIP-Bild-Embeddings in Batches, während der nächste Batch schon dekodiert wird."""
+
+    def __init__(self, processor, model, device: str = 'cpu', batch_size: int = 32,
+                 threads: int = 4, torch_threads: int = None, metrics: Metrics = None):
+        self.processor = processor
+        self.model = model
+        self.device = device
+        self.batch_size = max(1, batch_size)
+        self.threads = max(1, threads)
+        if torch_threads:
+            import torch
+            torch.set_num_threads(torch_threads)
+        self.metrics = metrics or Metrics('embedding_engine')
+        self.stats = {'images': 0, 'errors': 0, 'wait_s': 0.0, 'infer_s': 0.0, 'total_s': 0.0}
+
+    def _preprocess(self, path: Path, loader) -> np.ndarray:
+        # läuft im Decode-Thread; gemessen wird dessen CPU-Zeit und gelesene Bytes
+        with self.metrics.stage('decode', io=True):
+            image = loader(path)
+            if image is None:
+                return None
+            return self.processor(images=image, return_tensors='np')['pixel_values'][0]
+
+    def _infer(self, batch: list) -> np.ndarray:
+        import torch
+        start = time.perf_counter()
+        with self.metrics.stage('inference'):
+            pixel_values = torch.from_numpy(np.stack(batch)).to(self.device)
+            with torch.no_grad():
+                features = self.model.get_image_features(pixel_values=pixel_values)
+        self.stats['infer_s'] += time.perf_counter() - start
+        return features.cpu().numpy().astype('float32')
+
+    def embed(self, paths: Iterable[Path], loader: Callable = load_for_clip) -> Iterator[Tuple[Path, np.ndarray]]:
+        """Liefert (Pfad, Embedding) in Eingabereihenfolge; nicht lesbare Bilder werden übersprungen.
+
+        loader: Pfad/Schlüssel -> PIL-Bild, z.B. video_frames.FrameLoader für Video-Frames;
+        liefert er None, wird der Eintrag ohne Fehler übersprungen.
+        """
+        start = time.perf_counter()
+        # Höchstens zwei Batches im Voraus dekodieren, damit der Speicher begrenzt bleibt
+        window = 2 * self.batch_size
+        pending = deque()
+        batch_paths, batch = [], []
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            it = iter(paths)
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < window:
+                    try:
+                        p = next(it)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.append((p, pool.submit(self._preprocess, p, loader)))
+                if not pending:
+                    break
+                p, future = pending.popleft()
+                wait_start = time.perf_counter()
+                try:
+                    pixels = future.result()
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    self.metrics.log(f"✗ {Path(p).name}: {e}")
+                    continue
+                finally:
+                    waited = time.perf_counter() - wait_start
+                    self.stats['wait_s'] += waited
+                    self.metrics.observe('decode_wait', waited)
+                if pixels is None:
+                    continue
+                batch_paths.append(p)
+                batch.append(pixels)
+                if len(batch) == self.batch_size:
+                    yield from zip(batch_paths, self._infer(batch))
+                    self.stats['images'] += len(batch)
+                    batch_paths, batch = [], []
+            if batch:
+                yield from zip(batch_paths, self._infer(batch))
+                self.stats['images'] += len(batch)
+        self.stats['total_s'] = time.perf_counter() - start
+
+    def report(self):
+        s = self.stats
+        rate = s['images'] / s['total_s'] if s['total_s'] else 0.0
+        print(f"⏱  {s['images']} Bilder in {s['total_s']:.1f}s -> {rate:.1f} Bilder/s "
+              f"(Batch {self.batch_size}, {self.threads} Decode-Threads; "
+              f"Inferenz {s['infer_s']:.1f}s, Warten auf Decode {s['wait_s']:.1f}s, Fehler {s['errors']})")
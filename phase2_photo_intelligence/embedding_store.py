@@ -0,0 +1,344 @@
+"""
+embedding_store.py
+
+Persistenter Embedding-Speicher, den photo_insights.py und photo_rag.py gemeinsam nutzen:
+jedes Bild wird pro Modell genau einmal eingebettet.
+
+Ablage pro Modell in einem Ordner (Default: ./embedding_store bzw. EMBEDDING_STORE):
+- <modell>.f32        rohe float32-Matrix (Zeilen x dim), per np.memmap lesbar
+- <modell>.ids.jsonl  eine Zeile pro Matrixzeile: {"path", "size", "mtime_ns"}
+- <modell>.meta.json  Modellname und Dimension
+
+Beide Dateien sind append-only. Ändert sich eine Datei (Größe/mtime), wird eine neue Zeile
+angehängt; die alte Zeile bleibt bis zu compact() als Leiche liegen.
+
+Mehrere Prozesse (photo_insights, photo_rag, photo_watch) dürfen denselben Store nutzen:
+- Schreiben nur unter exklusiver Sperre (<modell>.lock, fcntl bzw. msvcrt). Wer die Sperre
+  bekommt, liest zuerst die Zeilen der anderen Prozesse nach und schneidet erst dann Reste
+  eines abgebrochenen Schreibvorgangs ab. flush()/close() geben die Sperre wieder frei.
+- Lesen ohne Sperre: es zählen nur Zeilen, die in beiden Dateien vollständig stehen; was ein
+  anderer Prozess gerade anhängt, wird ignoriert, nicht abgeschnitten.
+- compact() schreibt beide Dateien als .tmp und ersetzt erst die Vektoren, dann die IDs. Bricht
+  es dazwischen ab, gilt die neue ID-Tabelle aus der .tmp-Datei (beim nächsten Schreiben
+  übernommen); Vektoren und IDs passen also immer zusammen.
+
+Videos haben eine Zeile pro Keyframe unter dem Schlüssel '<pfad>#t=<sekunden>' (frame_key),
+mit Größe/mtime der Videodatei. has() und live() behandeln den Videopfad wie ein Bild und
+liefern alle Keyframes seiner aktuellen Version.
+"""
+
+import os
+import re
+import json
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_STORE_DIR = os.getenv("EMBEDDING_STORE", "embedding_store")
+
+# Modellname, unter dem die transformers-CLIP-Embeddings abgelegt werden
+CLIP_MODEL_NAME = 'openai/clip-vit-base-patch32'
+
+FRAME_MARK = '#t='
+
+# Schreiber sollten die Sperre spätestens alle N Zeilen per flush() freigeben
+FLUSH_EVERY = 50
+
+
+def frame_key(path, seconds: float) -> str:
+    """Schlüssel für das Embedding eines Video-Frames, z.B. 'clip.mp4#t=12.50'."""
+    return f"{path}{FRAME_MARK}{seconds:.2f}"
+
+
+def split_frame_key(key: str) -> Tuple[str, Optional[float]]:
+    """'clip.mp4#t=12.50' -> ('clip.mp4', 12.5); Bildpfade -> (pfad, None)."""
+    path, mark, seconds = str(key).rpartition(FRAME_MARK)
+    if mark:
+        try:
+            return path, float(seconds)
+        except ValueError:
+            pass
+    return str(key), None
+
+
+def _lock(f, blocking: bool) -> bool:
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            return True
+        except BlockingIOError:
+            return False
+    while True:
+        try:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.1)
+
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class EmbeddingStore:
+    """Append-only Embedding-Tabelle, adressiert über (Pfad, Größe, mtime_ns) und Modellname."""
+
+    def __init__(self, folder: str = DEFAULT_STORE_DIR, model_name: str = CLIP_MODEL_NAME):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        slug = re.sub(r'[^A-Za-z0-9._-]+', '_', model_name)
+        self.vec_path = self.folder / f'{slug}.f32'
+        self.ids_path = self.folder / f'{slug}.ids.jsonl'
+        self.meta_path = self.folder / f'{slug}.meta.json'
+        self.lock_path = self.folder / f'{slug}.lock'
+        self.vec_tmp = self.folder / f'{slug}.f32.tmp'
+        self.ids_tmp = self.folder / f'{slug}.ids.jsonl.tmp'
+        self.dim = None
+        self._reset(None)
+        self._vec_file = None
+        self._ids_file = None
+        self._lock_file = None
+        self._load()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _reset(self, vec_ino):
+        self.ids = []
+        self.rows = {}
+        # Videopfad -> Schlüssel seiner Keyframes
+        self.frames = {}
+        # gelesene Bytes der ID-Datei und Inode der Vektordatei (compact() ersetzt sie)
+        self._ids_offset = 0
+        self._vec_ino = vec_ino
+
+    def _vec_stat(self):
+        try:
+            return self.vec_path.stat()
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        """Liest neue Zeilen nach, aber nur so viele, wie die Vektordatei vollständig enthält."""
+        if self.dim is None and self.meta_path.exists():
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                self.dim = json.load(f)['dim']
+        for _ in range(3):
+            st = self._vec_stat()
+            ino = st.st_ino if st else None
+            if ino != self._vec_ino:
+                # ein anderer Prozess hat kompaktiert: Zeilennummern gelten nicht mehr
+                self._reset(ino)
+            vec_rows = st.st_size // (4 * self.dim) if st and self.dim else 0
+            if len(self.ids) < vec_rows:
+                self._read_ids(vec_rows)
+            st = self._vec_stat()
+            if (st.st_ino if st else None) == self._vec_ino:
+                return
+        raise RuntimeError(f"Embedding-Store {self.folder} ändert sich beim Laden ständig")
+
+    def _read_ids(self, limit: int):
+        # Bricht compact() zwischen den beiden os.replace ab, steht die passende ID-Tabelle noch in .tmp
+        sources = [self.ids_tmp, self.ids_path] if not self.vec_tmp.exists() else [self.ids_path]
+        for source in sources:
+            try:
+                f = open(source, 'rb')
+            except FileNotFoundError:
+                continue
+            with f:
+                f.seek(self._ids_offset)
+                for line in f:
+                    if len(self.ids) >= limit or not line.endswith(b'\n'):
+                        break
+                    try:
+                        ident = json.loads(line)
+                    except ValueError:
+                        break
+                    self.ids.append(ident)
+                    self._register(ident['path'], len(self.ids) - 1)
+                    self._ids_offset += len(line)
+            return
+
+    def _register(self, key: str, row: int):
+        self.rows[key] = row
+        video, seconds = split_frame_key(key)
+        if seconds is not None:
+            self.frames.setdefault(video, set()).add(key)
+
+    def frame_rows(self, path) -> list:
+        """Zeilen der Keyframes eines Videos, nur die der zuletzt eingebetteten Dateiversion."""
+        rows = sorted(self.rows[key] for key in self.frames.get(str(path), ()))
+        if not rows:
+            return []
+        newest = self.ids[rows[-1]]
+        return [r for r in rows
+                if (self.ids[r]['size'], self.ids[r]['mtime_ns']) == (newest['size'], newest['mtime_ns'])]
+
+    def _acquire(self):
+        """Schreibsperre holen, fremde Zeilen nachladen, Reste abgebrochener Schreibvorgänge entfernen."""
+        if self._lock_file is not None:
+            return
+        self._lock_file = open(self.lock_path, 'a+b')
+        if not _lock(self._lock_file, blocking=False):
+            print(f"Embedding-Store {self.folder} wird gerade von einem anderen Prozess beschrieben, warte...")
+            _lock(self._lock_file, blocking=True)
+        self._finish_compact()
+        self._load()
+        self._truncate()
+        self._vec_file = open(self.vec_path, 'ab')
+        self._ids_file = open(self.ids_path, 'ab')
+
+    def _finish_compact(self):
+        """Nur unter Sperre: abgebrochenes compact() zu Ende führen bzw. verwerfen."""
+        if self.vec_tmp.exists():
+            # vor dem ersten os.replace abgebrochen: die alten Dateien gelten
+            self.vec_tmp.unlink()
+            self.ids_tmp.unlink(missing_ok=True)
+        elif self.ids_tmp.exists():
+            os.replace(self.ids_tmp, self.ids_path)
+
+    def _truncate(self):
+        """Nur unter Sperre: beide Dateien auf die gelesenen, vollständigen Zeilen kürzen."""
+        if self.ids_path.exists() and self.ids_path.stat().st_size != self._ids_offset:
+            with open(self.ids_path, 'r+b') as f:
+                f.truncate(self._ids_offset)
+        size = len(self.ids) * 4 * (self.dim or 0)
+        st = self._vec_stat()
+        if st and st.st_size != size:
+            with open(self.vec_path, 'r+b') as f:
+                f.truncate(size)
+
+    def _row(self, path: str, st: os.stat_result) -> Optional[int]:
+        row = self.rows.get(path)
+        if row is None:
+            # Video: gültig, wenn die Keyframes zur aktuellen Dateiversion gehören
+            frames = self.frame_rows(path)
+            row = frames[-1] if frames else None
+        if row is None:
+            return None
+        ident = self.ids[row]
+        if ident['size'] != st.st_size or ident['mtime_ns'] != st.st_mtime_ns:
+            return None
+        return row
+
+    def has(self, path, st: os.stat_result) -> bool:
+        return self._row(str(path), st) is not None
+
+    def get(self, path, st: os.stat_result) -> Optional[np.ndarray]:
+        self.flush()
+        self._load()
+        row = self._row(str(path), st)
+        if row is None:
+            return None
+        with open(self.vec_path, 'rb') as f:
+            f.seek(row * 4 * self.dim)
+            return np.frombuffer(f.read(4 * self.dim), dtype='float32')
+
+    def add(self, path, st: os.stat_result, vector):
+        vector = np.asarray(vector, dtype='float32').reshape(-1)
+        self._acquire()
+        if self.dim is None:
+            self.dim = int(vector.shape[0])
+            with open(self.meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'model': self.model_name, 'dim': self.dim}, f)
+        elif vector.shape[0] != self.dim:
+            raise ValueError(f"Embedding-Dimension {vector.shape[0]} passt nicht zu {self.dim}")
+        ident = {'path': str(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        line = (json.dumps(ident, ensure_ascii=False) + '\n').encode('utf-8')
+        # Erst der Vektor, dann die ID: beim Laden zählt nur, was in beiden Dateien steht
+        self._vec_file.write(vector.tobytes())
+        self._ids_file.write(line)
+        self.ids.append(ident)
+        self._ids_offset += len(line)
+        self._register(ident['path'], len(self.ids) - 1)
+
+    def flush(self):
+        """Schreibt gepufferte Zeilen und gibt die Schreibsperre frei."""
+        if self._vec_file is not None:
+            self._vec_file.close()
+            self._ids_file.close()
+            self._vec_file = self._ids_file = None
+        if self._lock_file is not None:
+            _unlock(self._lock_file)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def close(self):
+        self.flush()
+
+    def vectors(self) -> np.ndarray:
+        """Alle Zeilen als read-only memmap (inkl. veralteter Zeilen)."""
+        self.flush()
+        if not self.ids:
+            return np.empty((0, self.dim or 0), dtype='float32')
+        return np.memmap(self.vec_path, dtype='float32', mode='r', shape=(len(self.ids), self.dim))
+
+    def live(self, paths=None, only_existing: bool = False):
+        """Aktuelle Zeile je Pfad (optional eingeschränkt auf paths) -> (Zeilenindizes, Schlüssel).
+
+        Videos werden zu den Schlüsseln ihrer aktuellen Keyframes aufgelöst.
+        """
+        self._load()
+        paths = [str(p) for p in paths] if paths is not None else \
+            [p for p in self.rows if split_frame_key(p)[1] is None] + list(self.frames)
+        wanted = {}
+        for p in paths:
+            if p in self.rows:
+                wanted[p] = self.rows[p]
+            for row in self.frame_rows(p):
+                wanted[self.ids[row]['path']] = row
+        items = sorted(wanted.items(), key=lambda kv: kv[1])
+        if only_existing:
+            items = [(p, r) for p, r in items if Path(split_frame_key(p)[0]).exists()]
+        return np.array([r for _, r in items], dtype='int64'), [p for p, _ in items]
+
+    def dead_rows(self) -> int:
+        """Veraltete Zeilen und Zeilen gelöschter Dateien, die compact() entfernen würde."""
+        return len(self.ids) - len(self.live(only_existing=True)[0])
+
+    def compact(self, only_existing: bool = True):
+        """Schreibt nur die aktuellen Zeilen neu und entfernt Leichen/gelöschte Dateien."""
+        self._acquire()
+        try:
+            rows, _ = self.live(only_existing=only_existing)
+            self._vec_file.close()
+            self._ids_file.close()
+            self._vec_file = self._ids_file = None
+            vectors = np.empty((0, self.dim or 0), dtype='float32')
+            if len(rows):
+                matrix = np.memmap(self.vec_path, dtype='float32', mode='r', shape=(len(self.ids), self.dim))
+                vectors = np.array(matrix[rows])
+                del matrix
+            with open(self.vec_tmp, 'wb') as f:
+                f.write(vectors.astype('float32').tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.ids_tmp, 'wb') as f:
+                for r in rows:
+                    f.write((json.dumps(self.ids[r], ensure_ascii=False) + '\n').encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            # Reihenfolge ist wichtig, siehe Modul-Docstring und _finish_compact
+            os.replace(self.vec_tmp, self.vec_path)
+            os.replace(self.ids_tmp, self.ids_path)
+            self._reset(None)
+            self._load()
+        finally:
+            self.flush()
+        return len(self.ids)
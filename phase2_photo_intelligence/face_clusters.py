@@ -0,0 +1,390 @@
+"""
+face_clusters.py
+
+Gruppiert alle Face-Encodings des Insights-Index zu Identitäten, ohne vorher bekannte Gesichter:
+- k-NN-Graph statt F x F-Distanzmatrix: bis EXACT_MAX Gesichter exakt (blockweise Matmul),
+  darüber approximativ über Zellen eines k-Means-Grobquantisierers (jedes Gesicht liegt in
+  seinen NPROBE nächsten Zellen, gesucht wird nur innerhalb der Zellen, IVF-artig).
+  Kanten bleiben nur, wenn die echte L2-Distanz <= threshold ist (wie bei --find-person).
+- Clustering per Chinese Whispers (vektorisiert über alle Knoten je Runde) oder als
+  Zusammenhangskomponenten des Graphen ('components', strenger verkettend).
+- Inkrementell: bei weiteren Index-Läufen werden nur neue Gesichter gegen alle vorhandenen
+  gesucht und den bestehenden Clustern zugeordnet; alte Labels und Namen bleiben stabil.
+- Ein Name für ein Gesicht benennt den ganzen Cluster (name_face); benannte Cluster stehen
+  photo_rag als Personen-Filter zur Verfügung (metadata_filter.py).
+
+Gespeichert wird neben dem Index in <index>.clusters.npz (nicht im .idx-Ordner, der bei jedem
+Lauf neu geschrieben wird). Gesichter werden über (Pfad, mtime_ns, Nummer im Bild) erkannt.
+"""
+
+import os
+import json
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from face_search import stack_encodings
+
+CLUSTER_METHODS = ('whispers', 'components')
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_K = 10
+# Bis hierhin ist der exakte k-NN-Graph billiger als das Training der Zellen
+EXACT_MAX = 20000
+# Zellen, in denen jedes Gesicht liegt (mehr = besserer Recall, quadratisch teurer je Zelle)
+NPROBE = 2
+KMEANS_ITER = 10
+KMEANS_TRAIN = 65536
+# Anfragen x Basis je Block: 1024 x 16384 float32 = 64 MB
+QUERY_BLOCK = 1024
+BASE_BLOCK = 16384
+WHISPERS_ITER = 30
+
+
+def clusters_path(index_path) -> str:
+    return str(index_path).rstrip('/\\') + '.clusters.npz'
+
+
+def face_table(index):
+    """(Encodings, Pfade, mtime_ns je Bild, Bild je Gesicht, Nummer des Gesichts im Bild)."""
+    encodings, image_ids, paths = stack_encodings(index)
+    if hasattr(index, 'columns'):
+        mtimes = np.asarray([m or 0 for m in index.columns['mtime_ns']], dtype='int64')
+    else:
+        mtimes = np.asarray([index[p].get('mtime_ns') or 0 for p in paths], dtype='int64')
+    image_ids = np.asarray(image_ids, dtype='int64')
+    # Gesichter eines Bildes liegen hintereinander
+    slots = np.arange(len(image_ids)) - np.searchsorted(image_ids, image_ids)
+    return encodings, paths, mtimes, image_ids, slots
+
+
+def _sq_norms(x: np.ndarray) -> np.ndarray:
+    return np.einsum('ij,ij->i', x, x)
+
+
+def _smallest(d2: np.ndarray, k: int, ids: np.ndarray):
+    """Die k kleinsten Werte je Zeile (unsortiert) samt zugehöriger IDs."""
+    ids = np.broadcast_to(ids, d2.shape)
+    if d2.shape[1] <= k:
+        return d2, ids
+    top = np.argmin(d2, axis=1)[:, None] if k == 1 else np.argpartition(d2, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(d2, top, axis=1), np.take_along_axis(ids, top, axis=1)
+
+
+def exact_knn(queries: np.ndarray, base: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """k nächste Basis-Vektoren je Anfrage (IDs, L2-Distanzen), blockweise ohne volle Matrix."""
+    k = min(k, len(base))
+    ids = np.empty((len(queries), k), dtype='int64')
+    dist = np.empty((len(queries), k), dtype='float32')
+    base_sq = _sq_norms(base)
+    for qs in range(0, len(queries), QUERY_BLOCK):
+        q = np.asarray(queries[qs:qs + QUERY_BLOCK], dtype='float32')
+        q_sq = _sq_norms(q)
+        best_ids = np.empty((len(q), 0), dtype='int64')
+        best_d2 = np.empty((len(q), 0), dtype='float32')
+        for bs in range(0, len(base), BASE_BLOCK):
+            b = base[bs:bs + BASE_BLOCK]
+            d2 = q_sq[:, None] + base_sq[None, bs:bs + len(b)] - 2.0 * (q @ b.T)
+            block_d2, block_ids = _smallest(d2, k, np.arange(bs, bs + len(b)))
+            best_d2, best_ids = _smallest(np.concatenate([best_d2, block_d2], axis=1), k,
+                                          np.concatenate([best_ids, block_ids], axis=1))
+        ids[qs:qs + len(q)] = best_ids
+        dist[qs:qs + len(q)] = np.sqrt(np.maximum(best_d2, 0.0))
+    return ids, dist
+
+
+def _kmeans(vectors: np.ndarray, clusters: int, seed: int = 0) -> np.ndarray:
+    """Einfaches k-Means auf einer Stichprobe; liefert die Zentroiden."""
+    rng = np.random.default_rng(seed)
+    sample = vectors[np.sort(rng.choice(len(vectors), min(len(vectors), KMEANS_TRAIN), replace=False))]
+    sample = np.asarray(sample, dtype='float32')
+    centroids = sample[rng.choice(len(sample), clusters, replace=False)].copy()
+    for _ in range(KMEANS_ITER):
+        assign = exact_knn(sample, centroids, 1)[0][:, 0]
+        order = np.argsort(assign, kind='stable')
+        filled, starts, counts = np.unique(assign[order], return_index=True, return_counts=True)
+        # leere Zellen behalten ihren alten Zentroiden
+        centroids[filled] = np.add.reduceat(sample[order], starts) / counts[:, None]
+    return centroids
+
+
+def _cell_knn(encodings: np.ndarray, k: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Approximative k-NN-Kandidaten (Zeile, Nachbar, Distanz) über k-Means-Zellen."""
+    n = len(encodings)
+    # Zellgröße ~ NPROBE * sqrt(n): Zuordnung und Suche in den Zellen kosten dann etwa gleich viel
+    cells = max(1, min(int(np.sqrt(n)) * NPROBE, n // 64))
+    centroids = _kmeans(encodings, cells, seed)
+    probes = exact_knn(encodings, centroids, NPROBE)[0]
+    members = np.repeat(np.arange(n), probes.shape[1])
+    cell_of = probes.ravel()
+    order = np.argsort(cell_of, kind='stable')
+    members, cell_of = members[order], cell_of[order]
+    bounds = np.flatnonzero(np.r_[True, cell_of[1:] != cell_of[:-1], True])
+    rows, cols, dists = [], [], []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        ids = members[start:stop]
+        vectors = np.asarray(encodings[ids], dtype='float32')
+        nn, d = exact_knn(vectors, vectors, k + 1)
+        rows.append(np.repeat(ids, nn.shape[1]))
+        cols.append(ids[nn].ravel())
+        dists.append(d.ravel())
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(dists)
+
+
+def knn_graph(encodings: np.ndarray, k: int = DEFAULT_K, threshold: float = DEFAULT_THRESHOLD,
+              exact: bool = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Ungerichteter k-NN-Graph als Kantenlisten (a, b, Distanz) mit a < b und Distanz <= threshold."""
+    n = len(encodings)
+    if n < 2:
+        return np.empty(0, dtype='int64'), np.empty(0, dtype='int64'), np.empty(0, dtype='float32')
+    if exact is None:
+        exact = n <= EXACT_MAX
+    if exact:
+        nn, d = exact_knn(encodings, encodings, k + 1)
+        rows, cols, dists = np.repeat(np.arange(n), nn.shape[1]), nn.ravel(), d.ravel()
+    else:
+        rows, cols, dists = _cell_knn(encodings, k)
+    keep = (rows != cols) & (dists <= threshold)
+    rows, cols, dists = rows[keep], cols[keep], dists[keep]
+    # je Gesicht nur die k nächsten (ein Gesicht kann aus mehreren Zellen Kandidaten haben)
+    order = np.lexsort((cols, dists, rows))
+    rows, cols, dists = rows[order], cols[order], dists[order]
+    fresh = np.r_[True, (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])]
+    rows, cols, dists = rows[fresh], cols[fresh], dists[fresh]
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+    rows, cols, dists = rows[rank < k], cols[rank < k], dists[rank < k]
+    a, b = np.minimum(rows, cols), np.maximum(rows, cols)
+    pairs, first = np.unique(a * n + b, return_index=True)
+    return pairs // n, pairs % n, dists[first]
+
+
+def chinese_whispers(n: int, a: np.ndarray, b: np.ndarray, weights: np.ndarray, labels: np.ndarray = None,
+                     frozen: np.ndarray = None, iterations: int = WHISPERS_ITER, seed: int = 0) -> np.ndarray:
+    """Chinese Whispers: jeder Knoten übernimmt das Label mit dem höchsten Kantengewicht seiner Nachbarn.
+
+    Pro Runde wird eine zufällige Hälfte der Knoten gleichzeitig aktualisiert (statt seriell
+    Knoten für Knoten), das verhindert Oszillation zwischen zwei Labels. Knoten in frozen
+    behalten ihr Label (inkrementelle Zuordnung zu bestehenden Clustern).
+    """
+    labels = np.arange(n) if labels is None else np.array(labels, dtype='int64')
+    if not len(a):
+        return labels
+    src = np.concatenate([a, b])
+    dst = np.concatenate([b, a])
+    weights = np.concatenate([weights, weights]).astype('float64')
+    movable = np.ones(n, dtype=bool) if frozen is None else ~frozen
+    keep = movable[src]
+    src, dst, weights = src[keep], dst[keep], weights[keep]
+    rng = np.random.default_rng(seed)
+    quiet = 0
+    for _ in range(iterations):
+        span = int(labels.max()) + 1
+        key = src * span + labels[dst]
+        order = np.argsort(key, kind='stable')
+        key = key[order]
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+        totals = np.add.reduceat(weights[order], starts)
+        node, label = key[starts] // span, key[starts] % span
+        # stärkstes Label je Knoten, bei Gleichstand das kleinere (Gruppen sind nach Label sortiert)
+        first = np.flatnonzero(np.r_[True, node[1:] != node[:-1]])
+        strongest = np.repeat(np.maximum.reduceat(totals, first), np.diff(np.r_[first, len(node)]))
+        best = np.flatnonzero(totals == strongest)
+        best = best[np.r_[True, node[best][1:] != node[best][:-1]]]
+        node, label = node[best], label[best]
+        update = rng.random(len(node)) < 0.5
+        node, label = node[update], label[update]
+        changed = labels[node] != label
+        labels[node] = label
+        quiet = quiet + 1 if not changed.any() else 0
+        if quiet >= 2:
+            break
+    return labels
+
+
+def cluster_labels(n: int, a: np.ndarray, b: np.ndarray, distances: np.ndarray, threshold: float,
+                   method: str = 'whispers', labels: np.ndarray = None, frozen: np.ndarray = None) -> np.ndarray:
+    if method not in CLUSTER_METHODS:
+        raise ValueError(f"Unbekannte Cluster-Methode {method!r}, erlaubt: {', '.join(CLUSTER_METHODS)}")
+    if method == 'components':
+        from near_duplicates import connected_components
+        if labels is None:
+            return connected_components(n, a, b)
+        # bestehende Labels gewinnen gegen neue (Komponenten-Minimum über frozen-Knoten)
+        start = np.where(frozen, labels, labels.max() + 1 + np.arange(n))
+        components = connected_components(n, a, b)
+        low = np.full(n, np.iinfo('int64').max)
+        np.minimum.at(low, components, start)
+        return np.where(frozen, labels, low[components])
+    # nähere Nachbarn zählen mehr, keine Kante unter der Schwelle wird ganz wertlos
+    weights = 1.0 - distances / (2.0 * threshold)
+    return chinese_whispers(n, a, b, weights, labels=labels, frozen=frozen)
+
+
+class FaceClusters:
+    """Cluster-Label je Gesicht plus Namen je Cluster."""
+
+    def __init__(self, paths: List[str], mtimes: np.ndarray, face_image: np.ndarray, face_slot: np.ndarray,
+                 labels: np.ndarray, names: Dict[int, str] = None, params: dict = None):
+        self.paths = list(paths)
+        self.mtimes = np.asarray(mtimes, dtype='int64')
+        self.face_image = np.asarray(face_image, dtype='int64')
+        self.face_slot = np.asarray(face_slot, dtype='int64')
+        self.labels = np.asarray(labels, dtype='int64')
+        self.names = dict(names or {})
+        self.params = dict(params or {})
+
+    def __len__(self):
+        return len(self.labels)
+
+    def keys(self) -> List[tuple]:
+        return [(self.paths[i], int(self.mtimes[i]), int(s)) for i, s in zip(self.face_image, self.face_slot)]
+
+    def members(self, label: int) -> np.ndarray:
+        return np.flatnonzero(self.labels == label)
+
+    def label_of(self, path: str, slot: int = 0) -> Optional[int]:
+        try:
+            image = self.paths.index(str(path))
+        except ValueError:
+            return None
+        hit = np.flatnonzero((self.face_image == image) & (self.face_slot == slot))
+        return int(self.labels[hit[0]]) if len(hit) else None
+
+    def name(self, label: int, name: Optional[str]):
+        """Benennt einen Cluster (None entfernt den Namen)."""
+        if name:
+            self.names[int(label)] = name
+        else:
+            self.names.pop(int(label), None)
+
+    def person_paths(self) -> Dict[str, List[str]]:
+        """Name -> Bildpfade aller Gesichter der gleichnamigen Cluster."""
+        result = {}
+        for label, name in self.names.items():
+            images = np.unique(self.face_image[self.labels == label])
+            result.setdefault(name, set()).update(self.paths[i] for i in images)
+        return {name: sorted(paths) for name, paths in result.items()}
+
+    def summary(self, min_size: int = 2, examples: int = 5) -> List[dict]:
+        """Cluster ab min_size Gesichtern (benannte immer), größte zuerst."""
+        if not len(self.labels):
+            return []
+        order = np.argsort(self.labels, kind='stable')
+        sorted_labels = self.labels[order]
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        counts = np.diff(np.r_[starts, len(order)])
+        result = []
+        for start, count in zip(starts, counts):
+            label = int(sorted_labels[start])
+            if count < min_size and label not in self.names:
+                continue
+            images = list(dict.fromkeys(self.paths[i] for i in self.face_image[order[start:start + count]]))
+            result.append({'cluster': label, 'name': self.names.get(label), 'faces': int(count),
+                           'images': len(images), 'examples': images[:examples]})
+        result.sort(key=lambda c: (-c['faces'], c['cluster']))
+        return result
+
+    def save(self, path: str):
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, paths=np.array(json.dumps(self.paths)), mtimes=self.mtimes, face_image=self.face_image,
+                 face_slot=self.face_slot, labels=self.labels,
+                 names=np.array(json.dumps({str(k): v for k, v in self.names.items()})),
+                 params=np.array(json.dumps(self.params)))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            names = {int(k): v for k, v in json.loads(str(data['names'])).items()}
+            return cls(json.loads(str(data['paths'])), data['mtimes'], data['face_image'], data['face_slot'],
+                       data['labels'], names, json.loads(str(data['params'])))
+
+
+def _compact(labels: np.ndarray) -> np.ndarray:
+    """Labels 0..C-1, größter Cluster zuerst."""
+    uniq, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    rank = np.empty(len(uniq), dtype='int64')
+    rank[np.lexsort((uniq, -counts))] = np.arange(len(uniq))
+    return rank[inverse]
+
+
+def _transfer_names(old: 'FaceClusters', new_keys: List[tuple], new_labels: np.ndarray) -> Dict[int, str]:
+    """Namen alter Cluster auf die neuen übertragen (Mehrheit der gemeinsamen Gesichter)."""
+    if not old.names:
+        return {}
+    position = {key: i for i, key in enumerate(new_keys)}
+    votes = {}
+    for key, label in zip(old.keys(), old.labels):
+        name = old.names.get(int(label))
+        if name and key in position:
+            votes.setdefault(int(new_labels[position[key]]), Counter())[name] += 1
+    return {label: counter.most_common(1)[0][0] for label, counter in votes.items()}
+
+
+def cluster_faces(index, threshold: float = DEFAULT_THRESHOLD, k: int = DEFAULT_K, method: str = 'whispers',
+                  previous: FaceClusters = None) -> FaceClusters:
+    """Clustert alle Gesichter des Index neu; Namen aus previous werden übernommen."""
+    encodings, paths, mtimes, image_ids, slots = face_table(index)
+    a, b, distances = knn_graph(encodings, k=k, threshold=threshold)
+    labels = _compact(cluster_labels(len(encodings), a, b, distances, threshold, method))
+    clusters = FaceClusters(paths, mtimes, image_ids, slots, labels,
+                            params={'threshold': threshold, 'k': k, 'method': method})
+    if previous is not None:
+        clusters.names = _transfer_names(previous, clusters.keys(), labels)
+    return clusters
+
+
+def update_clusters(clusters: FaceClusters, index, threshold: float = None, k: int = None,
+                    method: str = None) -> Tuple[FaceClusters, dict]:
+    """Ordnet neue Gesichter bestehenden Clustern zu; gelöschte Gesichter fallen heraus.
+
+    Nur die neuen Gesichter werden (exakt, blockweise) gegen alle Gesichter gesucht; die
+    Labels der bekannten Gesichter bleiben fest. Rückgabe: (Cluster, Statistik).
+    """
+    threshold = threshold or clusters.params.get('threshold', DEFAULT_THRESHOLD)
+    k = k or clusters.params.get('k', DEFAULT_K)
+    method = method or clusters.params.get('method', 'whispers')
+    encodings, paths, mtimes, image_ids, slots = face_table(index)
+    known = dict(zip(clusters.keys(), clusters.labels.tolist()))
+    keys = [(paths[i], int(mtimes[i]), int(s)) for i, s in zip(image_ids, slots)]
+    old = np.array([key in known for key in keys], dtype=bool)
+    labels = np.array([known.get(key, -1) for key in keys], dtype='int64')
+    new = np.flatnonzero(~old)
+    next_label = int(max(clusters.labels.max(initial=-1), labels.max(initial=-1))) + 1
+    labels[new] = next_label + np.arange(len(new))
+    if len(new) and len(encodings) > 1:
+        nn, d = exact_knn(np.asarray(encodings[new], dtype='float32'), encodings, k + 1)
+        rows = np.repeat(new, nn.shape[1])
+        cols, dists = nn.ravel(), d.ravel()
+        keep = (rows != cols) & (dists <= threshold)
+        a, b = np.minimum(rows[keep], cols[keep]), np.maximum(rows[keep], cols[keep])
+        # Kanten zwischen zwei neuen Gesichtern kommen aus beiden Richtungen
+        pairs, first = np.unique(a * len(encodings) + b, return_index=True)
+        labels = cluster_labels(len(encodings), pairs // len(encodings), pairs % len(encodings),
+                                dists[keep][first], threshold, method, labels=labels, frozen=old)
+    # neue Cluster lückenlos hinter die bestehenden Labels
+    fresh = labels >= next_label
+    if fresh.any():
+        labels[fresh] = next_label + _compact(labels[fresh])
+    stats = {'faces': len(labels), 'new_faces': len(new),
+             'assigned': int((~fresh[new]).sum()) if len(new) else 0,
+             'new_clusters': len(np.unique(labels[fresh])), 'removed_faces': len(clusters) - int(old.sum())}
+    live = set(np.unique(labels).tolist())
+    names = {label: name for label, name in clusters.names.items() if label in live}
+    updated = FaceClusters(paths, mtimes, image_ids, slots, labels, names,
+                           dict(clusters.params, threshold=threshold, k=k, method=method))
+    return updated, stats
+
+
+def name_face(clusters: FaceClusters, path: str, name: Optional[str], slot: int = 0) -> Optional[dict]:
+    """Benennt den Cluster des slot-ten Gesichts in path; None wenn das Gesicht unbekannt ist."""
+    label = clusters.label_of(str(path), slot)
+    if label is None:
+        label = clusters.label_of(str(Path(path).resolve()), slot)
+    if label is None:
+        return None
+    clusters.name(label, name)
+    faces = clusters.members(label)
+    return {'cluster': label, 'name': name, 'faces': len(faces),
+            'images': len(np.unique(clusters.face_image[faces]))}
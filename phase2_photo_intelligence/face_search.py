@@ -0,0 +1,123 @@
+"""
+face_search.py
+
+Vektorisierte Gesichtssuche über den gesamten Insights-Index:
+- Alle Face-Encodings werden zu einer float32-Matrix gestapelt (beim .idx-Format ist das
+  direkt die memory-mapped Matrix, ohne Kopie pro Bild).
+- Die Distanzen zu allen bekannten Gesichtern werden blockweise per Matrixmultiplikation
+  berechnet (||a-b||² = ||a||² + ||b||² - 2ab), statt compare_faces pro Gesicht aufzurufen.
+- Encodings der bekannten Gesichter werden über den Datei-Hash neben dem Insights-Index gecacht,
+  sodass KNOWN_FACES_DIR nicht bei jedem Aufruf neu kodiert werden muss (und dort nichts landet).
+"""
+
+import json
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+FACE_DIM = 128
+# Gesichter pro Block: 65536 x 128 float32 = 32 MB
+SEARCH_BLOCK = 65536
+# Encoding-Cache früherer Versionen direkt in KNOWN_FACES_DIR; wird nur noch gelesen
+KNOWN_CACHE_NAME = '.known_faces_cache.json'
+
+
+def stack_encodings(index) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """Liefert (Encodings F x 128, Bild-Index je Gesicht, Pfade) für dict- oder BinaryIndex."""
+    if hasattr(index, 'face_image_ids'):
+        return index.encodings, index.face_image_ids(), list(index.paths)
+    paths = []
+    blocks = []
+    image_ids = []
+    for path, item in index.items():
+        encs = (item.get('faces') or {}).get('encodings')
+        if encs is not None and len(encs):
+            blocks.append(np.asarray(encs, dtype='float32').reshape(-1, FACE_DIM))
+            image_ids.append(np.full(len(blocks[-1]), len(paths)))
+        paths.append(path)
+    if not blocks:
+        return np.empty((0, FACE_DIM), dtype='float32'), np.empty(0, dtype='int64'), paths
+    return np.concatenate(blocks), np.concatenate(image_ids), paths
+
+
+def _file_hash(path: Path) -> str:
+    return hashlib.blake2b(path.read_bytes(), digest_size=16).hexdigest()
+
+
+def known_faces_cache_path(index_path) -> str:
+    return str(index_path).rstrip('/\\') + '.known_faces.json'
+
+
+def load_known_faces(known_face_dir, cache_path=None) -> Tuple[List[str], np.ndarray]:
+    """Encodings der bekannten Gesichter (ein Bild = eine Person, Name = Dateiname).
+
+    Ergebnisse werden in cache_path (siehe known_faces_cache_path; None = nicht speichern) unter
+    dem Datei-Hash abgelegt; nur neue oder geänderte Bilder werden mit face_recognition kodiert.
+    KNOWN_FACES_DIR kann read-only sein: dort wird nichts geschrieben, ein alter Cache nur gelesen.
+    """
+    kd = Path(known_face_dir)
+    stored = {}
+    if cache_path and Path(cache_path).exists():
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+    cache = dict(stored)
+    legacy = kd / KNOWN_CACHE_NAME
+    if legacy.exists():
+        with open(legacy, 'r', encoding='utf-8') as f:
+            cache = {**json.load(f), **cache}
+
+    names, encodings, used = [], [], {}
+    for k in sorted(kd.iterdir()):
+        if not k.is_file() or k.name == KNOWN_CACHE_NAME:
+            continue
+        digest = _file_hash(k)
+        if digest not in cache:
+            import face_recognition
+            img = face_recognition.load_image_file(str(k))
+            encs = face_recognition.face_encodings(img)
+            # auch "kein Gesicht gefunden" cachen, damit das Bild nicht erneut kodiert wird
+            cache[digest] = encs[0].tolist() if encs else None
+        used[digest] = cache[digest]
+        if cache[digest] is not None:
+            names.append(k.stem)
+            encodings.append(cache[digest])
+
+    if cache_path and used != stored:
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump(used, f)
+    known = np.asarray(encodings, dtype='float32').reshape(-1, FACE_DIM)
+    return names, known
+
+
+def search_faces(encodings: np.ndarray, image_ids: np.ndarray, paths: List[str], names: List[str],
+                 known: np.ndarray, threshold: float = 0.5, block: int = SEARCH_BLOCK) -> Dict[str, List[dict]]:
+    """Findet für jede bekannte Person alle Bilder mit einem Gesicht innerhalb von threshold.
+
+    Rückgabe: {name: [{'path', 'distance', 'face'}...]} aufsteigend nach Distanz; pro Bild
+    zählt das ähnlichste Gesicht. 'face' ist die Position des Gesichts innerhalb des Bildes
+    (Index in faces.locations/encodings des Eintrags).
+    """
+    results = {name: {} for name in names}
+    if not len(known) or not len(encodings):
+        return {name: [] for name in names}
+    # die Gesichter eines Bildes stehen zusammenhängend: erste Zeile je Bild
+    images, first = np.unique(image_ids, return_index=True)
+    first_row = dict(zip(images.tolist(), first.tolist()))
+    known = np.asarray(known, dtype='float32')
+    known_sq = np.einsum('ij,ij->i', known, known)
+    for start in range(0, len(encodings), block):
+        chunk = np.asarray(encodings[start:start + block], dtype='float32')
+        chunk_sq = np.einsum('ij,ij->i', chunk, chunk)
+        d2 = chunk_sq[:, None] + known_sq[None, :] - 2.0 * (chunk @ known.T)
+        dist = np.sqrt(np.maximum(d2, 0.0))
+        rows, cols = np.nonzero(dist <= threshold)
+        for r, c in zip(rows, cols):
+            face = start + int(r)
+            image = int(image_ids[face])
+            d = float(dist[r, c])
+            best = results[names[c]].get(image)
+            if best is None or d < best['distance']:
+                results[names[c]][image] = {'path': paths[image], 'distance': d, 'face': face - first_row[image]}
+    return {name: sorted(hits.values(), key=lambda h: h['distance']) for name, hits in results.items()}
@@ -0,0 +1,153 @@
+"""
+index_format.py
+
+Kompaktes, spaltenorientiertes Binärformat für den Insights-Index (Ordner mit Endung .idx):
+- meta.json            Metadaten-Tabelle spaltenweise (path, date, size, mtime_ns, emotions, ...)
+- face_offsets.npy     int64 (N+1): Gesichter von Bild i liegen in den Zeilen offsets[i]:offsets[i+1]
+- face_encodings.npy   float32 (F x 128), zusammenhängend für alle Gesichter aller Bilder
+- face_locations.npy   int32 (F x 4): (top, right, bottom, left) wie bei face_recognition
+
+Die .npy-Dateien werden beim Laden per Memory-Mapping geöffnet, d.h. die Encodings werden
+erst gelesen, wenn sie tatsächlich gebraucht werden.
+
+Konvertierung eines bestehenden JSON-Index:
+    python photo_insights.py --convert-index insights_index.json --out insights_index.idx
+"""
+
+import os
+import json
+import shutil
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+
+BINARY_SUFFIX = '.idx'
+FORMAT_VERSION = 1
+FACE_DIM = 128
+
+# Spalten der Metadaten-Tabelle; Gesichter liegen separat in den .npy-Dateien
+META_COLUMNS = ('path', 'size', 'mtime_ns', 'date', 'emotions', 'embedding_len')
+
+
+def is_binary_index(path) -> bool:
+    return str(path).endswith(BINARY_SUFFIX)
+
+
+def save_binary_index(index: Mapping, folder):
+    """Schreibt den Index atomar (erst in <folder>.tmp, dann umbenennen)."""
+    folder = Path(folder)
+    tmp = Path(str(folder) + '.tmp')
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+
+    columns = {name: [] for name in META_COLUMNS}
+    extra = []
+    offsets = [0]
+    encodings = []
+    locations = []
+    for item in index.values():
+        for name in META_COLUMNS:
+            columns[name].append(item.get(name))
+        # unbekannte Felder (z.B. aus späteren Stages) verlustfrei mitnehmen
+        extra.append({k: v for k, v in item.items() if k not in META_COLUMNS and k != 'faces'} or None)
+        faces = item.get('faces') or {}
+        encs = faces.get('encodings')
+        if encs is not None and len(encs):
+            encodings.append(np.asarray(encs, dtype='float32').reshape(-1, FACE_DIM))
+            locations.append(np.asarray(faces.get('locations'), dtype='int32').reshape(-1, 4))
+        offsets.append(offsets[-1] + (len(encs) if encs is not None else 0))
+    columns['extra'] = extra
+
+    with open(tmp / 'meta.json', 'w', encoding='utf-8') as f:
+        json.dump({'version': FORMAT_VERSION, 'count': len(offsets) - 1, 'columns': columns},
+                  f, ensure_ascii=False, separators=(',', ':'))
+    np.save(tmp / 'face_offsets.npy', np.asarray(offsets, dtype='int64'))
+    np.save(tmp / 'face_encodings.npy',
+            np.concatenate(encodings) if encodings else np.empty((0, FACE_DIM), dtype='float32'))
+    np.save(tmp / 'face_locations.npy',
+            np.concatenate(locations) if locations else np.empty((0, 4), dtype='int32'))
+
+    if folder.exists():
+        old = Path(str(folder) + '.old')
+        os.replace(folder, old)
+        os.replace(tmp, folder)
+        shutil.rmtree(old)
+    else:
+        os.replace(tmp, folder)
+
+
+class BinaryIndex(Mapping):
+    """Read-only Sicht auf einen .idx-Ordner; verhält sich wie das bisherige Index-Dict.
+
+    Einträge werden erst beim Zugriff zusammengebaut; face encodings sind dann float32-Views
+    in die gemappte Matrix statt Python-Listen.
+    """
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        with open(self.folder / 'meta.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unbekannte Index-Version {meta.get('version')} in {self.folder}")
+        self.columns = meta['columns']
+        self.paths = self.columns['path']
+        self.position = {p: i for i, p in enumerate(self.paths)}
+        self.offsets = np.load(self.folder / 'face_offsets.npy', mmap_mode='r')
+        self.encodings = np.load(self.folder / 'face_encodings.npy', mmap_mode='r')
+        self.locations = np.load(self.folder / 'face_locations.npy', mmap_mode='r')
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __contains__(self, path):
+        return path in self.position
+
+    def face_rows(self, i: int) -> slice:
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def face_image_ids(self) -> np.ndarray:
+        """Bild-Index je Gesichtszeile (Länge F), z.B. für vektorisierte Suche."""
+        return np.repeat(np.arange(len(self.paths)), np.diff(self.offsets))
+
+    def __getitem__(self, path):
+        i = self.position[path]
+        item = {name: self.columns[name][i] for name in META_COLUMNS if self.columns[name][i] is not None}
+        item.update(self.columns['extra'][i] or {})
+        rows = self.face_rows(i)
+        if rows.stop > rows.start:
+            item['faces'] = {
+                'locations': [tuple(int(v) for v in loc) for loc in self.locations[rows]],
+                'encodings': self.encodings[rows],
+            }
+        return item
+
+
+def load_json_index(path) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _json_default(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Nicht serialisierbar: {type(obj)}")
+
+
+def save_json_index(index: Mapping, path):
+    tmp = Path(str(path) + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(dict(index.items()), f, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+    os.replace(tmp, path)
+
+
+def convert_json_to_binary(json_path, out_folder):
+    index = load_json_index(json_path)
+    save_binary_index(index, out_folder)
+    return len(index)
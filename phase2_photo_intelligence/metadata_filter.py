@@ -0,0 +1,234 @@
+"""
+metadata_filter.py
+
+Vorberechnete Posting-Listen für die gefilterte semantische Suche in photo_rag.py:
+- date:     Aufnahmedatum je Vektor-ID als int32 YYYYMMDD (0 = unbekannt), Bereichsfilter vektorisiert
+- folder:   Elternordner -> Vektor-IDs; ein Ordner-Filter umfasst auch alle Unterordner
+- person:   Name aus KNOWN_FACES_DIR -> Vektor-IDs (einmalig per face_search ermittelt) und
+            benannte Gesichts-Cluster (face_clusters.py)
+- emotion:  dominante Emotion -> Vektor-IDs
+
+Die IDs beziehen sich auf den Vektor-Index (photo_vectors_mapping.json). Ein Filter ergibt eine
+Bitmaske über alle Vektoren, die direkt in die Index-Suche geht (FAISS IDSelectorBitmap bzw.
+Maske im NumPy-Backend) statt die Treffer nachträglich auszusortieren.
+
+Gespeichert wird alles in <db>_filters.npz (CSR-artig: Schlüssel, Offsets, IDs je Attribut).
+"""
+
+import os
+import json
+import hashlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from embedding_store import split_frame_key
+from face_clusters import FaceClusters, clusters_path
+from face_search import KNOWN_CACHE_NAME
+
+ATTRIBUTES = ('folder', 'person', 'emotion')
+
+
+def filters_path(db_path: str) -> str:
+    return str(db_path).replace('.faiss', '') + '_filters.npz'
+
+
+def date_key(date: str) -> int:
+    """'2023-07-14' -> 20230714; None/ungültig -> 0."""
+    try:
+        return int(str(date)[:10].replace('-', ''))
+    except (TypeError, ValueError):
+        return 0
+
+
+def dominant_emotion(emotions) -> Optional[str]:
+    """FER liefert {'top', 'score'}, DeepFace ein dict Emotion -> Wert."""
+    if not emotions:
+        return None
+    if 'top' in emotions:
+        return emotions['top']
+    return max(emotions, key=emotions.get)
+
+
+def _folder_key(path: str) -> str:
+    return os.path.normcase(str(Path(path).parent))
+
+
+def mapping_hasher(id_to_path: List[str]):
+    """Hash über das Vektor-Mapping (ID -> Pfad); bei neuen Vektoren per update_mapping_hash fortschreiben."""
+    h = hashlib.blake2b(digest_size=16)
+    update_mapping_hash(h, id_to_path)
+    return h
+
+
+def update_mapping_hash(h, paths):
+    for p in paths:
+        h.update(str(p).encode('utf-8') + b'\0')
+
+
+def known_faces_stamp(known_face_dir) -> Optional[str]:
+    """Fingerabdruck von KNOWN_FACES_DIR: Dateinamen und mtimes (ohne den Encoding-Cache)."""
+    if not known_face_dir or not Path(known_face_dir).is_dir():
+        return None
+    h = hashlib.blake2b(digest_size=16)
+    for k in sorted(Path(known_face_dir).iterdir()):
+        if k.is_file() and k.name != KNOWN_CACHE_NAME:
+            h.update(f'{k.name}\0{k.stat().st_mtime_ns}\0'.encode('utf-8'))
+    return h.hexdigest()
+
+
+def index_signature(index_path, mapping_hash: str = None, known_face_dir=None) -> dict:
+    """Änderungsstempel des Insights-Index (.idx-Ordner: meta.json) und der Gesichts-Cluster,
+    um veraltete Filter zu erkennen. Mit mapping_hash/known_face_dir zusätzlich das Vektor-Mapping
+    (gleiche Anzahl, aber andere IDs nach einem Rebuild) und der Inhalt von KNOWN_FACES_DIR."""
+    p = Path(index_path)
+    stamp = p / 'meta.json' if p.is_dir() else p
+    clusters = Path(clusters_path(index_path))
+    signature = {'index_path': str(index_path), 'index_mtime_ns': stamp.stat().st_mtime_ns if stamp.exists() else 0,
+                 'clusters_mtime_ns': clusters.stat().st_mtime_ns if clusters.exists() else 0}
+    if mapping_hash is not None:
+        signature['mapping_hash'] = mapping_hash
+    if known_face_dir:
+        signature['known_faces_stamp'] = known_faces_stamp(known_face_dir)
+    return signature
+
+
+class MetadataFilter:
+    """Posting-Listen je Attributwert plus Datums-Spalte, ausgerichtet auf die Vektor-IDs."""
+
+    def __init__(self, dates: np.ndarray, postings: Dict[str, Dict[str, np.ndarray]], source: dict = None):
+        self.dates = dates
+        self.postings = postings
+        self.source = source or {}
+
+    def __len__(self):
+        return len(self.dates)
+
+    @classmethod
+    def build(cls, index, id_to_path: List[str], known_face_dir=None, threshold: float = 0.5, source: dict = None):
+        """index: Insights-Index (dict oder BinaryIndex); id_to_path: Pfad bzw. Frame-Schlüssel je Vektor-ID.
+
+        Video-Frames ('clip.mp4#t=12.50') erben die Metadaten ihres Videos.
+        """
+        paths = [split_frame_key(key)[0] for key in id_to_path]
+        position = defaultdict(list)
+        for vid, path in enumerate(paths):
+            position[path].append(vid)
+        dates = np.zeros(len(id_to_path), dtype='int32')
+        lists = {attr: defaultdict(list) for attr in ATTRIBUTES}
+        for vid, path in enumerate(paths):
+            lists['folder'][_folder_key(path)].append(vid)
+            item = index.get(path) if path in index else None
+            if item is None:
+                continue
+            dates[vid] = date_key(item.get('date'))
+            emotion = dominant_emotion(item.get('emotions'))
+            if emotion:
+                lists['emotion'][emotion.lower()].append(vid)
+
+        names = []
+        if known_face_dir:
+            from face_search import known_faces_cache_path, load_known_faces, search_faces, stack_encodings
+            cache = known_faces_cache_path(source['index_path']) if source and source.get('index_path') else None
+            try:
+                names, known = load_known_faces(known_face_dir, cache)
+            except ImportError:
+                print('face_recognition nicht installiert; Personen-Filter nicht verfügbar')
+            else:
+                encodings, image_ids, paths = stack_encodings(index)
+                hits = search_faces(encodings, image_ids, paths, names, known, threshold=threshold)
+                for name, found in hits.items():
+                    # 'Anna' und 'anna' landen im selben Filter-Wert, also anhängen statt überschreiben
+                    lists['person'][name.lower()].extend(vid for h in found for vid in position.get(h['path'], ()))
+
+        # benannte Gesichts-Cluster ergänzen die Personen aus KNOWN_FACES_DIR
+        clusters = clusters_path(source['index_path']) if source and source.get('index_path') else None
+        if clusters and Path(clusters).exists():
+            for name, paths in FaceClusters.load(clusters).person_paths().items():
+                lists['person'][name.lower()].extend(vid for p in paths for vid in position.get(p, ()))
+                names.append(name)
+
+        postings = {attr: {value: np.unique(np.asarray(ids, dtype='int64')) for value, ids in values.items()}
+                    for attr, values in lists.items()}
+        source = dict(source or {}, count=len(id_to_path),
+                      known_faces=str(known_face_dir) if known_face_dir else None, persons=sorted(set(names)))
+        return cls(dates, postings, source)
+
+    def values(self, attr: str) -> List[str]:
+        return sorted(self.postings.get(attr, {}))
+
+    def _posting_mask(self, attr: str, values, n: int, match_all: bool = False) -> np.ndarray:
+        if isinstance(values, str):
+            values = [values]
+        mask = np.ones(n, dtype=bool) if match_all else np.zeros(n, dtype=bool)
+        for value in values:
+            if attr == 'folder':
+                folder = os.path.normcase(str(Path(value)))
+                keys = [k for k in self.postings['folder'] if k == folder or k.startswith(folder + os.sep)]
+            else:
+                keys = [value.lower()] if value.lower() in self.postings.get(attr, {}) else []
+            hit = np.zeros(n, dtype=bool)
+            for key in keys:
+                hit[self.postings[attr][key]] = True
+            mask = mask & hit if match_all else mask | hit
+        return mask
+
+    def mask(self, n: int = None, date_from: str = None, date_to: str = None, year: int = None,
+             folder=None, person=None, emotion=None) -> Optional[np.ndarray]:
+        """Bitmaske der erlaubten Vektor-IDs; None wenn kein Filter gesetzt ist.
+
+        Innerhalb von folder/emotion gilt ODER, mehrere Personen müssen alle auf dem Bild sein;
+        die Attribute untereinander werden UND-verknüpft.
+        """
+        n = len(self.dates) if n is None else n
+        if year:
+            date_from, date_to = f"{year}-01-01", f"{year}-12-31"
+        if not any((date_from, date_to, folder, person, emotion)):
+            return None
+        mask = np.ones(n, dtype=bool)
+        if date_from or date_to:
+            dates = np.zeros(n, dtype='int32')
+            dates[:len(self.dates)] = self.dates[:n]
+            in_range = dates > 0
+            if date_from:
+                in_range &= dates >= date_key(date_from)
+            if date_to:
+                in_range &= dates <= date_key(date_to)
+            mask &= in_range
+        if folder:
+            mask &= self._posting_mask('folder', folder, n)
+        if emotion:
+            mask &= self._posting_mask('emotion', emotion, n)
+        if person:
+            mask &= self._posting_mask('person', person, n, match_all=True)
+        return mask
+
+    def save(self, path: str):
+        arrays = {'dates': self.dates, 'source': np.array(json.dumps(self.source))}
+        for attr in ATTRIBUTES:
+            values = self.values(attr)
+            ids = [self.postings[attr][v] for v in values]
+            arrays[f'{attr}_keys'] = np.array(values, dtype=str)
+            arrays[f'{attr}_offsets'] = np.cumsum([0] + [len(i) for i in ids]).astype('int64')
+            arrays[f'{attr}_ids'] = np.concatenate(ids) if ids else np.empty(0, dtype='int64')
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            postings = {}
+            for attr in ATTRIBUTES:
+                offsets = data[f'{attr}_offsets']
+                ids = data[f'{attr}_ids']
+                postings[attr] = {str(key): ids[offsets[i]:offsets[i + 1]]
+                                  for i, key in enumerate(data[f'{attr}_keys'])}
+            return cls(data['dates'], postings, json.loads(str(data['source'])))
+
+    def is_current(self, count: int, signature: dict, known_face_dir=None) -> bool:
+        return (self.source.get('count') == count
+                and all(self.source.get(k) == v for k, v in signature.items())
+                and self.source.get('known_faces') == (str(known_face_dir) if known_face_dir else None))
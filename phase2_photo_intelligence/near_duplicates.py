@@ -0,0 +1,282 @@
+"""
+near_duplicates.py
+
+Perceptual Hashes und Suche nach Beinahe-Duplikaten (Serienbilder, bearbeitete Kopien,
+neu komprimierte WhatsApp-Versionen desselben Fotos):
+- phash: 64 Bit aus den tiefen Frequenzen der DCT eines 32x32-Graustufenbilds
+  (robust gegen Skalierung und JPEG-Kompression)
+- dhash: 64 Bit aus Helligkeitsgradienten eines 9x8-Graustufenbilds (sehr billig)
+
+Beide werden beim Indexieren von photo_insights.py auf dem ohnehin dekodierten Vorschaubild
+berechnet und als Hex-String im Insights-Index abgelegt.
+
+Für die Suche wird jeder Hash in `chunks` Teilstücke zerlegt (Multi-Index-Hashing): Liegen
+zwei Hashes höchstens r Bit auseinander, stimmt mindestens ein Teilstück bis auf r // chunks
+Bit überein. Kandidaten entstehen daher per sortiertem Join je Teilstück statt durch Vergleich
+aller Paare und werden danach per Popcount exakt geprüft. Die Zahl der Teilstücke wird nach
+Anzahl Hashes und r gewählt (breite Teilstücke = kleine Buckets, aber mehr Bit-Varianten).
+Zusammenhängende Paare bilden die Duplikat-Gruppen.
+
+Beispiel-Usage:
+    python photo_insights.py --find-duplicates --index-path insights_index.idx --max-distance 6
+"""
+
+from collections.abc import Mapping
+from itertools import combinations
+from math import comb
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+HASH_KINDS = ('phash', 'dhash')
+DEFAULT_HASH = 'phash'
+HASH_BITS = 64
+# Kantenlänge des Graustufenbilds für phash; das Vorschaubild muss mindestens so groß sein
+HASH_MIN_SIDE = 32
+DEFAULT_MAX_DISTANCE = 6
+# Obergrenze der Kandidatenpaare pro Join-Schritt (begrenzt den Speicher bei großen Buckets)
+MAX_PAIRS_PER_STEP = 1 << 22
+# Teilstücke bis zu dieser Breite bekommen eine Bucket-Tabelle (2^22 x int64 = 32 MB), breitere
+# werden per Binärsuche nachgeschlagen
+TABLE_MAX_BITS = 22
+# Kosten einer Bit-Variante (ein Durchlauf über alle Hashes) relativ zu einem Kandidaten pro Hash
+FLIP_COST = 2.5
+
+_DCT = {}
+
+
+def _gray(image: Image.Image, width: int, height: int) -> np.ndarray:
+    return np.asarray(image.convert('L').resize((width, height), Image.Resampling.LANCZOS), dtype='float32')
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    if n not in _DCT:
+        k = np.arange(n)[:, None]
+        matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+        matrix[0] /= np.sqrt(2.0)
+        _DCT[n] = matrix.astype('float32')
+    return _DCT[n]
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.ravel().astype('uint8')).tobytes(), 'big')
+
+
+def phash(image: Image.Image) -> int:
+    """DCT-Hash: die 8x8 tiefsten Frequenzen, jeweils über/unter ihrem Median."""
+    dct = _dct_matrix(HASH_MIN_SIDE)
+    coeffs = dct @ _gray(image, HASH_MIN_SIDE, HASH_MIN_SIDE) @ dct.T
+    low = coeffs[:8, :8]
+    return _bits_to_int(low > np.median(low))
+
+
+def dhash(image: Image.Image) -> int:
+    """Differenz-Hash: ist ein Pixel heller als sein linker Nachbar?"""
+    pixels = _gray(image, 9, 8)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def image_hashes(image: Image.Image) -> Dict[str, str]:
+    """Beide Hashes als 16-stellige Hex-Strings (so landen sie im Index)."""
+    return {'phash': f"{phash(image):016x}", 'dhash': f"{dhash(image):016x}"}
+
+
+# gesetzte Bits je Byte, für NumPy < 2.0 (dort fehlt np.bitwise_count)
+_POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype='uint8')
+
+
+def hamming(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Bitweise Distanz zwischen uint64-Arrays."""
+    xor = np.bitwise_xor(a, b)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(xor).astype('int64')
+    flat = np.ascontiguousarray(xor, dtype='uint64').reshape(-1)
+    counts = _POPCOUNT8[flat.view('uint8')].reshape(-1, 8).sum(axis=1, dtype='int64')
+    return counts.reshape(np.shape(xor))
+
+
+def load_hashes(index: Mapping, kind: str = DEFAULT_HASH) -> Tuple[List[str], np.ndarray, List[int]]:
+    """(Pfade, uint64-Hashes, Dateigrößen) aller Index-Einträge mit Hash."""
+    if kind not in HASH_KINDS:
+        raise ValueError(f"Unbekannter Hash {kind!r}, erlaubt: {', '.join(HASH_KINDS)}")
+    paths, hashes, sizes = [], [], []
+    columns = getattr(index, 'columns', None)
+    if columns is not None:
+        # BinaryIndex: Hashes direkt aus der extra-Spalte, ohne Einträge samt Gesichtern zusammenzubauen
+        rows = zip(columns['path'], columns['extra'], columns['size'])
+        items = ((path, extra or {}, size) for path, extra, size in rows)
+    else:
+        items = ((path, item, item.get('size')) for path, item in index.items())
+    for path, fields, size in items:
+        value = fields.get(kind)
+        if value:
+            paths.append(path)
+            hashes.append(int(value, 16))
+            sizes.append(size or 0)
+    return paths, np.asarray(hashes, dtype='uint64'), sizes
+
+
+def _flip_masks(width: int, radius: int) -> np.ndarray:
+    """Alle Bitmasken der Breite width mit höchstens radius gesetzten Bits."""
+    masks = [0]
+    for r in range(1, radius + 1):
+        masks.extend(sum(1 << b for b in bits) for bits in combinations(range(width), r))
+    return np.asarray(masks, dtype='int64')
+
+
+def choose_chunks(n: int, max_distance: int) -> int:
+    """Anzahl Teilstücke mit dem geringsten geschätzten Aufwand für n Hashes.
+
+    Pro Teilstück der Breite w: Varianten mit bis zu max_distance // chunks gekippten Bits,
+    jede kostet einen Durchlauf plus n / 2^w zufällige Kandidaten pro Hash.
+    """
+    def cost(chunks):
+        width = HASH_BITS // chunks
+        flips = sum(comb(width, r) for r in range(max_distance // chunks + 1))
+        return chunks * flips * (FLIP_COST + n / 2.0 ** width)
+    return min(range(2, max(max_distance, 1) + 2), key=cost)
+
+
+class MultiIndexHash:
+    """Multi-Index-Hashing über 64-Bit-Hashes: ein sortiertes Teilstück-Array pro Chunk."""
+
+    def __init__(self, hashes: np.ndarray, chunks: int):
+        self.hashes = np.ascontiguousarray(hashes, dtype='uint64')
+        self.chunks = chunks
+        bounds = np.linspace(0, HASH_BITS, chunks + 1).astype(int)
+        # (Shift, Breite) je Teilstück
+        self.parts = [(int(lo), int(hi - lo)) for lo, hi in zip(bounds[:-1], bounds[1:])]
+        self.values = []
+        self.orders = []
+        self.sorted_values = []
+        self.starts = []
+        for shift, width in self.parts:
+            values = ((self.hashes >> np.uint64(shift)) & np.uint64((1 << width) - 1)).astype('int64')
+            order = np.argsort(values, kind='stable')
+            self.values.append(values)
+            self.orders.append(order)
+            self.sorted_values.append(values[order])
+            # starts[v]:starts[v+1] = Positionen des Werts v in der sortierten Reihenfolge
+            self.starts.append(np.concatenate(([0], np.cumsum(np.bincount(values, minlength=1 << width))))
+                               if width <= TABLE_MAX_BITS else None)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _buckets(self, part: int, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(Start, Anzahl) der Hashes, deren Teilstück part gleich keys ist."""
+        starts = self.starts[part]
+        if starts is not None:
+            lo = starts[keys]
+            return lo, starts[keys + 1] - lo
+        lo = np.searchsorted(self.sorted_values[part], keys, 'left')
+        return lo, np.searchsorted(self.sorted_values[part], keys, 'right') - lo
+
+    def query(self, value: int, max_distance: int = DEFAULT_MAX_DISTANCE) -> Tuple[np.ndarray, np.ndarray]:
+        """IDs und Distanzen aller Hashes mit höchstens max_distance Bit Abstand zu value."""
+        radius = max_distance // self.chunks
+        candidates = []
+        for part, ((shift, width), order) in enumerate(zip(self.parts, self.orders)):
+            keys = ((value >> shift) & ((1 << width) - 1)) ^ _flip_masks(width, radius)
+            lo, counts = self._buckets(part, keys)
+            candidates.extend(order[a:a + c] for a, c in zip(lo, counts) if c)
+        if not candidates:
+            return np.empty(0, dtype='int64'), np.empty(0, dtype='int64')
+        ids = np.unique(np.concatenate(candidates))
+        distances = hamming(self.hashes[ids], np.uint64(value))
+        keep = distances <= max_distance
+        return ids[keep], distances[keep]
+
+    def pairs(self, max_distance: int = DEFAULT_MAX_DISTANCE) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Alle Paare (a < b) mit höchstens max_distance Bit Abstand, samt Distanz."""
+        radius = max_distance // self.chunks
+        found = []
+        for part, ((_, width), values, order) in enumerate(zip(self.parts, self.values, self.orders)):
+            for flip in _flip_masks(width, radius):
+                keys = values ^ flip
+                lo, counts = self._buckets(part, keys)
+                if flip:
+                    # (a, b) und (b, a) treffen sich mit derselben Variante: nur von der kleineren Seite aus
+                    counts[keys < values] = 0
+                found.extend(self._join(lo, counts, order, max_distance, same_bucket=not flip))
+        if not found:
+            empty = np.empty(0, dtype='int64')
+            return empty, empty, empty
+        a = np.concatenate([f[0] for f in found])
+        b = np.concatenate([f[1] for f in found])
+        # dasselbe Paar kann über mehrere Teilstücke gefunden werden
+        _, first = np.unique(a * len(self) + b, return_index=True)
+        a, b = a[first], b[first]
+        return a, b, hamming(self.hashes[a], self.hashes[b])
+
+    def _join(self, lo: np.ndarray, counts: np.ndarray, order: np.ndarray, max_distance: int, same_bucket: bool):
+        """Expandiert die Bucket-Treffer zu Paaren, schrittweise höchstens MAX_PAIRS_PER_STEP auf einmal."""
+        rows = np.flatnonzero(counts)
+        counts, lo = counts[rows], lo[rows]
+        ends = np.cumsum(counts)
+        start = 0
+        while start < len(rows):
+            base = ends[start] - counts[start]
+            stop = max(int(np.searchsorted(ends, base + MAX_PAIRS_PER_STEP, 'right')), start + 1)
+            c = counts[start:stop]
+            a = np.repeat(rows[start:stop], c)
+            # Position im sortierten Teilstück: Bucket-Start + laufende Nummer innerhalb des Buckets
+            b = order[np.repeat(lo[start:stop] - (ends[start:stop] - c - base), c) + np.arange(ends[stop - 1] - base)]
+            if same_bucket:
+                keep = a < b
+                a, b = a[keep], b[keep]
+            keep = hamming(self.hashes[a], self.hashes[b]) <= max_distance
+            a, b = a[keep], b[keep]
+            yield np.minimum(a, b), np.maximum(a, b)
+            start = stop
+
+
+def connected_components(n: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Komponenten-Label je Knoten (kleinste ID der Komponente) per Label-Propagation."""
+    labels = np.arange(n)
+    while True:
+        before = labels.copy()
+        low = np.minimum(labels[a], labels[b])
+        np.minimum.at(labels, a, low)
+        np.minimum.at(labels, b, low)
+        # Pointer-Jumping verkürzt lange Ketten
+        labels = labels[labels]
+        if np.array_equal(labels, before):
+            return labels
+
+
+def duplicate_groups(paths: List[str], hashes: np.ndarray, sizes: List[int] = None,
+                     max_distance: int = DEFAULT_MAX_DISTANCE, chunks: int = None) -> List[Dict]:
+    """Gruppen von Beinahe-Duplikaten, größte Gruppe zuerst.
+
+    Pro Gruppe wird die größte Datei als 'keep' vorgeschlagen (meist das Original bzw. die am
+    wenigsten komprimierte Version); 'duplicates' enthält die übrigen mit Bit-Distanz zu 'keep'.
+    """
+    if not len(paths):
+        return []
+    sizes = sizes or [0] * len(paths)
+    chunks = chunks or choose_chunks(len(paths), max_distance)
+    a, b, _ = MultiIndexHash(hashes, chunks).pairs(max_distance)
+    labels = connected_components(len(paths), a, b)
+    members = {}
+    for i in np.flatnonzero(np.bincount(labels, minlength=len(paths))[labels] > 1):
+        members.setdefault(int(labels[i]), []).append(int(i))
+    groups = []
+    for ids in members.values():
+        keep = max(ids, key=lambda i: (sizes[i], paths[i]))
+        distances = hamming(hashes[ids], hashes[keep])
+        groups.append({
+            'keep': paths[keep],
+            'duplicates': sorted(({'path': paths[i], 'size': sizes[i], 'distance': int(d)}
+                                  for i, d in zip(ids, distances) if i != keep),
+                                 key=lambda x: (x['distance'], x['path'])),
+        })
+    groups.sort(key=lambda g: (-len(g['duplicates']), g['keep']))
+    return groups
+
+
+def find_duplicates(index: Mapping, kind: str = DEFAULT_HASH, max_distance: int = DEFAULT_MAX_DISTANCE,
+                    chunks: int = None) -> List[Dict]:
+    paths, hashes, sizes = load_hashes(index, kind)
+    return duplicate_groups(paths, hashes, sizes, max_distance, chunks)
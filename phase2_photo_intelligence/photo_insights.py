@@ -5,7 +5,10 @@ Modulares Werkzeug zur Analyse unstrukturierter Bilddaten:
 - Extrahiert Metadaten (Datum, Pfad)
 - Optional: Gesichts-Detektion & -Encodings (face_recognition)
 - Optional: Emotionserkennung (deepface / fer)
-- Optional: Bild-Embeddings (transformers CLIP oder openai/clip)
+- Optional: Bild-Embeddings (transformers CLIP oder openai/clip), bei Videos für einige
+  Keyframes pro Clip (video_frames.py, braucht PyAV oder OpenCV)
+- Perceptual Hashes (phash/dhash) für die Suche nach Beinahe-Duplikaten (near_duplicates.py)
+- Clustering unbekannter Gesichter zu Personen, benennbar per Beispielbild (face_clusters.py)
 
 Die Datei ist robust gegenüber fehlenden Bibliotheken: fehlende Features werden übersprungen
 und im erzeugten JSON-Index entsprechend vermerkt.
@@ -13,85 +16,117 @@ und im erzeugten JSON-Index entsprechend vermerkt.
 Beispiel-Usage:
     python photo_insights.py --build-index
     python photo_insights.py --find-person known_faces_dir
+    python photo_insights.py --find-duplicates --max-distance 6
+    python photo_insights.py --cluster-faces
+    python photo_insights.py --name-face C:\\Fotos\\2023\\IMG_0042.jpg --name Anna
+    python photo_insights.py --convert-index insights_index.json --out insights_index.idx
 
 Requirements (optional): face_recognition, deepface, fer, transformers, torch, ftfy
 """
 
 import os
+import sys
 import json
+import time
 from pathlib import Path
 from datetime import datetime
 from PIL import Image
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from media_common.backends import available
+from media_common.exif_date import CAPTURE_SUFFIXES, get_capture_datetime
+from media_common.metrics import QUIET, Metrics, add_arguments as add_metrics_arguments
+from media_common.video_meta import VIDEO_SUFFIXES
+
 load_dotenv()
 
 SOURCE = os.getenv("PHOTO_SOURCE")
 TARGET = os.getenv("PHOTO_TARGET")
 KNOWN_FACES = os.getenv("KNOWN_FACES_DIR")
 
-# Optional backends (import if available)
-HAS_FACE_RECOG = False
-HAS_DEEPFACE = False
-HAS_FER = False
-HAS_CLIP = False
-
-try:
-    import face_recognition
-    HAS_FACE_RECOG = True
-except Exception:
-    pass
-
-try:
-    from deepface import DeepFace
-    HAS_DEEPFACE = True
-except Exception:
-    pass
-
-try:
-    from fer import FER
-    HAS_FER = True
-except Exception:
-    pass
-
-try:
-    # Try transformers CLIP first
-    from transformers import CLIPProcessor, CLIPModel
-    import torch
-    HAS_CLIP = True
-except Exception:
-    try:
-        import clip
-        import torch
-        HAS_CLIP = True
-    except Exception:
-        HAS_CLIP = False
+# Optionale Backends: nur prüfen, ob installiert; importiert wird erst bei der ersten Nutzung
+HAS_FACE_RECOG = available('face_recognition')
+HAS_DEEPFACE = available('deepface')
+HAS_FER = available('fer')
+# transformers-CLIP bevorzugt, sonst openai/clip
+HAS_CLIP = available('torch') and (available('transformers') or available('clip'))
+
+# Pro Prozess einmal geladene Modelle
+_FER_DETECTOR = None
+_CLIP_CACHE = {}
 
 
 def get_exif_date(path: Path):
+    if path.suffix.lower() in CAPTURE_SUFFIXES:
+        try:
+            taken = get_capture_datetime(path)
+            if taken:
+                return taken.date().isoformat()
+        except Exception:
+            pass
     try:
-        with Image.open(path) as img:
-            exif = img._getexif()
-            if exif:
-                from PIL import ExifTags
-                for tag, value in exif.items():
-                    tag_name = ExifTags.TAGS.get(tag, tag)
-                    if tag_name == 'DateTimeOriginal':
-                        return datetime.strptime(value, "%Y:%m:%d %H:%M:%S").date().isoformat()
+        return datetime.fromtimestamp(path.stat().st_mtime).date().isoformat()
     except Exception:
-        pass
+        return None
+
+
+# CLIP arbeitet mit 224px; kleinere Variante für Stages, die keine volle Auflösung brauchen
+EMBED_MIN_SIDE = 224
+
+
+class DecodedImage:
+    """Einmal dekodiertes RGB-Bild, das sich alle Analyse-Stages teilen."""
+
+    def __init__(self, image: Image.Image):
+        self.image = image
+        self._array = None
+        self._small = None
+
+    @property
+    def array(self):
+        """RGB uint8-Array in voller Auflösung (face_recognition, FER)."""
+        if self._array is None:
+            import numpy as np
+            self._array = np.asarray(self.image)
+        return self._array
+
+    @property
+    def bgr(self):
+        """BGR-Ansicht für OpenCV-basierte Backends (DeepFace)."""
+        import numpy as np
+        return np.ascontiguousarray(self.array[:, :, ::-1])
+
+    def small(self, min_side: int = EMBED_MIN_SIDE) -> Image.Image:
+        """Verkleinerte Variante, deren kürzere Seite noch >= min_side ist."""
+        if self._small is None:
+            factor = min(self.image.size) // min_side
+            self._small = self.image.reduce(factor) if factor > 1 else self.image
+        return self._small
+
+
+def decode_image(path: Path, min_side: int = None):
+    """Liest und dekodiert die Datei genau einmal; None für Videos/nicht lesbare Dateien.
+
+    Mit min_side dekodieren JPEGs per Draft-Modus direkt verkleinert (kürzere Seite >= min_side),
+    wenn keine Stage die volle Auflösung braucht.
+    """
     try:
-        return datetime.fromtimestamp(path.stat().st_mtime).date().isoformat()
+        with Image.open(path) as img:
+            if min_side:
+                img.draft('RGB', (min_side, min_side))
+            return DecodedImage(img.convert('RGB'))
     except Exception:
         return None
 
 
-def get_face_data(path: Path):
+def get_face_data(path: Path, decoded: DecodedImage = None):
     """Return face locations and encodings if face_recognition available."""
     if not HAS_FACE_RECOG:
         return None
     try:
-        img = face_recognition.load_image_file(str(path))
+        import face_recognition
+        img = decoded.array if decoded else face_recognition.load_image_file(str(path))
         locations = face_recognition.face_locations(img)
         encodings = face_recognition.face_encodings(img, locations)
         return {
@@ -102,11 +137,13 @@ def get_face_data(path: Path):
         return None
 
 
-def get_emotions(path: Path):
+def get_emotions(path: Path, decoded: DecodedImage = None):
     """Try DeepFace first, then FER. Returns emotion dict or None."""
     if HAS_DEEPFACE:
         try:
-            res = DeepFace.analyze(str(path), actions=['emotion'], enforce_detection=False)
+            from deepface import DeepFace
+            res = DeepFace.analyze(decoded.bgr if decoded else str(path), actions=['emotion'],
+                                   enforce_detection=False)
             # DeepFace returns dict for single face, or list for many
             if isinstance(res, list) and res:
                 return res[0].get('emotion')
@@ -115,10 +152,8 @@ def get_emotions(path: Path):
             pass
     if HAS_FER:
         try:
-            image = Image.open(path).convert('RGB')
-            detector = FER(mtcnn=True)
-            arr = __pil_to_np(image)
-            emotions = detector.top_emotion(arr)
+            arr = decoded.array if decoded else __pil_to_np(Image.open(path).convert('RGB'))
+            emotions = _get_fer().top_emotion(arr)
             return {"top": emotions[0], "score": emotions[1]} if emotions else None
         except Exception:
             pass
@@ -130,27 +165,45 @@ def __pil_to_np(img: Image.Image):
     return np.array(img)
 
 
-def get_embedding(path: Path, model_cache={}):
+def _get_fer():
+    """FER-Detektor einmal pro Prozess erzeugen statt pro Bild."""
+    global _FER_DETECTOR
+    if _FER_DETECTOR is None:
+        from fer import FER
+        _FER_DETECTOR = FER(mtcnn=True)
+    return _FER_DETECTOR
+
+
+def _load_clip(model_cache: dict):
+    # prefer transformers CLIPModel
+    if model_cache:
+        return
+    try:
+        from transformers import CLIPProcessor, CLIPModel
+        processor = CLIPProcessor.from_pretrained('openai/clip-vit-base-patch32')
+        model = CLIPModel.from_pretrained('openai/clip-vit-base-patch32')
+        model_cache['transformers'] = (processor, model)
+    except Exception:
+        # fallback to openai/clip
+        import clip
+        import torch
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        model, preprocess = clip.load('ViT-B/32', device=device)
+        model_cache['clip'] = (model, preprocess, device)
+
+
+def get_embedding(path: Path, model_cache=_CLIP_CACHE, decoded: DecodedImage = None):
     """Return a vector embedding for the image if CLIP available."""
     if not HAS_CLIP:
         return None
     try:
-        # prefer transformers CLIPModel
-        if 'transformers' not in model_cache:
-            try:
-                processor = CLIPProcessor.from_pretrained('openai/clip-vit-base-patch32')
-                model = CLIPModel.from_pretrained('openai/clip-vit-base-patch32')
-                model_cache['transformers'] = (processor, model)
-            except Exception:
-                # fallback to openai/clip
-                import clip
-                device = 'cuda' if torch.cuda.is_available() else 'cpu'
-                model, preprocess = clip.load('ViT-B/32', device=device)
-                model_cache['clip'] = (model, preprocess, device)
+        import torch
+        _load_clip(model_cache)
 
+        # CLIP skaliert ohnehin auf 224px herunter, daher reicht die kleine Variante
+        image = decoded.small() if decoded else Image.open(path).convert('RGB')
         if 'transformers' in model_cache:
             processor, model = model_cache['transformers']
-            image = Image.open(path).convert('RGB')
             inputs = processor(images=image, return_tensors='pt')
             with torch.no_grad():
                 outputs = model.get_image_features(**inputs)
@@ -158,7 +211,7 @@ def get_embedding(path: Path, model_cache={}):
             return vec
         else:
             model, preprocess, device = model_cache['clip']
-            image = preprocess(Image.open(path)).unsqueeze(0).to(device)
+            image = preprocess(image).unsqueeze(0).to(device)
             with torch.no_grad():
                 vec = model.encode_image(image)
             return vec[0].cpu().numpy().tolist()
@@ -166,90 +219,536 @@ def get_embedding(path: Path, model_cache={}):
         return None
 
 
-def build_index(source_dir: str, out_file: str = 'insights_index.json'):
+def load_models():
+    """Lädt alle verfügbaren Modelle einmal in den aktuellen Prozess (Worker-Residency)."""
+    if HAS_FER:
+        try:
+            _get_fer()
+        except Exception:
+            pass
+    if HAS_DEEPFACE:
+        try:
+            from deepface import DeepFace
+            DeepFace.build_model('Emotion')
+        except Exception:
+            try:
+                from deepface import DeepFace
+                DeepFace.build_model(task='facial_attribute', model_name='Emotion')
+            except Exception:
+                pass
+    if HAS_CLIP:
+        try:
+            _load_clip(_CLIP_CACHE)
+        except Exception:
+            pass
+
+
+def _report_decode_savings(metrics: Metrics):
+    # Vorher hat jede bildverarbeitende Stage selbst dekodiert. Nicht gemessen, sondern hochgerechnet:
+    # gemessene Decode-Zeit x weitere Stages (der verkleinerte CLIP-Decode wäre billiger gewesen)
+    decode = metrics.wall.get('decode')
+    # die Hash-Stage nutzt den Decode immer
+    consumers = 1 + sum(1 for flag in (HAS_FACE_RECOG, HAS_DEEPFACE or HAS_FER, HAS_CLIP) if flag)
+    if decode and decode.count and consumers > 1:
+        print(f"  Decode-once spart geschätzt ca. {decode.sum * (consumers - 1):.2f}s "
+              f"(Schätzung: {decode.sum:.2f}s gemessener Decode x {consumers - 1} weitere Stages, "
+              f"die sonst selbst dekodiert hätten)")
+
+
+def _metrics(**kwargs) -> Metrics:
+    """Ein Analyse-Thread pro Prozess: CPU-Zeit des Prozesses, damit Torch-Threads mitzählen."""
+    return Metrics('photo_insights', cpu_clock=time.process_time, **kwargs)
+
+
+# Binärformat (siehe index_format.py); Pfade mit Endung .json werden im Altformat geschrieben
+DEFAULT_INDEX = 'insights_index.idx'
+
+MEDIA_SUFFIXES = ['.jpg', '.jpeg', '.png', '.tiff'] + list(VIDEO_SUFFIXES)
+
+# Alle N neuen Einträge wird das Journal per fsync auf die Platte gezwungen
+# (und die Schreibsperre des Embedding-Stores kurz freigegeben)
+JOURNAL_SYNC_EVERY = 50
+# Embedding-Store nach --build-index kompaktieren, wenn mindestens dieser Anteil der Zeilen veraltet ist
+STORE_COMPACT_RATIO = 0.25
+
+
+def analyze_file(p: Path, st: os.stat_result, metrics: Metrics = None, need_embedding: bool = True,
+                 hash_only: bool = False):
+    """Analysiert eine einzelne Datei und liefert (Index-Eintrag, Embedding oder None).
+
+    Die Datei wird einmal dekodiert; alle aktiven Stages arbeiten auf demselben Puffer.
+    Mit need_embedding=False wird CLIP übersprungen (Vektor liegt schon im EmbeddingStore),
+    mit hash_only=True werden nur die Perceptual Hashes berechnet (Nachtrag für alte Einträge).
+    """
+    from near_duplicates import HASH_MIN_SIDE, image_hashes
+    metrics = metrics or _metrics(verbosity=QUIET)
+    with metrics.stage('exif'):
+        item = {'path': str(p), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'date': get_exif_date(p)}
+    if p.suffix.lower() in VIDEO_SUFFIXES:
+        return analyze_video(p, item, metrics, need_embedding and not hash_only)
+    full_resolution = not hash_only and (HAS_FACE_RECOG or HAS_DEEPFACE or HAS_FER)
+    need_embedding = HAS_CLIP and need_embedding and not hash_only
+    with metrics.stage('decode', io=True):
+        decoded = decode_image(p, None if full_resolution else EMBED_MIN_SIDE if need_embedding else HASH_MIN_SIDE)
+    if decoded is None:
+        metrics.error('decode')
+        return item, None
+    with metrics.stage('hash'):
+        item.update(image_hashes(decoded.small()))
+    if not full_resolution and not need_embedding:
+        return item, None
+    if HAS_FACE_RECOG:
+        with metrics.stage('faces'):
+            face = get_face_data(p, decoded)
+        if face:
+            item['faces'] = face
+        else:
+            metrics.error('faces')
+    if HAS_DEEPFACE or HAS_FER:
+        with metrics.stage('emotions'):
+            emotions = get_emotions(p, decoded)
+        if emotions:
+            item['emotions'] = emotions
+    emb = None
+    if need_embedding:
+        with metrics.stage('embedding'):
+            emb = get_embedding(p, decoded=decoded)
+        if emb:
+            # der volle Vektor liegt im EmbeddingStore, nicht im Index
+            item['embedding_len'] = len(emb)
+        else:
+            metrics.error('embedding')
+    return item, emb
+
+
+def analyze_video(p: Path, item: dict, metrics: Metrics, need_embedding: bool = True):
+    """Videos: Dauer aus dem mvhd-Header, CLIP-Embeddings für einige Keyframes (video_frames.py).
+
+    Das Embedding ist hier ein dict frame_key -> Vektor (ein Eintrag pro Keyframe).
+    """
+    from embedding_store import frame_key
+    from video_frames import HAS_VIDEO_DECODER, keyframes, sample_times, video_duration
+    with metrics.stage('video', io=True):
+        duration = video_duration(p)
+    if duration:
+        item['duration'] = round(duration, 2)
+    if not (HAS_CLIP and HAS_VIDEO_DECODER and need_embedding):
+        return item, None
+    with metrics.stage('keyframes', io=True):
+        try:
+            frames = keyframes(p, sample_times(duration))
+        except Exception:
+            metrics.error('keyframes')
+            frames = []
+    embeddings = {}
+    with metrics.stage('embedding'):
+        for seconds, image in frames:
+            emb = get_embedding(p, decoded=DecodedImage(image))
+            if emb:
+                embeddings[frame_key(p, seconds)] = emb
+    if not embeddings:
+        return item, None
+    item['frames'] = [seconds for seconds, _ in frames if frame_key(p, seconds) in embeddings]
+    item['embedding_len'] = len(next(iter(embeddings.values())))
+    return item, embeddings
+
+
+def _init_worker(torch_threads: int):
+    """Initializer der Worker-Prozesse: Modelle einmal laden, Torch-Threads begrenzen."""
+    if HAS_CLIP and torch_threads:
+        import torch
+        torch.set_num_threads(torch_threads)
+    load_models()
+
+
+def _analyze_task(task):
+    """Einheit für den Prozess-Pool; liefert Ergebnis plus Metriken an den Schreiber zurück."""
+    path, st, need_embedding, hash_only, profile = task
+    metrics = _metrics(verbosity=QUIET)
+    with metrics.profile(profile):
+        item, emb = analyze_file(Path(path), st, metrics, need_embedding, hash_only)
+    return item, emb, metrics.snapshot()
+
+
+def _journal_path(out_file: str) -> Path:
+    return Path(str(out_file) + '.journal')
+
+
+def _replay_journal(journal: Path, index: dict):
+    """Übernimmt Einträge eines abgebrochenen Laufs; eine halb geschriebene letzte Zeile wird ignoriert."""
+    if not journal.exists():
+        return 0
+    count = 0
+    with open(journal, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            index[item['path']] = item
+            count += 1
+    return count
+
+
+def _write_index(index: dict, out_file: str):
+    from index_format import is_binary_index, save_binary_index, save_json_index
+    if is_binary_index(out_file):
+        save_binary_index(index, out_file)
+    else:
+        save_json_index(index, out_file)
+
+
+def _clip_model_name() -> str:
+    """Name, unter dem die Embeddings im Store abgelegt werden (muss zu get_embedding passen)."""
+    if available('transformers'):
+        from embedding_store import CLIP_MODEL_NAME
+        return CLIP_MODEL_NAME
+    return 'openai-clip/ViT-B/32'
+
+
+def build_index(source_dir: str, out_file: str = DEFAULT_INDEX, incremental: bool = False,
+                store_dir: str = None, workers: int = 1, metrics: Metrics = None):
+    """Baut den Insights-Index.
+
+    Jeder neue Eintrag wird sofort an ein Journal (<out_file>.journal) angehängt, sodass ein
+    abgebrochener Lauf beim nächsten Start fortgesetzt wird. Mit incremental=True werden
+    zusätzlich alle Einträge aus dem bestehenden Index übernommen, deren (Pfad, Größe, mtime_ns)
+    unverändert ist; gelöschte Dateien fallen heraus. Am Ende wird das Journal in den Index
+    kompaktiert. Ist store_dir gesetzt (und CLIP verfügbar), landen die Embeddings im
+    gemeinsamen EmbeddingStore, den auch photo_rag.py nutzt.
+
+    Mit workers > 1 wird die Analyse auf einen Prozess-Pool verteilt; jeder Worker lädt seine
+    Modelle einmal beim Start. Ergebnisse fließen an diesen Prozess zurück, der als einziger
+    Index, Journal und EmbeddingStore schreibt. Die Worker messen Stage-Zeiten (und optional
+    cProfile-Stichproben) selbst; zusammengeführt und berichtet wird hier über metrics.
+    """
+    metrics = metrics or _metrics()
     source = Path(source_dir)
     if not source.exists():
         print(f"Quelle nicht gefunden: {source}")
         return
+    journal = _journal_path(out_file)
+    # BinaryIndex ist read-only; das Journal wird in eine Kopie eingespielt (wie bei LiveIndex)
+    previous = dict(load_index(out_file).items()) if incremental else {}
+    resumed = _replay_journal(journal, previous)
+    if resumed:
+        print(f"Setze abgebrochenen Lauf fort ({resumed} Einträge aus {journal})")
+
+    store = None
+    if HAS_CLIP and store_dir:
+        from embedding_store import EmbeddingStore
+        store = EmbeddingStore(store_dir, _clip_model_name())
+
     index = {}
+    todo = []
     for p in source.rglob('*'):
-        if p.is_file() and p.suffix.lower() in ['.jpg', '.jpeg', '.png', '.tiff', '.mp4', '.mov']:
-            item = {'path': str(p), 'date': get_exif_date(p)}
-            face = get_face_data(p)
-            if face:
-                item['faces'] = face
-            emotions = get_emotions(p)
-            if emotions:
-                item['emotions'] = emotions
-            emb = get_embedding(p)
-            if emb:
-                item['embedding_len'] = len(emb)
-                # don't store full vectors by default to keep file small; store file for optional later use
-            index[str(p)] = item
-            print(f"Indexed: {p}")
-    with open(out_file, 'w', encoding='utf-8') as f:
-        json.dump(index, f, ensure_ascii=False, indent=2)
-    print(f"Index written to {out_file} ({len(index)} items)")
-
+        if p.is_file() and p.suffix.lower() in MEDIA_SUFFIXES:
+            st = p.stat()
+            old = previous.get(str(p))
+            if old and old.get('size') == st.st_size and old.get('mtime_ns') == st.st_mtime_ns:
+                index[str(p)] = old
+                if 'phash' not in old and p.suffix.lower() not in VIDEO_SUFFIXES:
+                    # Eintrag aus einer Version ohne Hash-Stage: nur die Hashes nachtragen
+                    todo.append((str(p), st, False, True))
+                continue
+            todo.append((str(p), st, store is None or not store.has(p, st), False))
+    reused = len(index)
+    stats = {path: st for path, st, _, _ in todo}
+    # cProfile-Stichprobe: schon bei der Vergabe festlegen, da die Worker nichts voneinander wissen
+    tasks = [task + (metrics.should_profile(i),) for i, task in enumerate(todo)]
+
+    pool = None
+    if workers > 1 and todo:
+        import multiprocessing
+        # Torch-Threads aufteilen, damit N Worker die Kerne nicht überbuchen
+        torch_threads = max(1, (os.cpu_count() or workers) // workers)
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(torch_threads,))
+        results = pool.imap_unordered(_analyze_task, tasks, chunksize=4)
+    else:
+        load_models()
+        results = map(_analyze_task, tasks)
 
-def load_index(path='insights_index.json'):
+    try:
+        with open(journal, 'a', encoding='utf-8') as jf:
+            for done, (item, emb, snapshot) in enumerate(results, 1):
+                path = item['path']
+                metrics.merge(snapshot)
+                if path in index:
+                    # Hash-Nachtrag zu einem unveränderten Eintrag
+                    item = {**index[path], **item}
+                if store is not None:
+                    if isinstance(emb, dict):
+                        # Video: ein Embedding pro Keyframe
+                        for key, vector in emb.items():
+                            store.add(key, stats[path], vector)
+                    elif emb:
+                        store.add(path, stats[path], emb)
+                    elif store.has(path, stats[path]):
+                        item['embedding_len'] = store.dim
+                index[path] = item
+                jf.write(json.dumps(item, ensure_ascii=False) + '\n')
+                jf.flush()
+                if done % JOURNAL_SYNC_EVERY == 0:
+                    os.fsync(jf.fileno())
+                    if store is not None:
+                        store.flush()
+                metrics.file_done(stats[path].st_size, f"Indexed: {path}")
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    if store is not None:
+        store.close()
+        _compact_store(store, metrics)
+    removed = len(set(previous) - set(index))
+    _write_index(index, out_file)
+    journal.unlink()
+    print(f"Index written to {out_file} ({len(index)} items, {len(index) - reused} new/changed, "
+          f"{reused} unchanged, {removed} removed)")
+    from face_clusters import clusters_path
+    if Path(clusters_path(out_file)).exists():
+        _update_face_clusters(out_file)
+    metrics.close()
+    _report_decode_savings(metrics)
+
+
+def _compact_store(store, metrics: Metrics):
+    # Leichen geänderter und gelöschter Dateien entfernen, sobald sie einen spürbaren Anteil ausmachen
+    with metrics.stage('store_compact', io=True):
+        dead = store.dead_rows()
+        if dead and dead >= STORE_COMPACT_RATIO * len(store):
+            before = len(store)
+            kept = store.compact()
+            print(f"Embedding-Store kompaktiert: {before} -> {kept} Zeilen")
+
+
+class LiveIndex:
+    """Insights-Index, der einzelne Dateien sofort aufnimmt (Watch-Modus, photo_watch.py).
+
+    Jeder Eintrag geht wie bei build_index sofort ins Journal; den Index selbst schreibt
+    compact() neu, also gebündelt und nicht pro Datei. Ein Abbruch verliert dadurch nichts,
+    der nächste Start übernimmt das Journal.
+    """
+
+    def __init__(self, out_file: str = DEFAULT_INDEX, store_dir: str = None, metrics: Metrics = None):
+        self.out_file = out_file
+        self.journal = _journal_path(out_file)
+        self.index = dict(load_index(out_file).items())
+        self.uncompacted = _replay_journal(self.journal, self.index)
+        self.store = None
+        if HAS_CLIP and store_dir:
+            from embedding_store import EmbeddingStore
+            self.store = EmbeddingStore(store_dir, _clip_model_name())
+        self.metrics = metrics or _metrics()
+        load_models()
+        self._jf = open(self.journal, 'a', encoding='utf-8')
+
+    def add(self, p: Path) -> list:
+        """Analysiert p und legt den Eintrag im Journal ab.
+
+        Rückgabe: [(Schlüssel, Vektor)] für die Vektor-DB (bei Videos einer pro Keyframe).
+        """
+        st = p.stat()
+        cached = self.store is not None and self.store.has(p, st)
+        with self.metrics.profile():
+            item, emb = analyze_file(p, st, self.metrics, need_embedding=not cached)
+        vectors = list(emb.items()) if isinstance(emb, dict) else [(str(p), emb)] if emb else []
+        if self.store is not None:
+            for key, vector in vectors:
+                self.store.add(key, st, vector)
+            if cached:
+                rows, keys = self.store.live(paths=[p])
+                vectors = list(zip(keys, self.store.vectors()[rows]))
+                item['embedding_len'] = self.store.dim
+            self.store.flush()
+        self.index[str(p)] = item
+        self._jf.write(json.dumps(item, ensure_ascii=False) + '\n')
+        self._jf.flush()
+        self.uncompacted += 1
+        return vectors
+
+    def compact(self):
+        """Schreibt den Index neu und leert das Journal; aktualisiert vorhandene Gesichts-Cluster."""
+        if not self.uncompacted:
+            return
+        os.fsync(self._jf.fileno())
+        _write_index(self.index, self.out_file)
+        self._jf.close()
+        self.journal.unlink()
+        self._jf = open(self.journal, 'a', encoding='utf-8')
+        print(f"Index geschrieben: {self.out_file} ({len(self.index)} items, {self.uncompacted} neu)")
+        self.uncompacted = 0
+        from face_clusters import clusters_path
+        if Path(clusters_path(self.out_file)).exists():
+            _update_face_clusters(self.out_file)
+
+    def close(self):
+        self.compact()
+        self._jf.close()
+        self.journal.unlink(missing_ok=True)
+        if self.store is not None:
+            self.store.close()
+
+
+def load_index(path=DEFAULT_INDEX):
+    """Lädt den Index; .idx-Ordner werden memory-mapped, .json-Dateien (Altformat) geparst."""
     if not Path(path).exists():
         return {}
-    return json.load(open(path, 'r', encoding='utf-8'))
+    from index_format import BinaryIndex, is_binary_index, load_json_index
+    if is_binary_index(path):
+        return BinaryIndex(path)
+    return load_json_index(path)
 
 
-def find_images_with_person(index_path='insights_index.json', known_face_dir=None, threshold=0.5):
-    if not HAS_FACE_RECOG:
+def find_images_with_person(index_path=DEFAULT_INDEX, known_face_dir=None, threshold=0.5):
+    """Sucht alle bekannten Personen in einem vektorisierten Durchlauf über alle Face-Encodings.
+
+    Rückgabe: {name: [{'path', 'distance', 'face'}, ...]} aufsteigend nach Distanz.
+    """
+    from face_search import known_faces_cache_path, load_known_faces, search_faces, stack_encodings
+    if not known_face_dir:
+        return {}
+    if not Path(known_face_dir).is_dir():
+        print(f"Ordner bekannter Gesichter nicht gefunden: {known_face_dir}")
+        return {}
+    try:
+        names, known = load_known_faces(known_face_dir, known_faces_cache_path(index_path))
+    except ImportError:
         print('face_recognition nicht installiert; cannot perform face matching')
+        return {}
+    index = load_index(index_path)
+    encodings, image_ids, paths = stack_encodings(index)
+    return search_faces(encodings, image_ids, paths, names, known, threshold=threshold)
+
+
+def _update_face_clusters(index_path: str):
+    """Ordnet neue Gesichter den bestehenden Clustern zu (nur wenn schon einmal geclustert wurde)."""
+    from face_clusters import FaceClusters, clusters_path, update_clusters
+    path = clusters_path(index_path)
+    clusters, stats = update_clusters(FaceClusters.load(path), load_index(index_path))
+    clusters.save(path)
+    print(f"Gesichts-Cluster aktualisiert: {stats['new_faces']} neue Gesichter, davon {stats['assigned']} "
+          f"bestehenden Clustern zugeordnet, {stats['new_clusters']} neue Cluster, "
+          f"{stats['removed_faces']} entfernt")
+
+
+def cluster_unknown_faces(index_path=DEFAULT_INDEX, threshold=0.5, k=10, method='whispers'):
+    """Gruppiert alle Gesichter im Index zu Identitäten (face_clusters.py) und speichert die Cluster.
+
+    Namen aus einem früheren Clustering werden auf die neuen Cluster übertragen. Spätere
+    Läufe von --build-index ordnen neue Gesichter automatisch zu. Rückgabe: Cluster-Übersicht.
+    """
+    from face_clusters import FaceClusters, clusters_path, cluster_faces
+    index = load_index(index_path)
+    if not index:
+        print(f"Index nicht gefunden oder leer: {index_path}")
+        return []
+    path = clusters_path(index_path)
+    previous = FaceClusters.load(path) if Path(path).exists() else None
+    clusters = cluster_faces(index, threshold=threshold, k=k, method=method, previous=previous)
+    clusters.save(path)
+    return clusters.summary()
+
+
+def list_face_clusters(index_path=DEFAULT_INDEX, min_size=2):
+    from face_clusters import FaceClusters, clusters_path
+    path = clusters_path(index_path)
+    if not Path(path).exists():
+        print(f"Keine Gesichts-Cluster gefunden ({path}); zuerst --cluster-faces ausführen")
         return []
+    return FaceClusters.load(path).summary(min_size=min_size)
+
+
+def name_face_cluster(index_path=DEFAULT_INDEX, image_path=None, name=None, face=0):
+    """Benennt den Cluster des face-ten Gesichts in image_path und damit alle Bilder der Person."""
+    from face_clusters import FaceClusters, clusters_path, name_face
+    path = clusters_path(index_path)
+    if not Path(path).exists():
+        print(f"Keine Gesichts-Cluster gefunden ({path}); zuerst --cluster-faces ausführen")
+        return None
+    clusters = FaceClusters.load(path)
+    result = name_face(clusters, image_path, name, slot=face)
+    if result is None:
+        print(f"Gesicht {face} in {image_path} ist nicht im Index")
+        return None
+    clusters.save(path)
+    return result
+
+
+def find_near_duplicates(index_path=DEFAULT_INDEX, kind='phash', max_distance=6):
+    """Gruppen von Beinahe-Duplikaten über die Perceptual Hashes im Index (siehe near_duplicates.py).
+
+    Rückgabe: [{'keep': pfad, 'duplicates': [{'path', 'size', 'distance'}, ...]}, ...]
+    """
+    from near_duplicates import find_duplicates
     index = load_index(index_path)
-    known_encodings = []
-    known_names = []
-    if known_face_dir:
-        kd = Path(known_face_dir)
-        for k in kd.iterdir():
-            if k.is_file():
-                img = face_recognition.load_image_file(str(k))
-                encs = face_recognition.face_encodings(img)
-                if encs:
-                    known_encodings.append(encs[0])
-                    known_names.append(k.stem)
-    results = {}
-    for path, item in index.items():
-        faces = item.get('faces')
-        if not faces:
-            continue
-        encodings = [__list_to_numpy(e) for e in faces.get('encodings', [])]
-        for i, enc in enumerate(encodings):
-            matches = face_recognition.compare_faces(known_encodings, enc, tolerance=threshold)
-            for mi, m in enumerate(matches):
-                if m:
-                    results.setdefault(known_names[mi], []).append(path)
-    return results
-
-
-def __list_to_numpy(lst):
-    import numpy as np
-    return np.array(lst)
+    if not index:
+        print(f"Index nicht gefunden oder leer: {index_path}")
+        return []
+    return find_duplicates(index, kind=kind, max_distance=max_distance)
 
 
 if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser(description='Build insights index and simple queries')
     parser.add_argument('--build-index', action='store_true')
+    parser.add_argument('--incremental', action='store_true', help='Unveränderte Dateien aus bestehendem Index übernehmen')
+    parser.add_argument('--workers', type=int, default=1, help='Anzahl Analyse-Prozesse (Modelle werden pro Prozess einmal geladen)')
     parser.add_argument('--source', type=str, default=SOURCE)
-    parser.add_argument('--out', type=str, default='insights_index.json')
+    parser.add_argument('--out', type=str, default=DEFAULT_INDEX, help='Index-Ziel (.idx = Binärformat, .json = Altformat)')
+    parser.add_argument('--embedding-store', type=str, default=os.getenv("EMBEDDING_STORE", "embedding_store"),
+                        help='Gemeinsamer Embedding-Store (leer lassen zum Deaktivieren)')
     parser.add_argument('--find-person', type=str, default=KNOWN_FACES, help='Folder with known faces to search for')
-    parser.add_argument('--index-path', type=str, default='insights_index.json')
+    parser.add_argument('--index-path', type=str, default=DEFAULT_INDEX)
+    parser.add_argument('--threshold', type=float, default=0.5, help='Maximale Face-Distanz für einen Treffer')
+    parser.add_argument('--convert-index', type=str, help='Bestehenden JSON-Index ins Binärformat (--out) konvertieren')
+    parser.add_argument('--find-duplicates', action='store_true', help='Gruppen von Beinahe-Duplikaten ausgeben (JSON)')
+    parser.add_argument('--hash', choices=('phash', 'dhash'), default='phash', help='Hash für --find-duplicates')
+    parser.add_argument('--max-distance', type=int, default=6, help='Maximale Bit-Distanz zweier Duplikate (von 64)')
+    parser.add_argument('--cluster-faces', action='store_true', help='Alle Gesichter im Index zu Personen gruppieren')
+    parser.add_argument('--cluster-method', choices=('whispers', 'components'), default='whispers')
+    parser.add_argument('--neighbors', type=int, default=10, help='Nachbarn je Gesicht im k-NN-Graph')
+    parser.add_argument('--list-clusters', action='store_true', help='Gesichts-Cluster ausgeben (JSON)')
+    parser.add_argument('--min-size', type=int, default=2, help='Kleinste ausgegebene Cluster-Größe (Gesichter)')
+    parser.add_argument('--name-face', type=str, help='Bild, dessen Gesicht (--face) den Namen --name bekommt')
+    parser.add_argument('--face', type=int, default=0, help='Nummer des Gesichts im Bild für --name-face')
+    parser.add_argument('--name', type=str, help='Name für --name-face (leer = Namen entfernen)')
+    add_metrics_arguments(parser)
     args = parser.parse_args()
 
-    if args.build_index:
+    if args.convert_index:
+        from index_format import convert_json_to_binary
+        count = convert_json_to_binary(args.convert_index, args.out)
+        print(f"Index konvertiert: {args.convert_index} -> {args.out} ({count} items)")
+    elif args.build_index:
         if not args.source:
             print('Set PHOTO_SOURCE or pass --source')
         else:
-            build_index(args.source, out_file=args.out)
+            build_index(args.source, out_file=args.out, incremental=args.incremental,
+                        store_dir=args.embedding_store, workers=args.workers,
+                        metrics=Metrics.from_args('photo_insights', args, cpu_clock=time.process_time))
+    elif args.find_duplicates:
+        groups = find_near_duplicates(index_path=args.index_path, kind=args.hash, max_distance=args.max_distance)
+        print(json.dumps(groups, indent=2, ensure_ascii=False))
+        print(f"{len(groups)} Gruppen, {sum(len(g['duplicates']) for g in groups)} Beinahe-Duplikate", file=sys.stderr)
+    elif args.cluster_faces:
+        clusters = cluster_unknown_faces(index_path=args.index_path, threshold=args.threshold,
+                                         k=args.neighbors, method=args.cluster_method)
+        print(json.dumps(clusters, indent=2, ensure_ascii=False))
+        print(f"{len(clusters)} Cluster mit >= 2 Gesichtern", file=sys.stderr)
+    elif args.list_clusters:
+        print(json.dumps(list_face_clusters(index_path=args.index_path, min_size=args.min_size),
+                         indent=2, ensure_ascii=False))
+    elif args.name_face:
+        result = name_face_cluster(index_path=args.index_path, image_path=args.name_face, name=args.name,
+                                   face=args.face)
+        if result:
+            print(f"Cluster {result['cluster']} ({result['faces']} Gesichter in {result['images']} Bildern) "
+                  f"heißt jetzt {result['name']!r}")
     elif args.find_person:
-        res = find_images_with_person(index_path=args.index_path, known_face_dir=args.find_person)
+        res = find_images_with_person(index_path=args.index_path, known_face_dir=args.find_person,
+                                      threshold=args.threshold)
         print(json.dumps(res, indent=2, ensure_ascii=False))
     else:
         parser.print_help()
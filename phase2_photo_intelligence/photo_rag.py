@@ -3,83 +3,121 @@ photo_rag.py
 
 Retrieval-Augmented Generation (RAG) für Bildersammlungen:
 - Nutzt CLIP-Embeddings für semantische Text-zu-Bild-Suche
-- Vector-DB (FAISS oder ChromaDB) für schnelles Similarity-Matching
+- Vector-DB (FAISS, ohne FAISS ein reiner NumPy-Index) für schnelles Similarity-Matching
 - Optional: LLM-Integration für natürlichsprachliche Konversation
 
 Beispiel-Queries:
     python photo_rag.py --build-vector-db
     python photo_rag.py --query "Strand im Sommer"
+    python photo_rag.py --query "Strand" --year 2023 --person Anna
     python photo_rag.py --chat  # interaktiver Modus
+    python photo_rag.py --serve  # Modell + Index geladen halten, --query/--chat nutzen den Server
 
-Requirements (optional): transformers, torch, faiss-cpu (oder faiss-gpu), chromadb, openai
+Requirements: numpy; optional: transformers, torch, faiss-cpu (oder faiss-gpu), chromadb, openai
 """
 
 import os
+import sys
 import json
 from pathlib import Path
 from typing import List, Dict, Optional
+import numpy as np
 from dotenv import load_dotenv
 
 load_dotenv()
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from media_common.backends import available
+from media_common.metrics import Metrics, add_arguments as add_metrics_arguments
+from embedding_store import (CLIP_MODEL_NAME, DEFAULT_STORE_DIR, FLUSH_EVERY, EmbeddingStore, frame_key,
+                             split_frame_key)
+from index_format import BinaryIndex, is_binary_index, load_json_index
+from metadata_filter import MetadataFilter, filters_path, index_signature, mapping_hasher, update_mapping_hash
+from query_cache import DEFAULT_TEXT_CACHE_SIZE, ResultCache, TextEmbeddingCache
+from video_frames import HAS_VIDEO_DECODER, FrameLoader, is_video, sample_times, video_duration
+from vector_index import (DEFAULT_INDEX_TYPE, DEFAULT_PQ_M, DEFAULT_QUANTIZATION, DEFAULT_RERANK, INDEX_TYPES,
+                          QUANTIZATIONS, load_vector_index, make_vector_index, meta_path)
+
 SOURCE = os.getenv("PHOTO_SOURCE")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")  # optional für LLM-Chat
+KNOWN_FACES = os.getenv("KNOWN_FACES_DIR")  # für den Personen-Filter
+RAG_SERVER = os.getenv("PHOTO_RAG_SERVER", "http://127.0.0.1:8765")
+TEXT_CACHE = os.getenv("TEXT_EMBEDDING_CACHE")  # ohne Angabe nur im Speicher
 
-# Optional imports
-HAS_CLIP = False
-HAS_FAISS = False
-HAS_CHROMADB = False
-HAS_OPENAI = False
-
-try:
-    from transformers import CLIPProcessor, CLIPModel
-    import torch
-    import numpy as np
-    HAS_CLIP = True
-except Exception:
-    pass
-
-try:
-    import faiss
-    HAS_FAISS = True
-except Exception:
-    pass
-
-try:
-    import chromadb
-    HAS_CHROMADB = True
-except Exception:
-    pass
-
-try:
-    from openai import OpenAI
-    HAS_OPENAI = True
-except Exception:
-    pass
+# Optionale Backends: nur prüfen, ob installiert; CLIP, FAISS und OpenAI werden erst bei Bedarf geladen
+HAS_CLIP = available('transformers', 'torch')
+HAS_FAISS = available('faiss')
+HAS_CHROMADB = available('chromadb')
+HAS_OPENAI = available('openai')
 
 
 class PhotoRAG:
-    def __init__(self, index_path='insights_index.json', vector_db_path='photo_vectors.faiss'):
+    def __init__(self, index_path='insights_index.idx', vector_db_path='photo_vectors.faiss',
+                 index_type: str = DEFAULT_INDEX_TYPE, nlist: int = None, nprobe: int = None,
+                 ef_search: int = None, hnsw_m: int = 32, quantization: str = DEFAULT_QUANTIZATION,
+                 pq_m: int = DEFAULT_PQ_M, rerank: int = None, known_faces_dir: str = KNOWN_FACES,
+                 text_cache_path: Optional[str] = TEXT_CACHE, text_cache_size: int = DEFAULT_TEXT_CACHE_SIZE):
         self.index_path = index_path
+        self.known_faces_dir = known_faces_dir
         self.vector_db_path = vector_db_path
+        self.index_params = {'index_type': index_type, 'nlist': nlist, 'hnsw_m': hnsw_m,
+                             'quantization': quantization, 'pq_m': pq_m}
+        # Such-Parameter; None = Wert aus dem gespeicherten Index bzw. Default
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.rerank = rerank
+        # CLIP wird erst beim ersten Embedding geladen (load_model)
         self.model = None
         self.processor = None
-        self.faiss_index = None
+        self.device = None
+        self.vector_index = None
+        self.metadata_filter = None
         self.id_to_path = []
+        # Schlüssel -> jüngste ID; ältere IDs ersetzter Dateien werden bei der Suche ausgeblendet
+        self.latest_id = {}
+        self.superseded = set()
+        self.mapping_hash = mapping_hasher([])
+        self.loaded_mapping_mtime = None
+        # per add_vectors ergänzt, aber noch nicht gespeichert (save_vector_db)
+        self.vectors_unsaved = False
         self.embeddings_cache = {}
-        
-        if HAS_CLIP:
-            print("Loading CLIP model...")
-            self.processor = CLIPProcessor.from_pretrained('openai/clip-vit-base-patch32')
-            self.model = CLIPModel.from_pretrained('openai/clip-vit-base-patch32')
-            self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
-            self.model.to(self.device)
-            print(f"CLIP loaded on {self.device}")
-        else:
+        # Text-Embeddings über Sitzungen hinweg, Trefferlisten nur solange sich der Index nicht ändert
+        self.text_cache = TextEmbeddingCache(CLIP_MODEL_NAME, text_cache_size, text_cache_path or None)
+        self.result_cache = ResultCache()
+
+    def load_model(self) -> bool:
+        """Lädt CLIP beim ersten Aufruf; False, wenn transformers/torch fehlen oder das Laden scheitert."""
+        if self.model is not None:
+            return True
+        if not HAS_CLIP:
             print("CLIP nicht verfügbar. Install: pip install transformers torch")
+            return False
+        print("Loading CLIP model...")
+        try:
+            import torch
+            from transformers import CLIPProcessor, CLIPModel
+            self.processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+            model = CLIPModel.from_pretrained(CLIP_MODEL_NAME)
+            self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+            self.model = model.to(self.device)
+        except Exception as e:
+            print(f"CLIP konnte nicht geladen werden: {e}")
+            return False
+        print(f"CLIP loaded on {self.device}")
+        return True
 
-    def build_vector_db(self, source_dir: str = None, force_rebuild=False):
-        """Erstellt FAISS-Index aus allen Bildern im Quellverzeichnis."""
+    def build_vector_db(self, source_dir: str = None, force_rebuild=False, batch_size: int = 32,
+                        threads: int = 4, torch_threads: int = None, store_dir: str = DEFAULT_STORE_DIR,
+                        metrics: Metrics = None):
+        """Erstellt FAISS-Index aus allen Bildern im Quellverzeichnis.
+
+        Embeddings, die bereits im gemeinsamen EmbeddingStore liegen (z.B. von photo_insights.py),
+        werden wiederverwendet. Nur fehlende Bilder werden in einem Thread-Pool dekodiert,
+        während CLIP auf vollen Batches rechnet. Videos gehen mit einigen Keyframes pro Clip in
+        den Index (video_frames.py), sofern PyAV oder OpenCV installiert ist.
+        Zeiten und Zähler des Laufs landen in metrics (siehe media_common/metrics.py).
+        """
+        metrics = metrics or Metrics('photo_rag')
         if not HAS_CLIP:
             print("CLIP erforderlich für Vector-DB-Erstellung")
             return
@@ -89,112 +127,328 @@ class PhotoRAG:
             print(f"Quelle nicht gefunden: {source}")
             return
         
-        from PIL import Image
-        embeddings = []
-        paths = []
+        from embedding_engine import BatchEmbedder
         
         print(f"Scanne Bilder in {source}...")
-        for p in source.rglob('*'):
-            if p.is_file() and p.suffix.lower() in ['.jpg', '.jpeg', '.png', '.tiff']:
-                try:
-                    image = Image.open(p).convert('RGB')
-                    inputs = self.processor(images=image, return_tensors='pt').to(self.device)
-                    with torch.no_grad():
-                        image_features = self.model.get_image_features(**inputs)
-                    embedding = image_features[0].cpu().numpy()
-                    embeddings.append(embedding)
-                    paths.append(str(p))
-                    print(f"✓ {p.name}")
-                except Exception as e:
-                    print(f"✗ {p.name}: {e}")
+        with metrics.stage('scan'):
+            files = [p for p in source.rglob('*')
+                     if p.is_file() and p.suffix.lower() in ['.jpg', '.jpeg', '.png', '.tiff']]
+            videos = [p for p in source.rglob('*') if p.is_file() and is_video(p)] if HAS_VIDEO_DECODER else []
+            stats = {p: p.stat() for p in files + videos}
+        store = EmbeddingStore(store_dir, CLIP_MODEL_NAME)
+        missing = files if force_rebuild else [p for p in files if not store.has(p, stats[p])]
+        missing_videos = videos if force_rebuild else [p for p in videos if not store.has(p, stats[p])]
+        metrics.count('store_hits', len(files) - len(missing))
+        print(f"{len(files) - len(missing)} Embeddings aus dem Store, {len(missing)} neu zu berechnen"
+              + (f", {len(missing_videos)} von {len(videos)} Videos" if videos else ""))
+        
+        if missing or missing_videos:
+            if not self.load_model():
+                store.close()
+                return
+            embedder = BatchEmbedder(self.processor, self.model, self.device, batch_size=batch_size,
+                                     threads=threads, torch_threads=torch_threads, metrics=metrics)
+            # Schreibsperre des Stores regelmäßig freigeben (photo_watch/--build-index warten darauf)
+            for i, (p, embedding) in enumerate(embedder.embed(missing), 1):
+                store.add(p, stats[p], embedding)
+                metrics.file_done(stats[p].st_size, f"✓ {p.name}")
+                if i % FLUSH_EVERY == 0:
+                    store.flush()
+            # Videos: wenige Keyframes pro Clip, jeder Frame ein eigener Vektor
+            frames = [frame_key(p, t) for p in missing_videos for t in sample_times(video_duration(p))]
+            for i, (key, embedding) in enumerate(embedder.embed(frames, loader=FrameLoader(frames)), 1):
+                video, seconds = split_frame_key(key)
+                store.add(key, stats[Path(video)], embedding)
+                metrics.count('frames')
+                if i % FLUSH_EVERY == 0:
+                    store.flush()
+                metrics.log(f"✓ {Path(video).name} @ {seconds:.1f}s")
+            embedder.report()
         
-        if not embeddings:
+        rows, paths = store.live(paths=files + videos)
+        self._write_vector_db(store, rows, paths, metrics)
+        store.close()
+        metrics.close()
+
+    def build_vector_db_from_store(self, store_dir: str = DEFAULT_STORE_DIR, metrics: Metrics = None):
+        """Baut den FAISS-Index allein aus dem EmbeddingStore, ohne ein Bild zu öffnen."""
+        metrics = metrics or Metrics('photo_rag')
+        store = EmbeddingStore(store_dir, CLIP_MODEL_NAME)
+        rows, paths = store.live(only_existing=True)
+        self._write_vector_db(store, rows, paths, metrics)
+        store.close()
+
+    def _write_vector_db(self, store: EmbeddingStore, rows, paths: List[str], metrics: Metrics):
+        if not paths:
             print("Keine Embeddings erstellt")
             return
         
-        # FAISS-Index erstellen
-        embeddings_np = np.array(embeddings).astype('float32')
-        dimension = embeddings_np.shape[1]
+        # Vektor-Index erstellen (FAISS oder NumPy-Fallback, Typ siehe vector_index.py)
+        embeddings_np = np.ascontiguousarray(store.vectors()[rows], dtype='float32')
         
-        if HAS_FAISS:
-            self.faiss_index = faiss.IndexFlatL2(dimension)
-            self.faiss_index.add(embeddings_np)
-            faiss.write_index(self.faiss_index, self.vector_db_path)
-            
-            # Mapping speichern
-            mapping_path = self.vector_db_path.replace('.faiss', '_mapping.json')
-            with open(mapping_path, 'w', encoding='utf-8') as f:
-                json.dump(paths, f, ensure_ascii=False, indent=2)
-            
-            print(f"✅ FAISS-Index mit {len(embeddings)} Bildern erstellt: {self.vector_db_path}")
-        else:
-            print("FAISS nicht installiert. Install: pip install faiss-cpu")
+        if not HAS_FAISS:
+            print("FAISS nicht installiert, nutze NumPy-Backend. Für ANN-Indizes: pip install faiss-cpu")
+        self.vector_index = make_vector_index(nprobe=self.nprobe or 16, ef_search=self.ef_search or 64,
+                                              rerank=DEFAULT_RERANK if self.rerank is None else self.rerank,
+                                              **self.index_params)
+        with metrics.stage('index_build'):
+            self.vector_index.build(embeddings_np)
+            self.vector_index.save(self.vector_db_path)
+        
+        self.vectors_unsaved = False
+        self._write_mapping(paths)
+        
+        print(f"✅ Vektor-Index ({self.vector_index.backend}, {self.vector_index.index_type}, "
+              f"{self.vector_index.quantization}) mit {len(paths)} Bildern erstellt: {self.vector_db_path}")
+
+    def add_vectors(self, paths: List[str], vectors: np.ndarray):
+        """Fügt neue Bilder inkrementell zum bestehenden Index hinzu.
+
+        Das Mapping wird nur fortgeschrieben (eine JSON-Zeile pro Pfad), der Index erst mit
+        save_vector_db gespeichert; kleine Batches kosten so nicht jedes Mal die ganze Bibliothek.
+        Ein schon vorhandener Pfad (Datei ersetzt) bekommt eine neue ID, die alte gilt als veraltet.
+        """
+        if self.vector_index is None and not self.load_vector_db():
+            return False
+        paths = [str(p) for p in paths]
+        self.vector_index.add(np.atleast_2d(vectors))
+        with open(self.mapping_log_path, 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(p, ensure_ascii=False) + '\n' for p in paths)
+        self._note_ids(paths, len(self.id_to_path))
+        self.id_to_path.extend(paths)
+        update_mapping_hash(self.mapping_hash, paths)
+        self.vectors_unsaved = True
+        self.loaded_mapping_mtime = self._mapping_mtime()
+        return True
+
+    def save_vector_db(self) -> bool:
+        """Speichert die per add_vectors ergänzten Vektoren (Watch-Modus: beim Kompaktieren, im Leerlauf, beim Beenden)."""
+        if self.vector_index is None or not self.vectors_unsaved:
+            return False
+        self.vector_index.save(self.vector_db_path)
+        self.vectors_unsaved = False
+        self.loaded_mapping_mtime = self._mapping_mtime()
+        return True
+
+    @property
+    def mapping_path(self) -> str:
+        return self.vector_db_path.replace('.faiss', '_mapping.json')
+
+    @property
+    def mapping_log_path(self) -> str:
+        return self.vector_db_path.replace('.faiss', '_mapping_added.jsonl')
+
+    def _write_mapping(self, paths: List[str]):
+        """Komplettes Mapping schreiben; bis dahin angehängte Einträge sind darin enthalten."""
+        with open(self.mapping_path, 'w', encoding='utf-8') as f:
+            json.dump(paths, f, ensure_ascii=False, indent=2)
+        Path(self.mapping_log_path).unlink(missing_ok=True)
+        self.id_to_path = paths
+        self._index_mapping()
+        self.mapping_hash = mapping_hasher(paths)
+        self.loaded_mapping_mtime = self._mapping_mtime()
+
+    def _index_mapping(self):
+        self.latest_id, self.superseded = {}, set()
+        self._note_ids(self.id_to_path, 0)
+
+    def _note_ids(self, keys: List[str], start: int):
+        for i, key in enumerate(keys, start):
+            old = self.latest_id.get(key)
+            if old is not None:
+                self.superseded.add(old)
+            self.latest_id[key] = i
+
+    def _mapping_mtime(self):
+        # Mapping (Build), angehängte Einträge (add_vectors) und Meta-Datei (jedes Speichern des Index)
+        return tuple(Path(p).stat().st_mtime_ns if Path(p).exists() else None
+                     for p in (self.mapping_path, self.mapping_log_path, meta_path(self.vector_db_path)))
+
+    def reload_if_changed(self) -> bool:
+        """Lädt Vektor-DB und Mapping neu, falls sie seit dem Laden neu geschrieben wurden."""
+        if self.vector_index is None or self._mapping_mtime() == self.loaded_mapping_mtime:
+            return False
+        print("Vektor-DB hat sich geändert, lade neu...")
+        self.metadata_filter = None
+        return self.load_vector_db()
 
     def load_vector_db(self):
-        """Lädt bestehenden FAISS-Index."""
-        if not HAS_FAISS:
-            print("FAISS benötigt")
+        """Lädt bestehenden Vektor-Index (FAISS oder NumPy, je nach Meta-Datei)."""
+        try:
+            self.vector_index = load_vector_index(self.vector_db_path, nprobe=self.nprobe, ef_search=self.ef_search,
+                                                  rerank=self.rerank)
+        except RuntimeError as e:
+            print(e)
             return False
-        
-        if not Path(self.vector_db_path).exists():
+        if self.vector_index is None:
             print(f"Vector-DB nicht gefunden: {self.vector_db_path}")
             return False
         
-        self.faiss_index = faiss.read_index(self.vector_db_path)
-        
-        mapping_path = self.vector_db_path.replace('.faiss', '_mapping.json')
-        if Path(mapping_path).exists():
-            with open(mapping_path, 'r', encoding='utf-8') as f:
+        self.loaded_mapping_mtime = self._mapping_mtime()
+        self.vectors_unsaved = False
+        if Path(self.mapping_path).exists():
+            with open(self.mapping_path, 'r', encoding='utf-8') as f:
                 self.id_to_path = json.load(f)
+        damaged = False
+        if Path(self.mapping_log_path).exists():
+            with open(self.mapping_log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.id_to_path.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        damaged = True  # beim Anhängen abgebrochene letzte Zeile
+                        break
+        if len(self.id_to_path) > self.vector_index.ntotal:
+            # Abbruch vor save_vector_db: diese Vektoren fehlen im gespeicherten Index
+            print(f"⚠️ {len(self.id_to_path) - self.vector_index.ntotal} Mapping-Einträge ohne gespeicherten Vektor "
+                  f"verworfen (vollständig neu bauen: --build-vector-db --from-store)")
+            damaged = True
+        if damaged:
+            self._write_mapping(self.id_to_path[:self.vector_index.ntotal])
+        self._index_mapping()
+        self.mapping_hash = mapping_hasher(self.id_to_path)
         
-        print(f"✅ Vector-DB geladen: {self.faiss_index.ntotal} Bilder")
+        print(f"✅ Vector-DB geladen: {self.vector_index.ntotal} Bilder "
+              f"({self.vector_index.backend}, {self.vector_index.index_type}, {self.vector_index.quantization})")
         return True
 
-    def search(self, query: str, top_k: int = 5) -> List[Dict]:
-        """Sucht ähnlichste Bilder zur Text-Query."""
-        if not HAS_CLIP or not self.model:
-            print("CLIP nicht verfügbar")
-            return []
+    def load_metadata_filter(self) -> MetadataFilter:
+        """Posting-Listen für Datum/Ordner/Person/Emotion; neu gebaut, wenn Insights-Index,
+        Vektor-DB oder KNOWN_FACES_DIR sich geändert haben."""
+        path = filters_path(self.vector_db_path)
+        signature = index_signature(self.index_path, self.mapping_hash.hexdigest(), self.known_faces_dir)
+        if self.metadata_filter is None and Path(path).exists():
+            self.metadata_filter = MetadataFilter.load(path)
+        if self.metadata_filter is not None and self.metadata_filter.is_current(
+                len(self.id_to_path), signature, self.known_faces_dir):
+            return self.metadata_filter
         
-        if self.faiss_index is None:
-            if not self.load_vector_db():
-                return []
-        
-        # Text-Embedding
-        inputs = self.processor(text=[query], return_tensors='pt', padding=True).to(self.device)
-        with torch.no_grad():
-            text_features = self.model.get_text_features(**inputs)
-        query_embedding = text_features[0].cpu().numpy().astype('float32').reshape(1, -1)
-        
-        # FAISS-Suche
-        distances, indices = self.faiss_index.search(query_embedding, top_k)
+        index = {}
+        if Path(self.index_path).exists():
+            index = BinaryIndex(self.index_path) if is_binary_index(self.index_path) else load_json_index(self.index_path)
+        else:
+            print(f"Insights-Index nicht gefunden: {self.index_path} (nur Ordner-Filter verfügbar)")
+        print("Baue Metadaten-Filter...")
+        self.metadata_filter = MetadataFilter.build(index, self.id_to_path, self.known_faces_dir, source=signature)
+        self.metadata_filter.save(path)
+        return self.metadata_filter
+
+    def search(self, query: str, top_k: int = 5, filters: Optional[Dict] = None) -> List[Dict]:
+        """Sucht ähnlichste Bilder zur Text-Query.
+
+        filters: optional date_from, date_to, year, folder, person, emotion (siehe
+        MetadataFilter.mask); gefiltert wird innerhalb der Index-Suche, nicht danach.
+        """
+        if not self.ready():
+            return []
+        return self.search_batch([(query, top_k, filters)])[0]
+
+    def search_batch(self, requests: List[tuple]) -> List[List[Dict]]:
+        """Mehrere (query, top_k, filters) mit gemeinsamem Embedding-Aufruf; nutzt Text- und Ergebnis-Cache."""
+        # Index-, Insights-, Cluster- oder KNOWN_FACES_DIR-Änderung macht gecachte Trefferlisten ungültig
+        signature = index_signature(self.index_path, known_face_dir=self.known_faces_dir)
+        self.result_cache.validate((self.loaded_mapping_mtime, signature['index_mtime_ns'],
+                                    signature['clusters_mtime_ns'], signature.get('known_faces_stamp')))
+        keys = [ResultCache.key(*req) for req in requests]
+        results = [self.result_cache.get(key) for key in keys]
+        todo = [i for i, r in enumerate(results) if r is None]
+        if todo:
+            embeddings = self.embed_texts([requests[i][0] for i in todo])
+            for i, embedding in zip(todo, embeddings):
+                query, top_k, filters = requests[i]
+                results[i] = self.search_embedding(embedding.reshape(1, -1), top_k, filters)
+                self.result_cache.put(keys[i], results[i])
+        return results
+
+    def ready(self) -> bool:
+        """CLIP installiert und Vektor-DB verfügbar (wird bei Bedarf geladen).
+
+        Das Modell selbst lädt erst embed_texts, und nur wenn eine Query nicht im Text-Cache liegt.
+        """
+        if not HAS_CLIP:
+            print("CLIP nicht verfügbar")
+            return False
+        return self.vector_index is not None or self.load_vector_db()
+
+    def embed_texts(self, queries: List[str]) -> np.ndarray:
+        """CLIP-Text-Embeddings (n x dim); nur nicht gecachte Queries gehen in einen get_text_features-Aufruf."""
+        vectors, keys = self.text_cache.lookup(queries)
+        missing = list(dict.fromkeys(k for k, v in zip(keys, vectors) if v is None))
+        if missing:
+            if not self.load_model():
+                raise RuntimeError("CLIP nicht verfügbar")
+            import torch
+            # normalisierter Text ergibt dasselbe Embedding (CLIP-Tokenizer arbeitet lowercase)
+            inputs = self.processor(text=missing, return_tensors='pt', padding=True).to(self.device)
+            with torch.no_grad():
+                text_features = self.model.get_text_features(**inputs)
+            computed = dict(zip(missing, text_features.cpu().numpy().astype('float32')))
+            for key, vector in computed.items():
+                self.text_cache.store(key, vector)
+            vectors = [v if v is not None else computed[k] for k, v in zip(keys, vectors)]
+        return np.stack(vectors)
+
+    def cache_stats(self) -> Dict:
+        return {'text_embeddings': self.text_cache.stats(), 'results': self.result_cache.stats()}
+
+    def close(self):
+        """Schreibt den Text-Embedding-Cache auf die Platte."""
+        self.text_cache.save()
+
+    def search_embedding(self, query_embedding: np.ndarray, top_k: int, filters: Optional[Dict] = None) -> List[Dict]:
+        """Index-Suche für ein bereits berechnetes Query-Embedding (1 x dim)."""
+        allowed = None
+        if filters:
+            allowed = self.load_metadata_filter().mask(self.vector_index.ntotal, **filters)
+        if self.superseded:
+            # alte Vektoren ersetzter Dateien (bis zum nächsten kompletten Build)
+            if allowed is None:
+                allowed = np.ones(self.vector_index.ntotal, dtype=bool)
+            allowed[[i for i in self.superseded if i < len(allowed)]] = False
+        distances, indices = self.vector_index.search(query_embedding, top_k, allowed=allowed)
+        scores = self.vector_index.scores(distances)
         
         results = []
         for i, idx in enumerate(indices[0]):
-            if idx < len(self.id_to_path):
-                results.append({
-                    'path': self.id_to_path[idx],
-                    'distance': float(distances[0][i]),
-                    'score': 1.0 / (1.0 + float(distances[0][i]))  # normalisiert
-                })
+            if 0 <= idx < len(self.id_to_path):
+                score = float(scores[0][i])
+                path, seconds = split_frame_key(self.id_to_path[idx])
+                result = {
+                    'path': path,
+                    # Kosinus-Distanz bei normalisierten Indizes, sonst L2
+                    'distance': 1.0 - score if self.vector_index.normalized else float(distances[0][i]),
+                    'score': score
+                }
+                if seconds is not None:
+                    # Treffer in einem Video: Zeitpunkt des Keyframes
+                    result['time'] = seconds
+                results.append(result)
         
         return results
 
-    def chat(self, user_query: str, top_k: int = 3) -> str:
-        """Nutzt LLM + Retrieval für natürlichsprachliche Antwort."""
-        if not HAS_OPENAI or not OPENAI_API_KEY:
+    @property
+    def has_llm(self) -> bool:
+        return HAS_OPENAI and bool(OPENAI_API_KEY)
+
+    def chat(self, user_query: str, top_k: int = 3, results: Optional[List[Dict]] = None) -> str:
+        """Nutzt LLM + Retrieval für natürlichsprachliche Antwort.
+
+        results: bereits abgerufene Treffer (z.B. vom Server-Batch), sonst wird hier gesucht.
+        """
+        if results is None:
+            results = self.search(user_query, top_k)
+        if not self.has_llm:
             print("OpenAI API nicht konfiguriert. Setze OPENAI_API_KEY in .env")
             # Fallback: nur Retrieval
-            results = self.search(user_query, top_k)
             if not results:
                 return "Keine passenden Bilder gefunden."
             return f"Gefundene Bilder:\n" + "\n".join([f"- {r['path']} (Score: {r['score']:.2f})" for r in results])
         
-        # Retrieval
-        results = self.search(user_query, top_k)
-        context = "\n".join([f"Bild {i+1}: {r['path']}" for i, r in enumerate(results)])
+        context = "\n".join([f"Bild {i+1}: {r['path']}" + (f" (Video, bei {r['time']:.0f}s)" if 'time' in r else '')
+                             for i, r in enumerate(results)])
         
         # LLM-Call
+        from openai import OpenAI
         client = OpenAI(api_key=OPENAI_API_KEY)
         messages = [
             {"role": "system", "content": "Du bist ein hilfreicher Assistent für Foto-Sammlungen. Basierend auf abgerufenen Bildern beantwortest du Fragen."},
@@ -216,20 +470,25 @@ def interactive_chat(rag: PhotoRAG):
     while True:
         query = input("Du: ").strip()
         if query.lower() in ['exit', 'quit', 'bye']:
+            if isinstance(rag, PhotoRAG):
+                stats = rag.cache_stats()
+                print(f"Cache-Treffer: Text-Embeddings {stats['text_embeddings']['hits']}, "
+                      f"Ergebnisse {stats['results']['hits']}")
             print("Tschüss!")
             break
         if not query:
             continue
         
-        # Einfache Suche
+        # Einfache Suche; die Top-3 gehen direkt an den LLM-Chat statt erneut zu suchen
         results = rag.search(query, top_k=5)
         print(f"\n📸 Top {len(results)} Ergebnisse:")
         for i, r in enumerate(results, 1):
-            print(f"{i}. {Path(r['path']).name} (Score: {r['score']:.3f})")
+            at = f" @ {r['time']:.1f}s" if 'time' in r else ''
+            print(f"{i}. {Path(r['path']).name}{at} (Score: {r['score']:.3f})")
         
         # Optional: LLM-Chat
-        if HAS_OPENAI and OPENAI_API_KEY:
-            answer = rag.chat(query)
+        if rag.has_llm:
+            answer = rag.chat(query, results=results[:3])
             print(f"\n💬 Antwort:\n{answer}\n")
         print()
 
@@ -238,23 +497,79 @@ if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser(description='RAG für Bildersammlungen')
     parser.add_argument('--build-vector-db', action='store_true', help='Erstelle FAISS-Index')
+    parser.add_argument('--from-store', action='store_true', help='FAISS-Index nur aus dem Embedding-Store neu bauen')
+    parser.add_argument('--embedding-store', type=str, default=DEFAULT_STORE_DIR, help='Ordner des gemeinsamen Embedding-Stores')
     parser.add_argument('--source', type=str, default=SOURCE, help='Quellverzeichnis')
     parser.add_argument('--query', type=str, help='Text-Suche (z.B. "Strand im Sommer")')
     parser.add_argument('--chat', action='store_true', help='Interaktiver Chat-Modus')
     parser.add_argument('--top-k', type=int, default=5, help='Anzahl Ergebnisse')
+    parser.add_argument('--batch-size', type=int, default=32, help='Bilder pro CLIP-Batch')
+    parser.add_argument('--threads', type=int, default=4, help='Decode-/Preprocessing-Threads')
+    parser.add_argument('--torch-threads', type=int, help='Threads für die Torch-Inferenz (Default: Torch-Standard)')
+    parser.add_argument('--index-type', choices=INDEX_TYPES, default=DEFAULT_INDEX_TYPE,
+                        help='Vektor-Index: flat-ip (Kosinus, exakt), flat-l2 (alt), ivf, hnsw')
+    parser.add_argument('--nlist', type=int, help='IVF: Anzahl Listen (Default 4*sqrt(N))')
+    parser.add_argument('--nprobe', type=int, help='IVF: durchsuchte Listen pro Query (Recall vs. Latenz)')
+    parser.add_argument('--ef-search', type=int, help='HNSW: Kandidatenliste pro Query (Recall vs. Latenz)')
+    parser.add_argument('--hnsw-m', type=int, default=32, help='HNSW: Nachbarn pro Knoten')
+    parser.add_argument('--quantization', choices=QUANTIZATIONS, default=DEFAULT_QUANTIZATION,
+                        help='Vektor-Speicher: none (float32), fp16, int8 oder pq (nur FAISS)')
+    parser.add_argument('--pq-m', type=int, default=DEFAULT_PQ_M, help='PQ: Byte pro Vektor (Teiler der Dimension)')
+    parser.add_argument('--rerank', type=int,
+                        help=f'Quantisiert: rerank*k Kandidaten exakt neu bewerten (Default {DEFAULT_RERANK}, 0 = aus)')
+    parser.add_argument('--index-path', type=str, default='insights_index.idx', help='Insights-Index für die Filter')
+    parser.add_argument('--known-faces', type=str, default=KNOWN_FACES, help='Ordner bekannter Gesichter (Personen-Filter)')
+    parser.add_argument('--year', type=int, help='Filter: Aufnahmejahr')
+    parser.add_argument('--date-from', type=str, help='Filter: ab Datum (YYYY-MM-DD)')
+    parser.add_argument('--date-to', type=str, help='Filter: bis Datum (YYYY-MM-DD)')
+    parser.add_argument('--folder', type=str, action='append', help='Filter: Ordner inkl. Unterordner (mehrfach = ODER)')
+    parser.add_argument('--person', type=str, action='append', help='Filter: Person aus KNOWN_FACES_DIR (mehrfach = UND)')
+    parser.add_argument('--emotion', type=str, action='append', help='Filter: dominante Emotion (mehrfach = ODER)')
+    parser.add_argument('--serve', action='store_true', help='Als Server laufen (Modell + Index bleiben geladen)')
+    parser.add_argument('--server-url', type=str, default=RAG_SERVER, help='Adresse des Such-Servers')
+    parser.add_argument('--no-server', action='store_true', help='Laufenden Server ignorieren und lokal suchen')
+    parser.add_argument('--text-cache', type=str, default=TEXT_CACHE,
+                        help='Datei für gecachte Text-Embeddings (Default: nur im Speicher)')
+    parser.add_argument('--text-cache-size', type=int, default=DEFAULT_TEXT_CACHE_SIZE, help='Max. gecachte Queries (LRU)')
+    add_metrics_arguments(parser)
     args = parser.parse_args()
     
-    rag = PhotoRAG()
+    rag = None
+    if (args.query or args.chat) and not args.no_server:
+        from rag_server import connect
+        rag = connect(args.server_url)
+        if rag is not None:
+            print(f"Nutze laufenden Server {args.server_url} ({rag.info.get('images')} Bilder)")
+    if rag is None and (args.serve or args.build_vector_db or args.query or args.chat):
+        rag = PhotoRAG(index_path=args.index_path, index_type=args.index_type, nlist=args.nlist, nprobe=args.nprobe,
+                       ef_search=args.ef_search, hnsw_m=args.hnsw_m, quantization=args.quantization,
+                       pq_m=args.pq_m, rerank=args.rerank, known_faces_dir=args.known_faces,
+                       text_cache_path=args.text_cache, text_cache_size=args.text_cache_size)
     
-    if args.build_vector_db:
-        rag.build_vector_db(source_dir=args.source)
+    if args.serve:
+        from rag_server import serve
+        serve(rag, args.server_url)
+    elif args.build_vector_db and args.from_store:
+        metrics = Metrics.from_args('photo_rag', args)
+        rag.build_vector_db_from_store(store_dir=args.embedding_store, metrics=metrics)
+        metrics.close()
+    elif args.build_vector_db:
+        rag.build_vector_db(source_dir=args.source, batch_size=args.batch_size,
+                            threads=args.threads, torch_threads=args.torch_threads,
+                            store_dir=args.embedding_store, metrics=Metrics.from_args('photo_rag', args))
     elif args.query:
-        results = rag.search(args.query, top_k=args.top_k)
+        filters = {k: v for k, v in (('year', args.year), ('date_from', args.date_from), ('date_to', args.date_to),
+                                     ('folder', args.folder), ('person', args.person),
+                                     ('emotion', args.emotion)) if v}
+        results = rag.search(args.query, top_k=args.top_k, filters=filters)
         print(f"\n📸 Top {len(results)} Ergebnisse für '{args.query}':")
         for i, r in enumerate(results, 1):
-            print(f"{i}. {r['path']}")
+            print(f"{i}. {r['path']}" + (f" @ {r['time']:.1f}s" if 'time' in r else ''))
             print(f"   Score: {r['score']:.3f}")
     elif args.chat:
         interactive_chat(rag)
     else:
         parser.print_help()
+    
+    if isinstance(rag, PhotoRAG):
+        rag.close()
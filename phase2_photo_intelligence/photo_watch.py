@@ -0,0 +1,255 @@
+"""
+photo_watch.py
+
+Watch-Modus: beobachtet PHOTO_SOURCE dauerhaft und schickt jede neue Datei sofort durch die
+komplette Pipeline, statt per Cron den ganzen Ordner neu zu scannen:
+1. Aufnahmedatum lesen und in den YYYY-MM-DD-Ordner unter PHOTO_TARGET verschieben (photo_sort.py)
+2. Insights-Eintrag (Gesichter, Emotionen, Hashes, CLIP) ins Journal des Index (photo_insights.LiveIndex)
+3. CLIP-Vektoren in die bestehende Vektor-DB einfügen (PhotoRAG.add_vectors); ein laufender
+   Such-Server (--serve) lädt sie nach, sobald die Vektor-DB gespeichert ist (siehe unten).
+
+Neue Dateien meldet media_common/file_watch.py (inotify, sonst Polling), erst wenn sie fertig
+geschrieben sind. Dazwischen liegt eine begrenzte Queue: kommt die Pipeline nicht nach, wartet der
+Watcher (Backpressure), statt unbegrenzt Arbeit anzusammeln. Die Pipeline läuft in einem Thread,
+die Modelle werden einmal geladen. Was gerade in der Queue liegt, wird als Batch verarbeitet,
+damit Vektoren nicht pro Datei eingefügt werden; neue Mapping-Einträge werden nur angehängt.
+Insights-Index und Vektor-DB werden erst neu geschrieben, wenn COMPACT_EVERY neue Einträge
+anstehen oder COMPACT_IDLE Sekunden lang nichts ankommt.
+
+Pro Datei wird die Latenz vom ersten Sichten bis zum Eintrag in der Vektor-DB gemessen, aufgeteilt
+in Entprellen, Warten in der Queue und Verarbeitung. Diese Zeiten und die Stages von Sortierung und
+Analyse landen in einem gemeinsamen Metrics-Objekt (media_common/metrics.py); mit --metrics wird der
+Report während des Laufs periodisch geschrieben, z.B. für den textfile-Collector von Prometheus.
+
+Beispiel-Usage:
+    python photo_watch.py                      # PHOTO_SOURCE -> PHOTO_TARGET, Index + Vektor-DB
+    python photo_watch.py --poll               # Netzlaufwerk: Polling statt inotify
+    python photo_watch.py --no-sort --source D:\\Fotos   # nur indexieren, nichts verschieben
+    python photo_watch.py --metrics watch.prom --verbosity 1
+"""
+
+import os
+import queue
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'phase1_photo_sort'))
+from media_common.file_watch import DEFAULT_POLL_INTERVAL, DEFAULT_QUEUE_SIZE, DEFAULT_SETTLE, FileWatcher
+from media_common.metrics import Metrics, add_arguments as add_metrics_arguments
+from dedup import POLICIES, HashCatalog
+from photo_sort import sort_file
+from photo_insights import DEFAULT_INDEX, MEDIA_SUFFIXES, LiveIndex
+
+SOURCE = os.getenv("PHOTO_SOURCE")
+TARGET = os.getenv("PHOTO_TARGET")
+
+# Maximal so viele Dateien aus der Queue gemeinsam verarbeiten
+DEFAULT_BATCH_SIZE = 16
+# Insights-Index spätestens nach so vielen neuen Einträgen neu schreiben
+COMPACT_EVERY = 500
+# ... bzw. wenn so viele Sekunden lang keine Datei ankommt
+COMPACT_IDLE = 5.0
+# Stage-/Latenz-Übersicht alle N Dateien
+REPORT_EVERY = 100
+
+
+class IngestPipeline:
+    """Sortieren -> Insights -> Vektor-DB für einzelne Dateien."""
+
+    def __init__(self, target: str = None, index_path: str = DEFAULT_INDEX, store_dir: str = None,
+                 insights: bool = True, vectors: bool = True, dedup: str = 'off',
+                 quarantine_dir: str = None, catalog_path: str = None, metrics: Metrics = None):
+        # eine Pipeline, ein Analyse-Thread: CPU-Zeit des Prozesses (inkl. Torch-Threads)
+        self.metrics = metrics or Metrics('photo_watch', cpu_clock=time.process_time)
+        self.target = target
+        self.dedup = dedup
+        self.quarantine_dir = quarantine_dir
+        self.store_dir = store_dir
+        self.catalog = None
+        if target and dedup != 'off':
+            self.catalog = HashCatalog(Path(target), catalog_path)
+            self.catalog.refresh()
+        self.live_index = LiveIndex(index_path, store_dir, self.metrics) if insights else None
+        self.rag = None
+        if vectors and self.live_index is not None:
+            import photo_rag
+            if photo_rag.HAS_CLIP:
+                self.rag = photo_rag.PhotoRAG(index_path=index_path, text_cache_path=None)
+                if Path(self.rag.mapping_path).exists():
+                    self.rag.load_vector_db()
+            else:
+                print("CLIP nicht verfügbar, Vektor-DB wird nicht aktualisiert")
+        self.mapped = self._mapped_versions()
+        self.processed = 0
+
+    def _mapped_versions(self) -> dict:
+        """Schlüssel der Vektor-DB -> (Größe, mtime_ns) der eingebetteten Version laut Embedding-Store."""
+        if self.rag is None:
+            return {}
+        store = self.live_index.store
+        versions = {}
+        for key in self.rag.id_to_path:
+            row = store.rows.get(key) if store is not None else None
+            versions[key] = (store.ids[row]['size'], store.ids[row]['mtime_ns']) if row is not None else None
+        return versions
+
+    def _ingest(self, path: Path):
+        """Sortiert und indexiert eine Datei; Rückgabe: (neuer Pfad oder None, [(Schlüssel, Vektor, Version)])."""
+        if self.target:
+            path = sort_file(path, self.target, self.catalog, self.dedup, self.quarantine_dir, self.metrics)
+            if path is None:
+                return None, []
+        if self.live_index is None:
+            return path, []
+        vectors = self.live_index.add(path)
+        st = path.stat()
+        version = (st.st_size, st.st_mtime_ns)
+        # ersetzte Datei (gleicher Pfad, andere Version): neuer Vektor, der alte wird ausgeblendet
+        return path, [(key, vector, version) for key, vector in vectors if self.mapped.get(key) != version]
+
+    def _insert_vectors(self, keys: List[str], vectors: list, versions: list):
+        if self.rag.vector_index is None:
+            # noch keine Vektor-DB: einmal komplett aus dem Store bauen, danach inkrementell
+            if not self.store_dir:
+                print("Keine Vektor-DB vorhanden; zuerst photo_rag.py --build-vector-db ausführen")
+                self.rag = None
+                return
+            self.rag.build_vector_db_from_store(self.store_dir, self.metrics)
+            self.mapped = self._mapped_versions()
+        else:
+            with self.metrics.stage('vectors'):
+                self.rag.add_vectors(keys, np.asarray(vectors, dtype='float32'))
+            self.mapped.update(zip(keys, versions))
+
+    def process(self, batch: list):
+        """batch: Einträge aus FileWatcher.queue; die Vektoren des Batches werden gemeinsam eingefügt."""
+        keys, vectors, versions, finished = [], [], [], []
+        for path, seen, ready in batch:
+            start = time.monotonic()
+            try:
+                new_path, found = self._ingest(Path(path))
+            except Exception as e:
+                self.metrics.error('ingest', f"✗ {Path(path).name}: {e}")
+                continue
+            for key, vector, version in found:
+                keys.append(key)
+                vectors.append(vector)
+                versions.append(version)
+            finished.append((path, new_path, seen, ready, start))
+        if keys and self.rag is not None:
+            self._insert_vectors(keys, vectors, versions)
+        done = time.monotonic()
+        for path, new_path, seen, ready, start in finished:
+            self.metrics.observe('settle', ready - seen)
+            self.metrics.observe('queue_wait', start - ready)
+            self.metrics.observe('latency', done - seen)
+            where = f" -> {new_path}" if new_path is not None and str(new_path) != path else ''
+            message = f"✓ {Path(path).name}{where} ({done - seen:.2f}s nach dem ersten Sichten)"
+            if self.target:
+                # als Datei gezählt hat schon sort_file
+                self.metrics.log(message)
+            else:
+                self.metrics.file_done(message=message)
+        self.metrics.tick()
+        self.processed += len(finished)
+        if self.live_index is not None and self.live_index.uncompacted >= COMPACT_EVERY:
+            self._compact()
+        if finished and self.processed % REPORT_EVERY < len(finished):
+            self.metrics.report()
+
+    def _compact(self):
+        # Insights-Index neu schreiben; die Vektor-DB wird nur hier gespeichert, nicht pro Batch
+        with self.metrics.stage('compact'):
+            if self.live_index is not None:
+                self.live_index.compact()
+            if self.rag is not None:
+                self.rag.save_vector_db()
+
+    def idle(self):
+        self._compact()
+        self.metrics.tick()
+
+    def close(self):
+        if self.rag is not None:
+            self.rag.save_vector_db()
+        if self.live_index is not None:
+            self.live_index.close()
+        if self.catalog is not None:
+            self.catalog.close()
+        self.metrics.close()
+
+
+def watch(source: str, pipeline: IngestPipeline, settle: float = DEFAULT_SETTLE,
+          poll_interval: float = DEFAULT_POLL_INTERVAL, queue_size: int = DEFAULT_QUEUE_SIZE,
+          batch_size: int = DEFAULT_BATCH_SIZE, poll: bool = False):
+    """Läuft bis Strg+C. Dateien, die beim Start schon in source liegen, werden zuerst abgearbeitet."""
+    # liegt das Ziel unterhalb der Quelle, dürfen einsortierte Dateien nicht erneut auftauchen
+    watcher = FileWatcher(source, MEDIA_SUFFIXES, settle=settle, poll_interval=poll_interval,
+                          queue_size=queue_size, poll=poll, ignore=[pipeline.target]).start()
+    print(f"Beobachte {source} ({watcher.mode}, Entprellen {settle:.1f}s, Queue max. {queue_size})... Strg+C beendet")
+    try:
+        while True:
+            try:
+                batch = [watcher.queue.get(timeout=COMPACT_IDLE)]
+            except queue.Empty:
+                pipeline.idle()
+                continue
+            while len(batch) < batch_size:
+                try:
+                    batch.append(watcher.queue.get_nowait())
+                except queue.Empty:
+                    break
+            pipeline.process(batch)
+    except KeyboardInterrupt:
+        print("\nBeende Watch-Modus...")
+    finally:
+        watcher.stop()
+        pipeline.close()
+        stats = watcher.stats()
+        print(f"Watcher: {stats['reported']} Dateien gemeldet, {stats['pending']} noch nicht fertig geschrieben, "
+              f"{stats['blocked_seconds']:.1f}s durch volle Queue gebremst, {stats['rescans']} Neu-Scans")
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Neue Fotos/Videos laufend sortieren und indexieren')
+    parser.add_argument('--source', type=str, default=SOURCE)
+    parser.add_argument('--target', type=str, default=TARGET)
+    parser.add_argument('--no-sort', action='store_true', help='Nicht verschieben, Dateien in der Quelle indexieren')
+    parser.add_argument('--no-insights', action='store_true', help='Nur sortieren (kein Index, keine Vektor-DB)')
+    parser.add_argument('--no-vectors', action='store_true', help='Vektor-DB nicht aktualisieren')
+    parser.add_argument('--index-path', type=str, default=DEFAULT_INDEX)
+    parser.add_argument('--embedding-store', type=str, default=os.getenv("EMBEDDING_STORE", "embedding_store"),
+                        help='Gemeinsamer Embedding-Store (leer lassen zum Deaktivieren)')
+    parser.add_argument('--dedup', choices=POLICIES, default='off', help='Umgang mit byte-identischen Dateien')
+    parser.add_argument('--quarantine', type=str, help='Ordner für Duplikate (Default: <Ziel>/_duplicates)')
+    parser.add_argument('--catalog', type=str, help='Pfad des Hash-Katalogs (Default: <Ziel>/.photo_catalog.sqlite)')
+    parser.add_argument('--poll', action='store_true', help='Polling statt inotify (z.B. für Netzlaufwerke)')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL, help='Sekunden zwischen zwei Scans')
+    parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE,
+                        help='Sekunden ohne Änderung, bevor eine Datei als fertig geschrieben gilt')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help='Max. fertige Dateien in der Warteschlange')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Max. Dateien pro Pipeline-Durchlauf')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    target = None if args.no_sort else args.target
+    if not args.source or not Path(args.source).is_dir():
+        print("❌ Bitte PHOTO_SOURCE in der .env Datei konfigurieren oder --source angeben.")
+    elif not target and not args.no_sort:
+        print("❌ Bitte PHOTO_TARGET konfigurieren (oder --no-sort zum reinen Indexieren).")
+    else:
+        pipeline = IngestPipeline(target=target, index_path=args.index_path, store_dir=args.embedding_store,
+                                  insights=not args.no_insights, vectors=not args.no_vectors, dedup=args.dedup,
+                                  quarantine_dir=args.quarantine, catalog_path=args.catalog,
+                                  metrics=Metrics.from_args('photo_watch', args, cpu_clock=time.process_time))
+        watch(args.source, pipeline, settle=args.settle, poll_interval=args.poll_interval,
+              queue_size=args.queue_size, batch_size=args.batch_size, poll=args.poll)
@@ -0,0 +1,141 @@
+"""
+query_cache.py
+
+Caches für wiederholte Text-Suchen in photo_rag.py:
+- TextEmbeddingCache: LRU normalisierte Query -> CLIP-Text-Embedding, pro Modellname;
+  optional in einer .npz-Datei über Sitzungen hinweg gespeichert
+- ResultCache: LRU (Query, top_k, Filter) -> Trefferliste; wird geleert, sobald sich der
+  Vektor-Index (bzw. der Insights-Index bei Filtern) ändert
+
+Beide zählen Treffer und Fehlschläge (stats()).
+"""
+
+import os
+import json
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_TEXT_CACHE_SIZE = 4096
+DEFAULT_RESULT_CACHE_SIZE = 512
+
+
+def normalize_query(text: str) -> str:
+    """Unicode-NFC, Kleinschreibung und einfache Leerzeichen (CLIP tokenisiert ohnehin lowercase)."""
+    return ' '.join(unicodedata.normalize('NFC', text).lower().split())
+
+
+class LRUCache:
+    """Kleiner thread-sicherer LRU-Cache mit Treffer-Statistik."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key):
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return self.data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'size': len(self.data), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0}
+
+
+class TextEmbeddingCache:
+    """Text-Embeddings je normalisierter Query; die Datei gilt nur für denselben Modellnamen."""
+
+    def __init__(self, model_name: str, maxsize: int = DEFAULT_TEXT_CACHE_SIZE, path: Optional[str] = None):
+        self.model_name = model_name
+        self.path = path
+        self.cache = LRUCache(maxsize)
+        self.dirty = False
+        if path and Path(path).exists():
+            self._load()
+
+    def _load(self):
+        try:
+            with np.load(self.path) as data:
+                if str(data['model']) != self.model_name:
+                    return
+                for key, vector in zip(data['keys'], data['vectors']):
+                    self.cache.put(str(key), vector)
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Text-Cache {self.path} nicht lesbar, starte leer: {e}")
+
+    def lookup(self, queries: List[str]):
+        """(Embeddings je Query oder None, normalisierte Keys)."""
+        keys = [normalize_query(q) for q in queries]
+        return [self.cache.get(k) for k in keys], keys
+
+    def store(self, key: str, vector: np.ndarray):
+        self.cache.put(key, np.asarray(vector, dtype='float32'))
+        self.dirty = True
+
+    def save(self):
+        """Schreibt den Cache (älteste zuerst, damit die LRU-Reihenfolge erhalten bleibt)."""
+        if not self.path or not self.dirty or not len(self.cache):
+            return
+        with self.cache.lock:
+            keys = list(self.cache.data)
+            vectors = np.stack(list(self.cache.data.values()))
+        tmp = str(self.path) + '.tmp.npz'
+        np.savez(tmp, model=np.array(self.model_name), keys=np.array(keys, dtype=str), vectors=vectors)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+class ResultCache:
+    """Trefferlisten je (Query, top_k, Filter); token = Stand des Index, Wechsel leert den Cache."""
+
+    def __init__(self, maxsize: int = DEFAULT_RESULT_CACHE_SIZE):
+        self.cache = LRUCache(maxsize)
+        self.token = None
+
+    @staticmethod
+    def key(query: str, top_k: int, filters: Optional[Dict]) -> tuple:
+        return normalize_query(query), top_k, json.dumps(filters or {}, sort_keys=True)
+
+    def validate(self, token):
+        if token != self.token:
+            self.cache.clear()
+            self.token = token
+
+    def get(self, key) -> Optional[List[Dict]]:
+        results = self.cache.get(key)
+        return [dict(r) for r in results] if results is not None else None
+
+    def put(self, key, results: List[Dict]):
+        self.cache.put(key, [dict(r) for r in results])
+
+    def stats(self) -> dict:
+        return self.cache.stats()
@@ -0,0 +1,199 @@
+"""
+rag_server.py
+
+Lang laufender Such-Server für photo_rag.py: CLIP-Modell, Vektor-Index und Mapping bleiben
+geladen, Anfragen kommen per HTTP über localhost:
+- POST /search  {"query", "top_k", "filters"}  -> {"results": [...]}
+- POST /chat    {"query", "top_k"}             -> {"answer", "results"}
+- GET  /status                                 -> Index-Größe, Backend, Batch-Statistik
+
+Gleichzeitig eintreffende Text-Queries werden kurz gesammelt (BATCH_WAIT_MS, max. MAX_BATCH)
+und in einem einzigen get_text_features-Aufruf eingebettet (bereits gecachte Queries und
+Ergebnisse werden dabei übersprungen, siehe query_cache.py). Wird die Vektor-DB neu gebaut,
+lädt der Server sie vor dem nächsten Batch automatisch neu.
+
+Start:
+    python photo_rag.py --serve
+photo_rag.py --query/--chat nutzen den Server automatisch, wenn er unter PHOTO_RAG_SERVER
+(Default http://127.0.0.1:8765) antwortet.
+"""
+
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib import request as urlrequest
+from urllib.error import URLError
+from urllib.parse import urlparse
+
+DEFAULT_URL = 'http://127.0.0.1:8765'
+MAX_BATCH = 32
+# Wartezeit auf weitere Queries, nachdem die erste eines Batches eingetroffen ist
+BATCH_WAIT_MS = 5
+
+
+class _Server(ThreadingHTTPServer):
+    # Default-Backlog von 5 verwirft Verbindungen, wenn viele Clients gleichzeitig fragen
+    request_queue_size = 128
+
+
+class QueryBatcher:
+    """Sammelt Such-Anfragen aus den Handler-Threads und bettet sie gemeinsam ein.
+
+    Embedding und Index-Suche laufen in einem einzigen Worker-Thread, daher braucht weder
+    das Modell noch der Index eigene Locks.
+    """
+
+    def __init__(self, rag, max_batch: int = MAX_BATCH, wait_ms: float = BATCH_WAIT_MS):
+        self.rag = rag
+        self.max_batch = max_batch
+        self.wait_ms = wait_ms
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.queries = 0
+        self.largest = 0
+        self.thread = threading.Thread(target=self._run, name='query-batcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, query: str, top_k: int = 5, filters: Optional[Dict] = None) -> Future:
+        future = Future()
+        self.queue.put((query, top_k, filters, future))
+        return future
+
+    def _collect(self) -> list:
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.wait_ms / 1000.0
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self.rag.reload_if_changed()
+                results = self.rag.search_batch([(query, top_k, filters) for query, top_k, filters, _ in batch])
+                for (*_, future), found in zip(batch, results):
+                    future.set_result(found)
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            self.batches += 1
+            self.queries += len(batch)
+            self.largest = max(self.largest, len(batch))
+
+    def stats(self) -> dict:
+        return {'batches': self.batches, 'queries': self.queries, 'largest_batch': self.largest,
+                'mean_batch': self.queries / self.batches if self.batches else 0.0}
+
+
+def _make_handler(rag, batcher: QueryBatcher):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload: dict):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != '/status':
+                return self._send(404, {'error': f'unbekannter Pfad {self.path}'})
+            index = rag.vector_index
+            self._send(200, {'images': index.ntotal if index is not None else 0,
+                             'backend': index.backend if index is not None else None,
+                             'has_llm': rag.has_llm, 'batching': batcher.stats(), 'cache': rag.cache_stats()})
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                data = json.loads(self.rfile.read(length) or b'{}')
+                query = data['query']
+                if self.path == '/search':
+                    results = batcher.submit(query, int(data.get('top_k', 5)), data.get('filters')).result()
+                    return self._send(200, {'results': results})
+                if self.path == '/chat':
+                    top_k = int(data.get('top_k', 3))
+                    results = data.get('results')
+                    if results is None:
+                        results = batcher.submit(query, top_k).result()
+                    return self._send(200, {'answer': rag.chat(query, top_k, results=results), 'results': results})
+                self._send(404, {'error': f'unbekannter Pfad {self.path}'})
+            except (KeyError, ValueError) as e:
+                self._send(400, {'error': f'ungültige Anfrage: {e}'})
+            except Exception as e:
+                self._send(500, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            pass  # keine Zeile pro Anfrage
+
+    return Handler
+
+
+def serve(rag, url: str = DEFAULT_URL):
+    """Lädt Index und Modell vor (inkl. einem Warmup-Embedding) und beantwortet Anfragen bis Ctrl+C."""
+    if not rag.ready() or not rag.load_model():
+        return
+    rag.embed_texts(['warmup'])
+    parsed = urlparse(url)
+    batcher = QueryBatcher(rag)
+    server = _Server((parsed.hostname or '127.0.0.1', parsed.port or 8765), _make_handler(rag, batcher))
+    print(f"🚀 Photo-RAG-Server läuft auf {url} ({rag.vector_index.ntotal} Bilder). Beenden mit Ctrl+C")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        rag.close()
+        print(f"Server beendet. Batching: {batcher.stats()}")
+
+
+class RagClient:
+    """search/chat wie PhotoRAG, aber über den laufenden Server."""
+
+    def __init__(self, url: str = DEFAULT_URL, timeout: float = 120.0):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.info = {}
+
+    def _request(self, path: str, payload: dict = None, timeout: float = None) -> dict:
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        req = urlrequest.Request(self.url + path, data=data, headers={'Content-Type': 'application/json'})
+        with urlrequest.urlopen(req, timeout=timeout or self.timeout) as resp:
+            return json.loads(resp.read().decode('utf-8'))
+
+    def status(self, timeout: float = None) -> dict:
+        self.info = self._request('/status', timeout=timeout)
+        return self.info
+
+    @property
+    def has_llm(self) -> bool:
+        return bool(self.info.get('has_llm'))
+
+    def search(self, query: str, top_k: int = 5, filters: Optional[Dict] = None) -> List[Dict]:
+        return self._request('/search', {'query': query, 'top_k': top_k, 'filters': filters or None})['results']
+
+    def chat(self, user_query: str, top_k: int = 3, results: Optional[List[Dict]] = None) -> str:
+        return self._request('/chat', {'query': user_query, 'top_k': top_k, 'results': results})['answer']
+
+
+def connect(url: str = DEFAULT_URL, timeout: float = 0.5) -> Optional[RagClient]:
+    """Client, falls unter url ein Server antwortet, sonst None."""
+    client = RagClient(url)
+    try:
+        client.status(timeout=timeout)
+    except (URLError, OSError, ValueError):
+        return None
+    return client
@@ -0,0 +1,680 @@
+"""
+vector_index.py
+
+Auswählbare Vektor-Index-Backends für photo_rag.py:
+- flat-l2:  exakte L2-Suche auf rohen CLIP-Vektoren (bisheriges Verhalten)
+- flat-ip:  exakte Suche per Skalarprodukt auf L2-normalisierten Vektoren (= Kosinus-Ähnlichkeit)
+- ivf:      IVF-Flat (Inverted File, muss trainiert werden); Recall/Latenz über nprobe
+- hnsw:     HNSW-Graph; Recall/Latenz über efSearch
+
+Alle Typen außer flat-l2 arbeiten auf normalisierten Vektoren, da CLIP auf Kosinus-Ähnlichkeit
+trainiert ist. Der gewählte Typ wird in <db>_meta.json neben dem Index gespeichert.
+
+Ist FAISS nicht installiert, übernimmt NumpyVectorIndex mit derselben API: normalisierte
+float32-Vektoren in einer memory-mapped .npy-Datei, exakte blockweise Top-k-Suche.
+
+Optional werden die Vektoren quantisiert gespeichert, um den Speicherbedarf zu senken:
+- fp16:  2 Byte pro Dimension (halbiert)
+- int8:  1 Byte pro Dimension mit Wertebereich je Dimension (Skalar-Quantisierung, ein Viertel)
+- pq:    Product Quantization mit pq_m Byte pro Vektor (nur FAISS; 512 dim, pq_m=64: 1/32)
+Die Suche holt dann rerank * k Kandidaten aus dem quantisierten Index und bewertet sie mit den
+float32-Vektoren aus <db>.npy neu (memory-mapped, gelesen werden nur die Kandidaten-Zeilen).
+
+search(..., allowed=maske) schränkt die Suche auf erlaubte IDs ein (siehe metadata_filter.py):
+kleine Teilmengen werden exakt durchgerechnet, große per FAISS-IDSelector bzw. Maske während
+der Suche gefiltert.
+"""
+
+import io
+import os
+import json
+import time
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+
+INDEX_TYPES = ('flat-ip', 'flat-l2', 'ivf', 'hnsw')
+DEFAULT_INDEX_TYPE = 'flat-ip'
+
+QUANTIZATIONS = ('none', 'fp16', 'int8', 'pq')
+DEFAULT_QUANTIZATION = 'none'
+# Kandidaten pro Treffer, die exakt neu bewertet werden (0 = kein Re-Ranking)
+DEFAULT_RERANK = 4
+DEFAULT_PQ_M = 64
+
+# IVF braucht etwa 39 Trainingspunkte pro Liste (FAISS-Empfehlung)
+MIN_POINTS_PER_LIST = 39
+# PQ trainiert 256 Zentroide je Teilraum, also mindestens 256 * 39 Punkte
+MIN_PQ_TRAIN = 256 * MIN_POINTS_PER_LIST
+# Obergrenze der Trainings-Stichprobe für Skalar-Quantisierung und PQ
+MAX_QUANT_TRAIN = 65536
+
+# Zeilen pro Block bei der NumPy-Suche: 65536 x 512 float32 = 128 MB
+NUMPY_SEARCH_BLOCK = 65536
+
+# Gefilterte Suchen mit höchstens so vielen erlaubten Vektoren laufen exakt über die Teilmenge
+EXACT_FILTER_MAX = 20000
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def meta_path(db_path: str) -> str:
+    return str(db_path).replace('.faiss', '') + '_meta.json'
+
+
+def npy_path(db_path: str) -> str:
+    return str(db_path).replace('.faiss', '') + '.npy'
+
+
+def codes_path(db_path: str, quantization: str) -> str:
+    return str(db_path).replace('.faiss', '') + f'.{quantization}.npy'
+
+
+def has_faiss() -> bool:
+    # nur nachsehen, ob installiert; importiert wird erst beim Bauen/Laden eines FAISS-Index
+    try:
+        return importlib.util.find_spec('faiss') is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def _check_quantization(quantization: str, index_type: str):
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unbekannte Quantisierung {quantization!r}, erlaubt: {', '.join(QUANTIZATIONS)}")
+    if quantization != 'none' and index_type == 'flat-l2':
+        raise ValueError("Quantisierung setzt normalisierte Vektoren voraus (nicht mit flat-l2)")
+
+
+def _sample(vectors: np.ndarray, size: int) -> np.ndarray:
+    if len(vectors) <= size:
+        return vectors
+    rng = np.random.default_rng(0)
+    return vectors[rng.choice(len(vectors), size, replace=False)]
+
+
+class DiskVectors:
+    """Zeilen einer 2D-.npy-Datei: memory-mapped lesen, neue Zeilen bei save() anhängen."""
+
+    def __init__(self, dtype='float32'):
+        self.dtype = np.dtype(dtype)
+        self.base = np.empty((0, 0), dtype=self.dtype)
+        self.pending = []
+        self.saved_rows = 0
+
+    def __len__(self):
+        return len(self.base) + sum(len(p) for p in self.pending)
+
+    @property
+    def dim(self) -> int:
+        if len(self.base):
+            return self.base.shape[1]
+        return self.pending[0].shape[1] if self.pending else 0
+
+    @property
+    def nbytes(self) -> int:
+        return len(self) * self.dim * self.dtype.itemsize
+
+    def set(self, rows: np.ndarray):
+        self.base = np.ascontiguousarray(rows, dtype=self.dtype)
+        self.pending = []
+        self.saved_rows = 0
+
+    def add(self, rows: np.ndarray):
+        self.pending.append(np.ascontiguousarray(rows, dtype=self.dtype))
+
+    def blocks(self, block: int):
+        for start in range(0, len(self.base), block):
+            yield start, self.base[start:start + block]
+        offset = len(self.base)
+        for extra in self.pending:
+            yield offset, extra
+            offset += len(extra)
+
+    def take(self, ids: np.ndarray) -> np.ndarray:
+        """Zeilen zu beliebigen IDs; bei Memory-Mapping werden nur diese Zeilen gelesen."""
+        flat = ids.ravel()
+        out = np.empty((len(flat), self.dim), dtype=self.dtype)
+        in_base = flat < len(self.base)
+        out[in_base] = self.base[flat[in_base]]
+        if not in_base.all():
+            out[~in_base] = np.concatenate(self.pending)[flat[~in_base] - len(self.base)]
+        return out.reshape(ids.shape + (self.dim,))
+
+    def save(self, path: str):
+        """Schreibt nur neue Zeilen (Append + Header-Update), sonst die komplette Datei."""
+        new_rows = (np.concatenate(self.pending) if self.pending
+                    else np.empty((0, self.dim), dtype=self.dtype))
+        appended = False
+        if self.saved_rows and self.saved_rows == len(self.base) and Path(path).exists():
+            appended = _append_npy(path, new_rows)
+        if not appended:
+            full = np.concatenate([np.asarray(self.base), new_rows]) if len(self.base) else new_rows
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as f:
+                np.save(f, np.ascontiguousarray(full, dtype=self.dtype))
+            self.base = None
+            os.replace(tmp, path)
+        self.base = np.load(path, mmap_mode='r')
+        self.pending = []
+        self.saved_rows = len(self.base)
+
+    @classmethod
+    def load(cls, path: str):
+        base = np.load(path, mmap_mode='r')
+        obj = cls(base.dtype)
+        obj.base = base
+        obj.saved_rows = len(base)
+        return obj
+
+
+def _rerank(full: DiskVectors, queries: np.ndarray, cand_ids: np.ndarray, k: int):
+    """Bewertet die Kandidaten exakt mit den float32-Vektoren neu und behält die besten k."""
+    valid = cand_ids >= 0
+    vectors = full.take(np.where(valid, cand_ids, 0))  # (nq x Kandidaten x dim)
+    exact = np.einsum('qcd,qd->qc', vectors, queries)
+    exact = np.where(valid, exact, -np.inf).astype('float32')
+    order = np.argsort(-exact, axis=1)[:, :k]
+    return np.take_along_axis(exact, order, axis=1), np.take_along_axis(cand_ids, order, axis=1)
+
+
+def _pad_results(scores: np.ndarray, ids: np.ndarray, k: int, fill: float = -np.inf):
+    """Wie FAISS: fehlende Treffer mit ID -1 auffüllen."""
+    if scores.shape[1] < k:
+        pad = k - scores.shape[1]
+        scores = np.pad(scores, ((0, 0), (0, pad)), constant_values=fill)
+        ids = np.pad(ids, ((0, 0), (0, pad)), constant_values=-1)
+    return scores, ids
+
+
+def _exact_subset(vectors: np.ndarray, ids: np.ndarray, queries: np.ndarray, k: int, l2: bool = False):
+    """Exakte Top-k über eine kleine Teilmenge (Vektoren in Reihenfolge von ids)."""
+    vectors = np.asarray(vectors, dtype='float32')
+    if l2:
+        scores = -(np.einsum('ij,ij->i', vectors, vectors)[None, :] - 2.0 * queries @ vectors.T
+                   + np.einsum('ij,ij->i', queries, queries)[:, None])
+    else:
+        scores = queries @ vectors.T  # (nq x Teilmenge)
+    order = np.argsort(-scores, axis=1)[:, :k]
+    best = np.take_along_axis(scores, order, axis=1).astype('float32')
+    if l2:
+        return _pad_results(-best, ids[order], k, fill=np.inf)
+    return _pad_results(best, ids[order], k)
+
+
+class FaissVectorIndex:
+    """Dünne Hülle um einen FAISS-Index mit einheitlicher build/add/search/save/load-API."""
+
+    backend = 'faiss'
+
+    def __init__(self, index_type: str = DEFAULT_INDEX_TYPE, nlist: int = None, nprobe: int = 16,
+                 hnsw_m: int = 32, ef_search: int = 64, ef_construction: int = 200,
+                 quantization: str = DEFAULT_QUANTIZATION, pq_m: int = DEFAULT_PQ_M,
+                 rerank: int = DEFAULT_RERANK):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unbekannter Index-Typ {index_type!r}, erlaubt: {', '.join(INDEX_TYPES)}")
+        _check_quantization(quantization, index_type)
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.ef_construction = ef_construction
+        self.quantization = quantization
+        self.pq_m = pq_m
+        self.rerank = rerank
+        self.index = None
+        # float32-Vektoren für das Re-Ranking (nur bei Quantisierung)
+        self.full = None
+
+    @property
+    def normalized(self) -> bool:
+        return self.index_type != 'flat-l2'
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal if self.index is not None else 0
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.ascontiguousarray(vectors, dtype='float32')
+        return normalize(vectors) if self.normalized else vectors
+
+    def _factory_string(self) -> str:
+        """FAISS-Factory-Beschreibung aus Index-Typ und Quantisierung, z.B. 'IVF256,SQ8'."""
+        storage = {'none': 'Flat', 'fp16': 'SQfp16', 'int8': 'SQ8', 'pq': f'PQ{self.pq_m}'}[self.quantization]
+        if self.index_type == 'ivf':
+            return f"IVF{self.nlist},{storage}"
+        if self.index_type == 'hnsw':
+            return f"HNSW{self.hnsw_m}" if storage == 'Flat' else f"HNSW{self.hnsw_m}_{storage}"
+        return storage
+
+    def build(self, vectors: np.ndarray):
+        import faiss
+        vectors = self._prepare(vectors)
+        n, dim = vectors.shape
+        if self.quantization == 'pq' and (n < MIN_PQ_TRAIN or dim % self.pq_m):
+            print(f"PQ braucht >= {MIN_PQ_TRAIN} Vektoren und dim teilbar durch pq_m={self.pq_m}; nutze int8")
+            self.quantization = 'int8'
+        if self.index_type == 'ivf':
+            nlist = self.nlist or int(4 * np.sqrt(n))
+            self.nlist = max(1, min(nlist, n // MIN_POINTS_PER_LIST))
+        metric = faiss.METRIC_L2 if self.index_type == 'flat-l2' else faiss.METRIC_INNER_PRODUCT
+        self.index = faiss.index_factory(dim, self._factory_string(), metric)
+        if self.index_type == 'hnsw':
+            self.index.hnsw.efConstruction = self.ef_construction
+        if not self.index.is_trained:
+            # Training auf einer Stichprobe reicht (max. 256 Punkte pro IVF-Liste)
+            size = 256 * self.nlist if self.index_type == 'ivf' else 0
+            if self.quantization != 'none':
+                size = max(size, MAX_QUANT_TRAIN)
+            self.index.train(_sample(vectors, size))
+        self.index.add(vectors)
+        if self.quantization != 'none':
+            self.full = DiskVectors('float32')
+            self.full.set(vectors)
+        self.apply_search_params()
+
+    def add(self, vectors: np.ndarray):
+        vectors = self._prepare(vectors)
+        self.index.add(vectors)
+        if self.full is not None:
+            self.full.add(vectors)
+
+    def apply_search_params(self, nprobe: int = None, ef_search: int = None, rerank: int = None):
+        """Setzt die Recall/Latenz-Parameter (nprobe für IVF, efSearch für HNSW, Re-Ranking-Faktor)."""
+        import faiss
+        self.nprobe = nprobe or self.nprobe
+        self.ef_search = ef_search or self.ef_search
+        if rerank is not None:
+            self.rerank = rerank
+        if self.index_type == 'ivf':
+            faiss.extract_index_ivf(self.index).nprobe = self.nprobe
+        elif self.index_type == 'hnsw':
+            self.index.hnsw.efSearch = self.ef_search
+
+    def _subset_vectors(self, ids: np.ndarray):
+        """float32-Vektoren der IDs (Re-Ranking-Datei oder Rekonstruktion); None bei IVF (kein direct map)."""
+        if self.full is not None:
+            return self.full.take(ids)
+        if self.index_type == 'ivf':
+            return None
+        try:
+            return self.index.reconstruct_batch(ids)
+        except RuntimeError:
+            return None
+
+    def _filter_params(self, allowed: np.ndarray):
+        import faiss
+        bitmap = np.packbits(allowed, bitorder='little')
+        selector = faiss.IDSelectorBitmap(len(allowed), faiss.swig_ptr(bitmap))
+        if self.index_type == 'ivf':
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        elif self.index_type == 'hnsw':
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        # Bitmap und Selector müssen bis nach der Suche leben
+        return params, (bitmap, selector)
+
+    def search(self, queries: np.ndarray, k: int, allowed: np.ndarray = None):
+        """Liefert (Ähnlichkeit bzw. Distanz, IDs) wie faiss; -1 für fehlende Treffer.
+
+        allowed: optionale bool-Maske (Länge ntotal) der Vektor-IDs, die als Treffer zählen.
+        """
+        import faiss
+        queries = self._prepare(np.atleast_2d(queries))
+        params = keep = None
+        if allowed is not None:
+            subset = np.flatnonzero(allowed)
+            if len(subset) <= EXACT_FILTER_MAX:
+                vectors = self._subset_vectors(subset)
+                if vectors is not None:
+                    return _exact_subset(vectors, subset, queries, k, l2=not self.normalized)
+            params, keep = self._filter_params(np.asarray(allowed, dtype=bool))
+        use_rerank = self.full is not None and self.rerank > 0
+        distances, ids = self.index.search(queries, k * self.rerank if use_rerank else k, params=params)
+        del keep
+        if use_rerank:
+            return _rerank(self.full, queries, ids, k)
+        if self.normalized and self.index.metric_type == faiss.METRIC_L2:
+            # HNSW+PQ rechnet nur mit L2; auf Einheitsvektoren gilt ||a-b||² = 2 - 2cos
+            distances = np.where(ids >= 0, 1.0 - distances / 2.0, -np.inf).astype('float32')
+        return distances, ids
+
+    def scores(self, distances: np.ndarray):
+        """Höher = besser. Kosinus direkt, L2 auf (0, 1] abgebildet wie bisher."""
+        if self.normalized:
+            return distances
+        return 1.0 / (1.0 + distances)
+
+    def memory_bytes(self) -> int:
+        """Größe des Index im RAM (serialisiert, inkl. Graph/Zentroide; ohne Re-Ranking-Datei)."""
+        import faiss
+        return int(faiss.serialize_index(self.index).nbytes)
+
+    def meta(self) -> dict:
+        return {'backend': self.backend, 'index_type': self.index_type, 'normalized': self.normalized,
+                'nlist': self.nlist, 'nprobe': self.nprobe, 'hnsw_m': self.hnsw_m, 'ef_search': self.ef_search,
+                'quantization': self.quantization, 'pq_m': self.pq_m, 'rerank': self.rerank}
+
+    def save(self, db_path: str):
+        import faiss
+        faiss.write_index(self.index, str(db_path))
+        if self.full is not None:
+            self.full.save(npy_path(db_path))
+        with open(meta_path(db_path), 'w', encoding='utf-8') as f:
+            json.dump(self.meta(), f, indent=2)
+
+    @classmethod
+    def load(cls, db_path: str, nprobe: int = None, ef_search: int = None, rerank: int = None):
+        import faiss
+        meta = {'index_type': 'flat-l2'}  # Indizes ohne Meta-Datei stammen aus der Zeit vor den Backends
+        if Path(meta_path(db_path)).exists():
+            with open(meta_path(db_path), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        obj = cls(index_type=meta['index_type'], nlist=meta.get('nlist'), nprobe=meta.get('nprobe') or 16,
+                  hnsw_m=meta.get('hnsw_m') or 32, ef_search=meta.get('ef_search') or 64,
+                  quantization=meta.get('quantization', DEFAULT_QUANTIZATION),
+                  pq_m=meta.get('pq_m') or DEFAULT_PQ_M, rerank=meta.get('rerank', DEFAULT_RERANK))
+        obj.index = faiss.read_index(str(db_path))
+        if obj.quantization != 'none':
+            if Path(npy_path(db_path)).exists():
+                obj.full = DiskVectors.load(npy_path(db_path))
+            else:
+                print(f"{npy_path(db_path)} fehlt, Suche ohne Re-Ranking")
+        obj.apply_search_params(nprobe, ef_search, rerank)
+        return obj
+
+
+class NumpyVectorIndex:
+    """Reiner NumPy-Ersatz für FaissVectorIndex (exakte Kosinus-Suche, gleiche API).
+
+    Die normalisierten Vektoren liegen in <db>.npy und werden per Memory-Mapping gelesen;
+    neu hinzugefügte Vektoren werden bei save() an die Datei angehängt. Der Speicherbedarf
+    der Suche ist durch die Blockgröße begrenzt, unabhängig von der Anzahl der Bilder.
+
+    Mit fp16/int8 wird stattdessen über <db>.<quantization>.npy gesucht und die Kandidaten
+    anschließend gegen <db>.npy neu bewertet.
+    """
+
+    backend = 'numpy'
+    normalized = True
+
+    def __init__(self, index_type: str = DEFAULT_INDEX_TYPE, block: int = NUMPY_SEARCH_BLOCK,
+                 quantization: str = DEFAULT_QUANTIZATION, rerank: int = DEFAULT_RERANK, **_):
+        if index_type != 'flat-ip':
+            print(f"NumPy-Backend unterstützt nur exakte Kosinus-Suche; {index_type} -> flat-ip")
+        _check_quantization(quantization, 'flat-ip')
+        if quantization == 'pq':
+            print("PQ braucht FAISS; NumPy-Backend nutzt int8")
+            quantization = 'int8'
+        self.index_type = 'flat-ip'
+        self.block = block
+        self.nprobe = None
+        self.ef_search = None
+        self.quantization = quantization
+        self.rerank = rerank
+        self.full = DiskVectors('float32')
+        self.codes = None
+        if quantization != 'none':
+            self.codes = DiskVectors('float16' if quantization == 'fp16' else 'uint8')
+        # int8: Minimum und Schrittweite je Dimension
+        self.vmin = None
+        self.step = None
+
+    @property
+    def ntotal(self) -> int:
+        return len(self.full)
+
+    @property
+    def dim(self) -> int:
+        return self.full.dim
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        if self.quantization == 'fp16':
+            return vectors.astype('float16')
+        codes = np.floor((vectors - self.vmin) / self.step)
+        return np.clip(codes, 0, 255).astype('uint8')
+
+    def build(self, vectors: np.ndarray):
+        vectors = normalize(vectors)
+        self.full.set(vectors)
+        if self.quantization == 'int8':
+            sample = _sample(vectors, MAX_QUANT_TRAIN)
+            self.vmin = sample.min(axis=0)
+            self.step = np.maximum((sample.max(axis=0) - self.vmin) / 256.0, 1e-12).astype('float32')
+        if self.codes is not None:
+            self.codes.set(self._encode(vectors))
+
+    def add(self, vectors: np.ndarray):
+        vectors = normalize(np.atleast_2d(vectors))
+        self.full.add(vectors)
+        if self.codes is not None:
+            self.codes.add(self._encode(vectors))
+
+    def apply_search_params(self, nprobe: int = None, ef_search: int = None, rerank: int = None):
+        # exakte Suche; nur der Re-Ranking-Faktor ist einstellbar
+        if rerank is not None:
+            self.rerank = rerank
+
+    def _block_scores(self, block: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        if self.quantization != 'int8':
+            return np.asarray(block, dtype='float32') @ queries.T  # (Block x nq)
+        # x ≈ vmin + (code + 0.5) * step  =>  q·x = code·(q*step) + q·(vmin + 0.5*step)
+        offset = queries @ (self.vmin + 0.5 * self.step)
+        return np.asarray(block, dtype='float32') @ (queries * self.step).T + offset[None, :]
+
+    def search(self, queries: np.ndarray, k: int, allowed: np.ndarray = None):
+        """Blockweise Matrix-Vektor-Produkte, Top-k je Block per argpartition, dann zusammenführen.
+
+        allowed: optionale bool-Maske der erlaubten IDs; nicht erlaubte Zeilen werden im Block
+        vor der Top-k-Auswahl ausgeblendet, kleine Teilmengen direkt exakt gerechnet.
+        """
+        queries = normalize(np.atleast_2d(queries))
+        if allowed is not None:
+            subset = np.flatnonzero(allowed)
+            if len(subset) <= EXACT_FILTER_MAX:
+                return _exact_subset(self.full.take(subset), subset, queries, k)
+        use_rerank = self.codes is not None and self.rerank > 0
+        kk_total = k * self.rerank if use_rerank else k
+        source = self.codes if self.codes is not None else self.full
+        nq = len(queries)
+        best_scores = np.full((nq, 0), -np.inf, dtype='float32')
+        best_ids = np.empty((nq, 0), dtype='int64')
+        for start, block in source.blocks(self.block):
+            scores = self._block_scores(block, queries)
+            if allowed is not None:
+                scores[~allowed[start:start + len(block)]] = -np.inf
+            kk = min(kk_total, len(block))
+            part = np.argpartition(-scores, kk - 1, axis=0)[:kk].T  # (nq x kk)
+            cand_scores = np.take_along_axis(scores.T, part, axis=1)
+            best_scores = np.concatenate([best_scores, cand_scores], axis=1)
+            best_ids = np.concatenate([best_ids, part + start], axis=1)
+            if best_scores.shape[1] > kk_total:
+                keep = np.argpartition(-best_scores, kk_total - 1, axis=1)[:, :kk_total]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_ids = np.take_along_axis(best_ids, keep, axis=1)
+        # ausgeblendete Zeilen nicht als Treffer (und nicht ins Re-Ranking) übernehmen
+        best_ids = np.where(np.isneginf(best_scores), -1, best_ids)
+        if use_rerank:
+            best_scores, best_ids = _rerank(self.full, queries, best_ids, k)
+        else:
+            order = np.argsort(-best_scores, axis=1)
+            best_scores = np.take_along_axis(best_scores, order, axis=1)
+            best_ids = np.take_along_axis(best_ids, order, axis=1)
+        return _pad_results(best_scores, best_ids, k)
+
+    def scores(self, distances: np.ndarray):
+        return distances
+
+    def memory_bytes(self) -> int:
+        """Größe der durchsuchten Vektoren (quantisiert oder float32)."""
+        return (self.codes if self.codes is not None else self.full).nbytes
+
+    def meta(self) -> dict:
+        meta = {'backend': self.backend, 'index_type': self.index_type, 'normalized': True,
+                'quantization': self.quantization, 'rerank': self.rerank}
+        if self.quantization == 'int8':
+            meta['int8_vmin'] = self.vmin.tolist()
+            meta['int8_step'] = self.step.tolist()
+        return meta
+
+    def save(self, db_path: str):
+        self.full.save(npy_path(db_path))
+        if self.codes is not None:
+            self.codes.save(codes_path(db_path, self.quantization))
+        with open(meta_path(db_path), 'w', encoding='utf-8') as f:
+            json.dump(self.meta(), f, indent=2)
+
+    @classmethod
+    def load(cls, db_path: str, nprobe: int = None, ef_search: int = None, rerank: int = None):
+        meta = {}
+        if Path(meta_path(db_path)).exists():
+            with open(meta_path(db_path), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        obj = cls(quantization=meta.get('quantization', DEFAULT_QUANTIZATION),
+                  rerank=meta.get('rerank', DEFAULT_RERANK))
+        obj.full = DiskVectors.load(npy_path(db_path))
+        if obj.codes is not None:
+            obj.codes = DiskVectors.load(codes_path(db_path, obj.quantization))
+        if obj.quantization == 'int8':
+            obj.vmin = np.asarray(meta['int8_vmin'], dtype='float32')
+            obj.step = np.asarray(meta['int8_step'], dtype='float32')
+        obj.apply_search_params(rerank=rerank)
+        return obj
+
+
+def _npy_header(shape, dtype) -> bytes:
+    buf = io.BytesIO()
+    np.lib.format.write_array_header_1_0(
+        buf, {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': tuple(shape)})
+    return buf.getvalue()
+
+
+def _append_npy(path: str, rows: np.ndarray) -> bool:
+    """Hängt Zeilen an eine 2D-.npy-Datei gleichen dtypes an, falls der neue Header gleich lang bleibt."""
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version != (1, 0):
+            return False
+        shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+        if fortran or dtype != rows.dtype or len(shape) != 2 or shape[1] != rows.shape[1]:
+            return False
+        old_len = f.tell()
+        header = _npy_header((shape[0] + len(rows), shape[1]), dtype)
+        if len(header) != old_len:
+            return False
+        f.seek(0, os.SEEK_END)
+        f.write(np.ascontiguousarray(rows, dtype=dtype).tobytes())
+        f.seek(0)
+        f.write(header)
+    return True
+
+
+def make_vector_index(**params):
+    """FAISS wenn installiert, sonst NumPy-Fallback."""
+    return FaissVectorIndex(**params) if has_faiss() else NumpyVectorIndex(**params)
+
+
+def load_vector_index(db_path: str, nprobe: int = None, ef_search: int = None, rerank: int = None):
+    """Lädt den gespeicherten Index passend zum Backend in der Meta-Datei; None falls nicht vorhanden."""
+    backend = None
+    if Path(meta_path(db_path)).exists():
+        with open(meta_path(db_path), 'r', encoding='utf-8') as f:
+            backend = json.load(f).get('backend', 'faiss')
+    elif Path(db_path).exists():
+        backend = 'faiss'
+    if backend == 'numpy' and Path(npy_path(db_path)).exists():
+        return NumpyVectorIndex.load(db_path, rerank=rerank)
+    if backend == 'faiss' and Path(db_path).exists():
+        if not has_faiss():
+            raise RuntimeError("Index wurde mit FAISS gebaut, FAISS ist aber nicht installiert")
+        return FaissVectorIndex.load(db_path, nprobe=nprobe, ef_search=ef_search, rerank=rerank)
+    return None
+
+
+def _timed_search(index, queries: np.ndarray, k: int):
+    latencies = []
+    found = []
+    for q in queries:
+        start = time.perf_counter()
+        _, ids = index.search(q.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - start)
+        found.append(ids[0])
+    return found, np.array(latencies) * 1000
+
+
+def _recall(found, truth, k: int) -> float:
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def recall_report(vectors: np.ndarray, queries: np.ndarray, k: int = 10, configs=None, index_cls=FaissVectorIndex):
+    """Misst Recall@k und Latenz je Konfiguration gegen den exakten flat-ip-Baseline.
+
+    configs: Liste von dicts mit Konstruktor-Parametern, z.B. {'index_type': 'ivf', 'nprobe': 8}.
+    Gibt eine Liste von Ergebniszeilen zurück und druckt sie als Tabelle.
+    """
+    if configs is None:
+        configs = ([{'index_type': 'flat-ip'}]
+                   + [{'index_type': 'ivf', 'nprobe': p} for p in (1, 4, 16, 64)]
+                   + [{'index_type': 'hnsw', 'ef_search': e} for e in (16, 32, 64, 128)])
+    baseline = index_cls(index_type='flat-ip')
+    baseline.build(vectors)
+    _, truth = baseline.search(queries, k)
+
+    rows = []
+    built = {}
+    print(f"{'Index':<10} {'Param':<12} {'Recall@' + str(k):>10} {'ms/Query':>9} {'p95 ms':>8} {'Build s':>8}")
+    for cfg in configs:
+        key = (cfg['index_type'], cfg.get('nlist'), cfg.get('hnsw_m'))
+        if key not in built:
+            index = index_cls(**{k2: v for k2, v in cfg.items() if k2 not in ('nprobe', 'ef_search')})
+            start = time.perf_counter()
+            index.build(vectors)
+            built[key] = (index, time.perf_counter() - start)
+        index, build_s = built[key]
+        index.apply_search_params(cfg.get('nprobe'), cfg.get('ef_search'))
+        found, lat = _timed_search(index, queries, k)
+        recall = _recall(found, truth, k)
+        param = (f"nprobe={index.nprobe}" if cfg['index_type'] == 'ivf'
+                 else f"ef={index.ef_search}" if cfg['index_type'] == 'hnsw' else '-')
+        row = {'index_type': cfg['index_type'], 'param': param, 'recall': recall,
+               'ms_mean': float(lat.mean()), 'ms_p95': float(np.percentile(lat, 95)), 'build_s': build_s}
+        rows.append(row)
+        print(f"{row['index_type']:<10} {param:<12} {recall:>10.3f} {row['ms_mean']:>9.3f} "
+              f"{row['ms_p95']:>8.3f} {build_s:>8.2f}")
+    return rows
+
+
+def quantization_report(vectors: np.ndarray, queries: np.ndarray, k: int = 10, index_type: str = 'flat-ip',
+                        reranks=(0, DEFAULT_RERANK), index_cls=FaissVectorIndex, pq_m: int = DEFAULT_PQ_M):
+    """Speicher pro Bild und Recall-Verlust je Quantisierung, mit und ohne Re-Ranking.
+
+    Referenz ist die exakte float32-Suche; Recall-Verlust = 1 - Recall@k.
+    """
+    baseline = index_cls(index_type='flat-ip')
+    baseline.build(vectors)
+    _, truth = baseline.search(queries, k)
+
+    rows = []
+    print(f"{'Quant.':<6} {'Rerank':>6} {'Byte/Bild':>10} {'Recall@' + str(k):>10} {'Verlust':>8} {'ms/Query':>9}")
+    for quantization in QUANTIZATIONS:
+        index = index_cls(index_type=index_type, quantization=quantization, pq_m=pq_m)
+        index.build(vectors)
+        if index.quantization != quantization:
+            continue  # z.B. PQ ohne FAISS oder bei zu wenigen Vektoren
+        per_image = index.memory_bytes() / max(index.ntotal, 1)
+        for rerank in (reranks if quantization != 'none' else (0,)):
+            index.apply_search_params(rerank=rerank)
+            found, lat = _timed_search(index, queries, k)
+            recall = _recall(found, truth, k)
+            row = {'quantization': quantization, 'rerank': rerank, 'bytes_per_image': per_image,
+                   'recall': recall, 'recall_loss': 1.0 - recall, 'ms_mean': float(lat.mean())}
+            rows.append(row)
+            print(f"{quantization:<6} {rerank:>6} {per_image:>10.0f} {recall:>10.3f} "
+                  f"{row['recall_loss']:>8.3f} {row['ms_mean']:>9.3f}")
+    return rows
@@ -0,0 +1,175 @@
+"""
+video_frames.py
+
+Keyframe-Sampling für Videos: pro Clip werden nur wenige Frames in niedriger Auflösung dekodiert,
+damit Videos mit CLIP durchsuchbar werden, ohne sie vollständig zu dekodieren.
+- Zeitpunkte: FRAMES_PER_MINUTE gleichmäßig verteilt (Mitte jedes Abschnitts), mindestens einer,
+  höchstens MAX_FRAMES pro Clip; die Dauer kommt aus dem mvhd-Header (media_common/video_meta.py).
+  Die Kosten wachsen so linear mit der Länge des Materials und sind pro Clip gedeckelt.
+- PyAV (bevorzugt): Seek zum Keyframe vor dem Zeitpunkt, der Decoder verwirft alle anderen
+  Frames (skip_frame=NONKEY); skaliert wird beim Konvertieren direkt auf FRAME_MIN_SIDE.
+- OpenCV als Fallback: Seek per CAP_PROP_POS_MSEC, dekodiert ab dem vorigen Keyframe.
+
+Die Embeddings landen im EmbeddingStore unter frame_key(pfad, sekunden). Für viele Frames
+gruppiert FrameLoader die Schlüssel nach Video, sodass jedes Video nur einmal geöffnet wird.
+"""
+
+import math
+import sys
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from media_common.backends import available
+from media_common.video_meta import VIDEO_SUFFIXES, VideoFormatError, read_movie_header
+
+from embedding_store import split_frame_key
+
+FRAMES_PER_MINUTE = 4
+MAX_FRAMES = 32
+# CLIP arbeitet mit 224px
+FRAME_MIN_SIDE = 224
+
+HAS_PYAV = available('av')
+HAS_OPENCV = available('cv2')
+HAS_VIDEO_DECODER = HAS_PYAV or HAS_OPENCV
+
+
+def is_video(path) -> bool:
+    return Path(path).suffix.lower() in VIDEO_SUFFIXES
+
+
+def video_duration(path) -> Optional[float]:
+    """Dauer in Sekunden aus dem mvhd-Header; None wenn unbekannt."""
+    try:
+        header = read_movie_header(path)
+    except (OSError, VideoFormatError):
+        return None
+    return header[1] if header else None
+
+
+def sample_times(duration: Optional[float], per_minute: float = FRAMES_PER_MINUTE,
+                 max_frames: int = MAX_FRAMES) -> List[float]:
+    """Zeitpunkte (Sekunden) in der Mitte gleich langer Abschnitte; ohne Dauer nur der Anfang."""
+    if not duration or duration <= 0:
+        return [0.0]
+    count = min(max(1, math.ceil(duration / 60.0 * per_minute)), max_frames)
+    return [round((i + 0.5) * duration / count, 2) for i in range(count)]
+
+
+def _scaled(width: int, height: int, min_side: int) -> Tuple[int, int]:
+    factor = min(1.0, min_side / max(1, min(width, height)))
+    return max(1, round(width * factor)), max(1, round(height * factor))
+
+
+def _frames_pyav(path, times: List[float], min_side: int) -> List[Tuple[float, Image.Image]]:
+    import av
+    frames = []
+    seen = set()
+    with av.open(str(path)) as container:
+        if not container.streams.video:
+            raise VideoFormatError(f"Keine Videospur in {path}")
+        stream = container.streams.video[0]
+        stream.codec_context.skip_frame = 'NONKEY'
+        stream.thread_type = 'AUTO'
+        for t in times:
+            container.seek(int(t * av.time_base), backward=True, any_frame=False)
+            frame = next(container.decode(stream), None)
+            # bei langen GOPs landen mehrere Zeitpunkte auf demselben Keyframe
+            if frame is None or frame.pts in seen:
+                continue
+            seen.add(frame.pts)
+            width, height = _scaled(frame.width, frame.height, min_side)
+            frames.append((t, frame.to_image(width=width, height=height)))
+    return frames
+
+
+def _frames_opencv(path, times: List[float], min_side: int) -> List[Tuple[float, Image.Image]]:
+    import cv2
+    capture = cv2.VideoCapture(str(path))
+    if not capture.isOpened():
+        raise VideoFormatError(f"OpenCV kann {path} nicht öffnen")
+    frames = []
+    try:
+        for t in times:
+            capture.set(cv2.CAP_PROP_POS_MSEC, t * 1000.0)
+            ok, bgr = capture.read()
+            if not ok:
+                continue
+            height, width = bgr.shape[:2]
+            size = _scaled(width, height, min_side)
+            if size != (width, height):
+                bgr = cv2.resize(bgr, size, interpolation=cv2.INTER_AREA)
+            frames.append((t, Image.fromarray(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))))
+    finally:
+        capture.release()
+    return frames
+
+
+def keyframes(path, times: List[float] = None, min_side: int = FRAME_MIN_SIDE) -> List[Tuple[float, Image.Image]]:
+    """Dekodiert die Frames zu den Zeitpunkten (Default: sample_times der Videodauer) verkleinert.
+
+    Rückgabe: [(sekunden, RGB-Bild)]; leer, wenn kein Decoder installiert ist.
+    """
+    if not HAS_VIDEO_DECODER:
+        return []
+    if times is None:
+        times = sample_times(video_duration(path))
+    if HAS_PYAV:
+        return _frames_pyav(path, times, min_side)
+    return _frames_opencv(path, times, min_side)
+
+
+def load_frame(key: str, size: int = FRAME_MIN_SIDE) -> Image.Image:
+    """Einzelner Frame zu einem frame_key; für viele Frames FrameLoader verwenden."""
+    path, seconds = split_frame_key(key)
+    frames = keyframes(path, [seconds or 0.0], size)
+    if not frames:
+        raise VideoFormatError(f"Kein Frame bei {seconds}s in {path}")
+    return frames[0][1]
+
+
+class FrameLoader:
+    """Loader für BatchEmbedder über viele frame_keys: alle Zeitpunkte eines Videos werden beim
+    ersten Zugriff in einem Durchgang dekodiert (ein av.open pro Video statt pro Frame).
+
+    Die Frames bleiben nur bis zu ihrer Abholung im Speicher. Zeitpunkte, die auf einen schon
+    gelieferten Keyframe fallen, ergeben None; BatchEmbedder überspringt sie.
+    """
+
+    def __init__(self, keys: List[str], size: int = FRAME_MIN_SIDE):
+        self.size = size
+        self.times = defaultdict(list)
+        for key in keys:
+            path, seconds = split_frame_key(key)
+            self.times[path].append(seconds or 0.0)
+        self.remaining = {path: len(times) for path, times in self.times.items()}
+        self.frames = {}
+        self.locks = defaultdict(threading.Lock)
+        self.lock = threading.Lock()
+
+    def __call__(self, key: str) -> Optional[Image.Image]:
+        path, seconds = split_frame_key(key)
+        seconds = seconds or 0.0
+        with self.lock:
+            video_lock = self.locks[path]
+        with video_lock:
+            try:
+                if path not in self.frames:
+                    try:
+                        self.frames[path] = dict(keyframes(path, self.times.get(path) or [seconds], self.size))
+                    except Exception as e:
+                        # Fehler einmal merken, statt das Video für jeden Frame erneut zu öffnen
+                        self.frames[path] = e
+                frames = self.frames[path]
+                if isinstance(frames, Exception):
+                    raise frames
+                return frames.pop(seconds, None)
+            finally:
+                self.remaining[path] = self.remaining.get(path, 1) - 1
+                if self.remaining[path] <= 0:
+                    self.frames.pop(path, None)